@@ -0,0 +1,168 @@
+"""
+Microbenchmark of the Tinybird API response decoding.
+
+Compares decoding a Data Sources listing and a Pipe Endpoint response
+straight from bytes into the slotted models of mcp_tinybird.tb with the
+previous path: json.loads into dicts, then regular dataclasses built field
+by field.
+
+    uv run python benchmarks/decode_models.py --datasources 500 --columns 100
+"""
+
+import argparse
+import json
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from mcp_tinybird.tb import _DATA_SOURCES, _PIPE_DATA_RESPONSE
+
+
+@dataclass
+class LegacyColumn:
+    name: str
+    type: str
+    codec: Optional[str]
+    default_value: Optional[str]
+    jsonpath: Optional[str]
+    nullable: bool
+    normalized_name: str
+
+
+@dataclass
+class LegacyEngine:
+    engine: str
+    engine_sorting_key: str
+    engine_partition_key: str
+    engine_primary_key: Optional[str]
+
+
+@dataclass
+class LegacyDataSource:
+    id: str
+    name: str
+    engine: LegacyEngine
+    columns: List[LegacyColumn]
+    indexes: List[Any]
+    new_columns_detected: Dict[str, Any]
+    quarantine_rows: int
+
+
+def legacy_datasources(content: bytes) -> List[LegacyDataSource]:
+    return [
+        LegacyDataSource(
+            id=ds["id"],
+            name=ds["name"],
+            engine=LegacyEngine(**ds["engine"]),
+            columns=[LegacyColumn(**col) for col in ds["columns"]],
+            indexes=ds["indexes"],
+            new_columns_detected=ds["new_columns_detected"],
+            quarantine_rows=ds["quarantine_rows"],
+        )
+        for ds in json.loads(content)["datasources"]
+    ]
+
+
+def legacy_pipe_data(content: bytes) -> Dict[str, Any]:
+    response = json.loads(content)
+    return {key: response[key] for key in ["meta", "data"] if key in response}
+
+
+def datasources_payload(datasources: int, columns: int) -> bytes:
+    return json.dumps(
+        {
+            "datasources": [
+                {
+                    "id": f"t_{i}",
+                    "name": f"datasource_{i}",
+                    "engine": {
+                        "engine": "MergeTree",
+                        "engine_sorting_key": "timestamp",
+                        "engine_partition_key": "toYYYYMM(timestamp)",
+                        "engine_primary_key": None,
+                    },
+                    "columns": [
+                        {
+                            "name": f"column_{j}",
+                            "type": "LowCardinality(String)",
+                            "codec": None,
+                            "default_value": None,
+                            "jsonpath": f"$.column_{j}",
+                            "nullable": False,
+                            "normalized_name": f"column_{j}",
+                        }
+                        for j in range(columns)
+                    ],
+                    "indexes": [],
+                    "new_columns_detected": {},
+                    "quarantine_rows": 0,
+                }
+                for i in range(datasources)
+            ]
+        }
+    ).encode()
+
+
+def pipe_data_payload(rows: int) -> bytes:
+    return json.dumps(
+        {
+            "meta": [
+                {"name": "timestamp", "type": "DateTime"},
+                {"name": "event", "type": "String"},
+                {"name": "count", "type": "UInt64"},
+            ],
+            "data": [
+                {"timestamp": "2024-01-01 00:00:00", "event": f"e{i}", "count": i}
+                for i in range(rows)
+            ],
+            "rows": rows,
+            "statistics": {"elapsed": 0.01, "rows_read": rows, "bytes_read": rows},
+        }
+    ).encode()
+
+
+def measure(name: str, func, content: bytes, number: int):
+    seconds = min(timeit.repeat(lambda: func(content), number=number, repeat=5))
+    tracemalloc.start()
+    result = func(content)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(
+        f"{name:<28} {seconds / number * 1000:9.2f} ms/op"
+        f" {retained / 1024 / 1024:9.2f} MiB retained"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--datasources", type=int, default=200)
+    parser.add_argument("--columns", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--number", type=int, default=10)
+    args = parser.parse_args()
+
+    content = datasources_payload(args.datasources, args.columns)
+    print(
+        f"Data Sources listing: {args.datasources} x {args.columns} columns,"
+        f" {len(content) / 1024:.0f} KiB"
+    )
+    measure("json.loads + dataclasses", legacy_datasources, content, args.number)
+    measure(
+        "msgspec + slots",
+        lambda c: _DATA_SOURCES.decode(c).datasources,
+        content,
+        args.number,
+    )
+
+    content = pipe_data_payload(args.rows)
+    print(f"Pipe Endpoint response: {args.rows} rows, {len(content) / 1024:.0f} KiB")
+    measure("json.loads", legacy_pipe_data, content, args.number)
+    measure(
+        "msgspec + slots", _PIPE_DATA_RESPONSE.decode, content, args.number
+    )
+
+
+if __name__ == "__main__":
+    main()
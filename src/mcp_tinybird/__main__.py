@@ -1,6 +1,7 @@
 import sys
 from .run_sse import main as run_sse
 from .run_stdio import main as run_stdio
+from .run_streamable_http import main as run_streamable_http
 
 def main():
     # If no arguments provided, default to stdio mode
@@ -11,11 +12,13 @@ def main():
     mode = sys.argv[1]
     if mode == "sse":
         run_sse()
+    elif mode == "streamable-http":
+        run_streamable_http()
     elif mode == "stdio":
         run_stdio()
     else:
         print(f"Unknown mode: {mode}")
-        print("Available modes: sse, stdio (default)")
+        print("Available modes: sse, streamable-http, stdio (default)")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,553 @@
+import re
+from dataclasses import dataclass, field
+from itertools import permutations
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .profile import base_type, column_kind, quote_identifier
+from .query_log import QueryStats, fingerprint
+
+GRANULE_ROWS = 8192
+MAX_SORTING_KEY_FILTERS = 3
+MIN_SORTING_KEY_REDUCTION = 0.1
+BLOOM_FILTER_MIN_CARDINALITY = 1000
+MIN_MATERIALIZED_CALLS = 3
+MIN_AGGREGATION_RATIO = 100
+
+_TEMPLATE_EXPR_RE = re.compile(r"\{\{.*?\}\}", re.DOTALL)
+_TEMPLATE_TAG_RE = re.compile(r"\{%.*?%\}", re.DOTALL)
+_TOKEN_RE = re.compile(
+    r"\b(PREWHERE|WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|UNION|SETTINGS|"
+    r"FORMAT|SELECT|FROM|JOIN|WITH)\b|[()]",
+    re.IGNORECASE,
+)
+_CONNECTIVE_RE = re.compile(r"\b(?:AND|OR)\b", re.IGNORECASE)
+_IDENTIFIER_RE = re.compile(r"`((?:[^`\\]|\\.)+)`|\b([A-Za-z_]\w*)\b")
+_NEGATED_RE = re.compile(r"!=|<>|\bNOT\s+(?:IN|LIKE|ILIKE)\b", re.IGNORECASE)
+_LIKE_RE = re.compile(r"\b(?:I?LIKE|match|position\w*|multiSearch\w*)\b", re.I)
+_TOKEN_SEARCH_RE = re.compile(r"\bhasToken\w*\b", re.IGNORECASE)
+_EQUALITY_RE = re.compile(r"(?<![<>!=])=|\bIN\b|\bhas\(", re.IGNORECASE)
+_RANGE_RE = re.compile(r"[<>]|\bBETWEEN\b", re.IGNORECASE)
+
+
+@dataclass
+class AccessPattern:
+    """How one recorded query fingerprint or Pipe Endpoint uses a Data Source."""
+
+    source: str
+    calls: int
+    bytes_read: int
+    rows_read: int
+    result_rows: int
+    filters: Dict[str, Set[str]] = field(default_factory=dict)
+    group_by: List[str] = field(default_factory=list)
+
+    @property
+    def weight(self) -> int:
+        return self.bytes_read or self.calls
+
+
+def strip_templates(sql: str) -> str:
+    """Turn the templating of a Pipe node into plain SQL, values become `?`."""
+    sql = _TEMPLATE_EXPR_RE.sub("?", sql)
+    return _TEMPLATE_TAG_RE.sub(" ", sql)
+
+
+def reads_from(sql: str, datasource_name: str) -> bool:
+    name = re.escape(datasource_name)
+    return re.search(rf"\b(?:FROM|JOIN)\s+`?{name}`?(?!\w)", sql, re.I) is not None
+
+
+def _clauses(sql: str) -> Tuple[List[str], List[str]]:
+    """The WHERE/PREWHERE and GROUP BY clauses of a query and its subqueries."""
+    where: List[str] = []
+    group_by: List[str] = []
+    # One (clause, start) per parenthesis depth
+    stack: List[Tuple[Optional[str], int]] = [(None, 0)]
+
+    def close(end: int):
+        clause, start = stack[-1]
+        if clause in ("WHERE", "PREWHERE"):
+            where.append(sql[start:end])
+        elif clause == "GROUP BY":
+            group_by.append(sql[start:end])
+
+    for match in _TOKEN_RE.finditer(sql):
+        token = match.group(0)
+        if token == "(":
+            stack.append((None, match.end()))
+        elif token == ")":
+            if len(stack) > 1:
+                close(match.start())
+                stack.pop()
+        else:
+            close(match.start())
+            stack[-1] = (re.sub(r"\s+", " ", token.upper()), match.end())
+    while stack:
+        close(len(sql))
+        stack.pop()
+    return where, group_by
+
+
+def _split_top_level(text: str, separator: re.Pattern) -> List[str]:
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0:
+            match = separator.match(text, i)
+            if match:
+                parts.append(text[start:i])
+                start = match.end()
+    parts.append(text[start:])
+    return parts
+
+
+def _predicates(clause: str) -> List[str]:
+    """The predicates of a clause, looking into parenthesized groups of them."""
+    predicates = []
+    for predicate in _split_top_level(clause, _CONNECTIVE_RE):
+        inner = predicate.strip()
+        if inner.startswith("(") and _closing_paren(inner) == len(inner) - 1:
+            predicates += _predicates(inner[1:-1])
+        else:
+            predicates.append(predicate)
+    return predicates
+
+
+def _closing_paren(text: str) -> int:
+    depth = 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _columns_in(text: str, columns: Set[str]) -> List[str]:
+    found: List[str] = []
+    for match in _IDENTIFIER_RE.finditer(text):
+        name = match.group(1) or match.group(2)
+        if name in columns and name not in found:
+            found.append(name)
+    return found
+
+
+def _predicate_kind(predicate: str) -> str:
+    if _NEGATED_RE.search(predicate):
+        return "other"
+    if _TOKEN_SEARCH_RE.search(predicate):
+        return "token"
+    if _LIKE_RE.search(predicate):
+        return "like"
+    if _EQUALITY_RE.search(predicate):
+        return "equality"
+    if _RANGE_RE.search(predicate):
+        return "range"
+    return "other"
+
+
+def analyze_sql(
+    sql: str, columns: Set[str]
+) -> Tuple[Dict[str, Set[str]], List[str]]:
+    """
+    The columns of a Data Source a query filters on, with the kind of each
+    filter (equality, range, like, token or other), and the ones it groups by.
+    """
+    filters: Dict[str, Set[str]] = {}
+    group_by: List[str] = []
+    where, groups = _clauses(sql)
+    for clause in where:
+        for predicate in _predicates(clause):
+            kind = _predicate_kind(predicate)
+            for column in _columns_in(predicate, columns):
+                filters.setdefault(column, set()).add(kind)
+    for clause in groups:
+        for column in _columns_in(clause, columns):
+            if column not in group_by:
+                group_by.append(column)
+    return filters, group_by
+
+
+def access_pattern(
+    source: str, sql: str, stats: QueryStats, columns: Set[str]
+) -> AccessPattern:
+    filters, group_by = analyze_sql(fingerprint(sql), columns)
+    return AccessPattern(
+        source=source,
+        calls=stats.calls,
+        bytes_read=stats.bytes_read,
+        rows_read=stats.rows_read,
+        result_rows=stats.result_rows,
+        filters=filters,
+        group_by=group_by,
+    )
+
+
+def sorting_key_columns(sorting_key: str, columns: Set[str]) -> List[str]:
+    """The column behind each expression of a sorting key, e.g. `toDate(ts)`."""
+    key_columns = []
+    for expression in _split_top_level(sorting_key or "", re.compile(",")):
+        found = _columns_in(expression, columns)
+        if found and found[0] not in key_columns:
+            key_columns.append(found[0])
+    return key_columns
+
+
+def cardinality_query(datasource_name: str, columns: List[str]) -> str:
+    """Count the rows of a Data Source and the distinct values of `columns`."""
+    exprs = ["count() AS __rows"] + [
+        f"uniq({quote_identifier(column)}) AS c{i}"
+        for i, column in enumerate(columns)
+    ]
+    return f"SELECT {', '.join(exprs)} FROM {datasource_name}"
+
+
+def candidate_columns(patterns: List[AccessPattern]) -> List[str]:
+    """The columns whose cardinality the advice depends on."""
+    columns: List[str] = []
+    for pattern in patterns:
+        for column, kinds in pattern.filters.items():
+            if "equality" in kinds and column not in columns:
+                columns.append(column)
+    return columns
+
+
+def _read_fraction(
+    pattern: AccessPattern,
+    key_columns: List[str],
+    cardinality: Dict[str, int],
+    floor: float,
+) -> float:
+    """
+    The share of the Data Source the primary index lets `pattern` read,
+    assuming uniformly distributed values. Only the equality filters on a
+    prefix of the sorting key prune, range filters are conservatively ignored.
+    """
+    fraction = 1.0
+    for column in key_columns:
+        if "equality" not in pattern.filters.get(column, ()):
+            break
+        fraction /= max(1, cardinality.get(column, 1))
+    return max(fraction, floor)
+
+
+def _estimate(
+    patterns: List[AccessPattern],
+    current: List[str],
+    proposed: List[str],
+    cardinality: Dict[str, int],
+    floor: float,
+) -> int:
+    """The bytes read the recorded traffic would save with `proposed`."""
+    saved = 0.0
+    for pattern in patterns:
+        before = _read_fraction(pattern, current, cardinality, floor)
+        after = _read_fraction(pattern, proposed, cardinality, floor)
+        saved += pattern.bytes_read * (1 - after / before)
+    return int(saved)
+
+
+def _suggest_sorting_key(
+    patterns: List[AccessPattern],
+    current: List[str],
+    current_expressions: List[str],
+    column_types: Dict[str, str],
+    cardinality: Dict[str, int],
+    floor: float,
+    total: int,
+) -> Optional[Dict[str, Any]]:
+    weights: Dict[str, int] = {}
+    range_weights: Dict[str, int] = {}
+    for pattern in patterns:
+        for column, kinds in pattern.filters.items():
+            if "equality" in kinds:
+                weights[column] = weights.get(column, 0) + pattern.weight
+            if "range" in kinds and column_kind(column_types[column]) in (
+                "temporal",
+                "numeric",
+            ):
+                range_weights[column] = range_weights.get(column, 0) + pattern.weight
+    if not weights:
+        return None
+
+    top = sorted(weights, key=lambda c: (-weights[c], cardinality.get(c, 0)))
+    top = top[: MAX_SORTING_KEY_FILTERS + 1]
+    best: Optional[Tuple[Tuple[int, int], List[str]]] = None
+    for size in range(1, min(MAX_SORTING_KEY_FILTERS, len(top)) + 1):
+        for candidate in permutations(top, size):
+            saved = _estimate(patterns, current, list(candidate), cardinality, floor)
+            # On ties, lower cardinality first compresses better
+            rank = (saved, -cardinality.get(candidate[0], 0))
+            if best is None or rank > best[0]:
+                best = (rank, list(candidate))
+    if best is None or best[0][0] < MIN_SORTING_KEY_REDUCTION * total:
+        return None
+
+    (best_saved, _), prefix = best
+    expressions, key_columns = list(prefix), list(prefix)
+    if range_weights:
+        time_column = max(range_weights, key=range_weights.get)
+        if time_column not in key_columns:
+            expressions.append(time_column)
+            key_columns.append(time_column)
+    # Keep the rest of the current key so other access patterns still prune
+    for expression in current_expressions:
+        found = _columns_in(expression, set(column_types))
+        if not found or found[0] not in key_columns:
+            expressions.append(expression)
+            key_columns += found[:1]
+    return {
+        "type": "sorting_key",
+        "current": ", ".join(current_expressions),
+        "suggested": ", ".join(expressions),
+        "reason": (
+            f"Recorded queries filter by equality on {', '.join(prefix)}, "
+            "which isn't a prefix of the current sorting key, so the primary "
+            "index can't skip granules for them"
+        ),
+        "estimated_bytes_read_reduction": best_saved,
+        "estimated_reduction_ratio": round(best_saved / total, 3) if total else None,
+        "_prefix": prefix,
+        "_columns": key_columns,
+    }
+
+
+def _suggest_skip_indexes(
+    patterns: List[AccessPattern],
+    key_prefix: List[str],
+    key_columns: List[str],
+    column_types: Dict[str, str],
+    cardinality: Dict[str, int],
+    indexes: List[Any],
+    floor: float,
+) -> List[Dict[str, Any]]:
+    indexed = " ".join(str(index) for index in indexes)
+    suggestions: Dict[str, Dict[str, Any]] = {}
+    for pattern in patterns:
+        for column, kinds in pattern.filters.items():
+            if column in key_prefix or re.search(rf"\b{re.escape(column)}\b", indexed):
+                continue
+            kind = column_kind(column_types[column])
+            is_string = base_type(column_types[column]).startswith("String")
+            if "token" in kinds and is_string:
+                index_type = "tokenbf_v1(10240, 3, 0)"
+            elif "like" in kinds and is_string:
+                index_type = "ngrambf_v1(3, 10240, 3, 0)"
+            elif (
+                "equality" in kinds
+                and cardinality.get(column, 0) >= BLOOM_FILTER_MIN_CARDINALITY
+            ):
+                index_type = "bloom_filter(0.01)"
+            elif (
+                "range" in kinds
+                and kind in ("numeric", "temporal")
+                and column not in key_columns
+            ):
+                index_type = "minmax"
+            else:
+                continue
+            suggestion = suggestions.setdefault(
+                column,
+                {
+                    "type": "skip_index",
+                    "column": column,
+                    "index": f"idx_{column} {quote_identifier(column)} "
+                    f"TYPE {index_type} GRANULARITY 4",
+                    "estimated_bytes_read_reduction": None,
+                    "sources": 0,
+                },
+            )
+            suggestion["sources"] += 1
+            if index_type.startswith("bloom_filter"):
+                selectivity = max(1 / max(1, cardinality[column]), floor)
+                suggestion["estimated_bytes_read_reduction"] = int(
+                    (suggestion["estimated_bytes_read_reduction"] or 0)
+                    + pattern.bytes_read * (1 - selectivity)
+                )
+    for suggestion in suggestions.values():
+        if "bloom_filter" in suggestion["index"]:
+            suggestion["reason"] = (
+                "Equality filter outside the sorting key. The estimate is an "
+                "upper bound, the index only skips the granules where no value "
+                "matches, so it helps when matching values are clustered"
+            )
+        elif "minmax" in suggestion["index"]:
+            suggestion["reason"] = (
+                "Range filter outside the sorting key, skips granules when the "
+                "column correlates with the sorting key. No estimate available"
+            )
+        else:
+            suggestion["reason"] = (
+                "Text search outside the sorting key, skips the granules that "
+                "don't contain the searched tokens. No estimate available"
+            )
+    return sorted(
+        suggestions.values(),
+        key=lambda s: -(s["estimated_bytes_read_reduction"] or 0),
+    )
+
+
+def _suggest_materialized_pipes(
+    datasource_name: str,
+    patterns: List[AccessPattern],
+    column_types: Dict[str, str],
+) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[str, ...], List[AccessPattern]] = {}
+    for pattern in patterns:
+        if pattern.group_by:
+            dimensions = list(pattern.group_by)
+            dimensions += [c for c in pattern.filters if c not in dimensions]
+            groups.setdefault(tuple(dimensions), []).append(pattern)
+
+    suggestions = []
+    for dimensions, members in groups.items():
+        calls = sum(p.calls for p in members)
+        rows_read = sum(p.rows_read for p in members)
+        result_rows = sum(p.result_rows for p in members)
+        bytes_read = sum(p.bytes_read for p in members)
+        if calls < MIN_MATERIALIZED_CALLS or not rows_read:
+            continue
+        if rows_read < MIN_AGGREGATION_RATIO * max(1, result_rows):
+            continue
+        columns = ", ".join(dimensions)
+        target = f"{datasource_name}_by_{'_'.join(dimensions)}_mv"
+        pipe = "\n".join(
+            [
+                "NODE materialization",
+                "SQL >",
+                f"    SELECT {columns}, countState() AS count",
+                f"    FROM {datasource_name}",
+                f"    GROUP BY {columns}",
+                "",
+                "TYPE materialized",
+                f"DATASOURCE {target}",
+            ]
+        )
+        schema = [
+            f"    {quote_identifier(column)} {column_types[column]}"
+            for column in dimensions
+        ] + ["    `count` AggregateFunction(count)"]
+        datasource = "\n".join(
+            [
+                "SCHEMA >",
+                ",\n".join(schema),
+                "",
+                'ENGINE "AggregatingMergeTree"',
+                f'ENGINE_SORTING_KEY "{columns}"',
+            ]
+        )
+        suggestions.append(
+            {
+                "type": "materialized_pipe",
+                "dimensions": list(dimensions),
+                "calls": calls,
+                "aggregation_ratio": round(rows_read / max(1, result_rows)),
+                "pipe": pipe,
+                "target_datasource": target,
+                "datasource": datasource,
+                "reason": (
+                    "Repeated aggregations read far more rows than they "
+                    "return. Add the -State of the aggregates they compute "
+                    "and bucket raw time columns (e.g. toStartOfHour) so the "
+                    "pre-aggregated Data Source stays small"
+                ),
+                "estimated_bytes_read_reduction": int(
+                    bytes_read * (1 - result_rows / rows_read)
+                ),
+                "sources": [p.source for p in members],
+            }
+        )
+    return sorted(suggestions, key=lambda s: -s["estimated_bytes_read_reduction"])
+
+
+def advise(
+    datasource: Dict[str, Any],
+    patterns: List[AccessPattern],
+    cardinality: Dict[str, int],
+    rows: int,
+) -> Dict[str, Any]:
+    """
+    Suggest storage changes for a Data Source (a `v0/datasources/{name}`
+    response) from the access patterns recorded for it.
+
+    Estimates use the bytes read by the recorded traffic and the cardinality
+    of the filtered columns, assuming uniformly distributed values.
+    """
+    name = datasource["name"]
+    engine = datasource.get("engine") or {}
+    column_types = {c["name"]: c["type"] for c in datasource.get("columns", [])}
+    columns = set(column_types)
+    sorting_key = engine.get("engine_sorting_key") or ""
+    current_expressions = [
+        e.strip() for e in _split_top_level(sorting_key, re.compile(",")) if e.strip()
+    ]
+    current = sorting_key_columns(sorting_key, columns)
+    floor = min(1.0, GRANULE_ROWS / rows) if rows else 1.0
+    total = sum(p.bytes_read for p in patterns)
+
+    filters: Dict[str, Dict[str, Any]] = {}
+    group_by: Dict[str, int] = {}
+    for pattern in patterns:
+        for column, kinds in pattern.filters.items():
+            entry = filters.setdefault(
+                column, {"column": column, "kinds": set(), "calls": 0, "bytes_read": 0}
+            )
+            entry["kinds"] |= kinds
+            entry["calls"] += pattern.calls
+            entry["bytes_read"] += pattern.bytes_read
+        for column in pattern.group_by:
+            group_by[column] = group_by.get(column, 0) + pattern.calls
+
+    suggestions: List[Dict[str, Any]] = []
+    key_prefix, key_columns = current, current
+    if "MergeTree" in (engine.get("engine") or ""):
+        sorting = _suggest_sorting_key(
+            patterns,
+            current,
+            current_expressions,
+            column_types,
+            cardinality,
+            floor,
+            total,
+        )
+        if sorting is not None:
+            key_prefix = sorting.pop("_prefix")
+            key_columns = sorting.pop("_columns")
+            suggestions.append(sorting)
+        suggestions += _suggest_skip_indexes(
+            patterns,
+            key_prefix,
+            key_columns,
+            column_types,
+            cardinality,
+            datasource.get("indexes") or [],
+            floor,
+        )
+    suggestions += _suggest_materialized_pipes(name, patterns, column_types)
+
+    return {
+        "datasource": name,
+        "engine": engine.get("engine"),
+        "sorting_key": sorting_key,
+        "partition_key": engine.get("engine_partition_key"),
+        "rows": rows,
+        "observed": {
+            "sources": len(patterns),
+            "calls": sum(p.calls for p in patterns),
+            "bytes_read": total,
+            "filters": sorted(
+                (
+                    {**entry, "kinds": sorted(entry["kinds"])}
+                    for entry in filters.values()
+                ),
+                key=lambda e: -e["bytes_read"],
+            ),
+            "group_by": group_by,
+        },
+        "suggestions": suggestions,
+    }
@@ -0,0 +1,226 @@
+import dataclasses
+import math
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Rough average for JSON-like text, good enough to budget model context
+APPROX_BYTES_PER_TOKEN = 4
+DEFAULT_MAX_OUTPUT_TOKENS = 25000
+# Room left for the metadata describing what was elided
+METADATA_RESERVE = 1024
+
+
+def _size(obj: Any) -> int:
+    return len(str(obj).encode())
+
+
+def _plain(obj: Any) -> Any:
+    """Turn dataclasses into dicts, recursively, so they can be reshaped."""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: _plain(getattr(obj, f.name)) for f in dataclasses.fields(obj)}
+    if isinstance(obj, dict):
+        return {key: _plain(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_plain(item) for item in obj]
+    return obj
+
+
+def _map_dicts(obj: Any, func: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Any:
+    if isinstance(obj, dict):
+        return func({key: _map_dicts(value, func) for key, value in obj.items()})
+    if isinstance(obj, list):
+        return [_map_dicts(item, func) for item in obj]
+    return obj
+
+
+def _drop_node_sql(obj: Any) -> Tuple[Any, Optional[Dict[str, str]]]:
+    count = 0
+
+    def drop(item: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal count
+        nodes = item.get("nodes")
+        if isinstance(nodes, list) and any(
+            isinstance(node, dict) and "sql" in node for node in nodes
+        ):
+            count += len(nodes)
+            return {
+                **item,
+                "nodes": [
+                    node.get("name") if isinstance(node, dict) else node
+                    for node in nodes
+                ],
+            }
+        return item
+
+    obj = _map_dicts(obj, drop)
+    if not count:
+        return obj, None
+    return obj, {
+        "elided": f"SQL of {count} nodes, only their names are kept",
+        "fetch": "Read the tinybird://pipes/{name} resource for the SQL of a Pipe",
+    }
+
+
+def _collapse_columns(obj: Any) -> Tuple[Any, Optional[Dict[str, str]]]:
+    count = 0
+
+    def collapse(item: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal count
+        columns = item.get("columns")
+        if isinstance(columns, list) and any(
+            isinstance(column, dict) for column in columns
+        ):
+            count += 1
+            return {
+                **item,
+                "columns": [
+                    column.get("name") if isinstance(column, dict) else column
+                    for column in columns
+                ],
+            }
+        return item
+
+    obj = _map_dicts(obj, collapse)
+    if not count:
+        return obj, None
+    return obj, {
+        "elided": f"column details of {count} objects, only their names are kept",
+        "fetch": "Call get-data-source for the column types of a Data Source",
+    }
+
+
+def _truncate_rows(
+    obj: Any, limit: int
+) -> Tuple[Any, Optional[Dict[str, str]]]:
+    """Keep the first rows of the largest list, `data` for query results."""
+    if isinstance(obj, list):
+        rows, rebuild = obj, lambda kept: kept
+    elif isinstance(obj, dict):
+        lists = [key for key, value in obj.items() if isinstance(value, list)]
+        if not lists:
+            return obj, None
+        key = "data" if "data" in lists else max(lists, key=lambda k: _size(obj[k]))
+        rows, rebuild = obj[key], lambda kept: {**obj, key: kept}
+    else:
+        return obj, None
+
+    available = limit - _size(rebuild([]))
+    kept = 0
+    for row in rows:
+        # Each row also takes a ", " separator
+        available -= _size(row) + 2
+        if available < 0:
+            break
+        kept += 1
+    if kept == len(rows):
+        return obj, None
+    return rebuild(rows[:kept]), {
+        "elided": f"{len(rows) - kept} of {len(rows)} rows, the first {kept} are kept",
+        "fetch": "Narrow the query with filters, aggregations or LIMIT/OFFSET, "
+        "use downsample for time series or raise max_output_tokens",
+    }
+
+
+@dataclass
+class OutputBudget:
+    """
+    The maximum size of a tool result, in bytes and approximate tokens.
+    Whichever is lower applies, None means unbounded.
+    """
+
+    max_bytes: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    @property
+    def limit(self) -> Optional[int]:
+        """The budget in bytes."""
+        limits = [
+            limit
+            for limit in (
+                self.max_bytes,
+                self.max_tokens * APPROX_BYTES_PER_TOKEN
+                if self.max_tokens is not None
+                else None,
+            )
+            if limit is not None
+        ]
+        return min(limits) if limits else None
+
+    def for_call(
+        self, max_bytes: Optional[int] = None, max_tokens: Optional[int] = None
+    ) -> "OutputBudget":
+        """The budget of one tool call, which can't exceed the server budget."""
+        budget = OutputBudget(
+            max_bytes=max_bytes if max_bytes is not None else self.max_bytes,
+            max_tokens=max_tokens if max_tokens is not None else self.max_tokens,
+        )
+        if self.limit is not None and (
+            budget.limit is None or budget.limit > self.limit
+        ):
+            return OutputBudget(max_bytes=self.limit)
+        return budget
+
+    def shape(
+        self, response: Any, offset: int = 0
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Render a tool response within the budget.
+
+        Over budget responses fall back to summaries, in order: node SQL is
+        replaced by node names, column lists by column names and rows are
+        truncated. Text that still doesn't fit is cut, and can be paged with
+        `offset`, in characters of the summarized text: every page is cut
+        from the same summarized text, given the same budget.
+
+        Returns the text and, when something was elided, metadata that says
+        what and how to fetch it.
+        """
+        text = str(response)
+        limit = self.limit
+        if limit is None:
+            return text[offset:], None
+        original_bytes = len(text.encode())
+        if original_bytes <= limit and not offset:
+            return text, None
+
+        elided: List[Dict[str, str]] = []
+        if original_bytes > limit:
+            target = max(limit - METADATA_RESERVE, limit // 2)
+            shaped = _plain(response)
+            for step in (_drop_node_sql, _collapse_columns):
+                shaped, summary = step(shaped)
+                if summary is not None:
+                    elided.append(summary)
+                if _size(shaped) <= target:
+                    break
+            else:
+                shaped, summary = _truncate_rows(shaped, target)
+                if summary is not None:
+                    elided.append(summary)
+            text = str(shaped)
+        text = text[offset:]
+
+        metadata: Dict[str, Any] = {
+            "truncated": True,
+            "budget_bytes": limit,
+            "budget_tokens": limit // APPROX_BYTES_PER_TOKEN,
+            "original_bytes": original_bytes,
+            "original_tokens": math.ceil(original_bytes / APPROX_BYTES_PER_TOKEN),
+        }
+        encoded = text.encode()
+        if len(encoded) > limit or offset:
+            page = encoded[:limit].decode(errors="ignore")
+            if len(page) < len(text):
+                next_offset = offset + len(page)
+                elided.append(
+                    {
+                        "elided": f"text after character {next_offset}",
+                        "fetch": "Call the tool again with "
+                        f"output_offset={next_offset}",
+                    }
+                )
+            text = page
+        if not elided:
+            return text, None
+        metadata["elided"] = elided
+        return text, metadata
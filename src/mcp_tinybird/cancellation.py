@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Optional, Set
+
+import anyio
+import mcp.types as types
+
+logger = logging.getLogger(__name__)
+
+CANCELLED_METHOD = "notifications/cancelled"
+READ_AHEAD = 32
+
+
+class InFlightRequests:
+    """The tool calls of one MCP session that can still be cancelled."""
+
+    def __init__(self):
+        self.tasks: Dict[types.RequestId, asyncio.Task] = {}
+        self.cancelled: Set[types.RequestId] = set()
+
+    async def run(
+        self,
+        request_id: types.RequestId,
+        coro: Awaitable[Any],
+        name: Optional[str] = None,
+    ) -> Any:
+        """
+        Run `coro` in its own task, named `name`, so a cancellation
+        notification for `request_id` cancels it, including the HTTP request
+        it is awaiting.
+        """
+        task = asyncio.ensure_future(coro)
+        if name is not None:
+            task.set_name(name)
+        self.tasks[request_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if request_id in self.cancelled:
+                raise ValueError("Request cancelled by the client")
+            raise
+        finally:
+            self.tasks.pop(request_id, None)
+            self.cancelled.discard(request_id)
+
+    def cancel(self, request_id: types.RequestId, reason: Optional[str] = None):
+        task = self.tasks.get(request_id)
+        if task is not None:
+            logger.info(f"Cancelling request {request_id}: {reason}")
+            self.cancelled.add(request_id)
+            task.cancel()
+
+
+# The in-flight requests of the session whose messages are being handled
+in_flight_requests: ContextVar[Optional[InFlightRequests]] = ContextVar(
+    "in_flight_requests", default=None
+)
+
+
+@asynccontextmanager
+async def cancellable(read_stream):
+    """
+    Wrap the read stream of a transport to handle `notifications/cancelled`.
+
+    mcp 1.0 neither parses cancellation notifications nor reads new messages
+    while a request is being handled, so they are intercepted here, before
+    the server session, and applied to the in-flight request they refer to.
+    Must be entered in the task that runs `Server.run`.
+    """
+    requests = InFlightRequests()
+    token = in_flight_requests.set(requests)
+    # Read ahead a few messages so cancellations aren't stuck behind the
+    # messages queued while the server handles a request
+    writer, reader = anyio.create_memory_object_stream(READ_AHEAD)
+
+    async def relay():
+        async with writer:
+            async for message in read_stream:
+                if (
+                    isinstance(message, types.JSONRPCMessage)
+                    and isinstance(message.root, types.JSONRPCNotification)
+                    and message.root.method == CANCELLED_METHOD
+                ):
+                    params = message.root.params or {}
+                    requests.cancel(params.get("requestId"), params.get("reason"))
+                    continue
+                await writer.send(message)
+
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(relay)
+            yield reader
+            tg.cancel_scope.cancel()
+    finally:
+        in_flight_requests.reset(token)
@@ -0,0 +1,275 @@
+import asyncio
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+REDACTED = "REDACTED"
+# Query parameters holding credentials, and the ones that change on every
+# request so they can't be part of the key a response is replayed by
+SECRET_PARAMS = {"token"}
+VOLATILE_PARAMS = {"query_id"}
+# Response headers not worth keeping: bodies are stored decoded
+DROPPED_HEADERS = {
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+    "keep-alive",
+    "set-cookie",
+    "date",
+}
+
+
+def _redact_url(url: httpx.URL) -> str:
+    parts = urlsplit(str(url))
+    params = [
+        (key, REDACTED if key in SECRET_PARAMS else value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in VOLATILE_PARAMS
+    ]
+    return urlunsplit(parts._replace(query=urlencode(sorted(params))))
+
+
+def _body_digest(request: httpx.Request) -> Optional[str]:
+    """A digest of the request body, blind to the random multipart boundary."""
+    body = request.content
+    if not body:
+        return None
+    content_type = request.headers.get("content-type", "")
+    if "boundary=" in content_type:
+        boundary = content_type.split("boundary=", 1)[1].encode()
+        body = body.replace(boundary, b"BOUNDARY")
+    return hashlib.sha1(body).hexdigest()
+
+
+def _key(method: str, url: str, digest: Optional[str]) -> str:
+    return f"{method} {url} {digest or ''}"
+
+
+class Cassette:
+    """
+    Upstream HTTP interactions of a session, in a gzipped NDJSON file.
+
+    In "record" mode every request goes upstream and is appended with its
+    response, its start time and how long it took. Tokens are redacted from
+    URLs and bodies. In "replay" mode nothing goes to the network: requests
+    are answered from the cassette after their recorded latency divided by
+    `speed`, 0 replays without waiting. Requests repeated with the same
+    method, URL and body are answered in recorded order.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Invalid cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._secrets: set[str] = set()
+        self._interactions: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._by_url: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._started = time.monotonic()
+        self._file = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if mode == "record":
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            # Writes and compression happen in order, off the event loop
+            self._writer = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="cassette"
+            )
+            self._write({"version": CASSETTE_VERSION, "recorded_at": time.time()})
+            atexit.register(self.close)
+        else:
+            self._load()
+
+    @classmethod
+    def from_config(
+        cls,
+        path: Optional[str],
+        mode: Optional[str] = None,
+        speed: Optional[str] = None,
+        worker: Optional[int] = None,
+    ) -> Optional["Cassette"]:
+        """
+        Build it from the TB_CASSETTE* environment variables. Each `worker`
+        process records to a file of its own, suffixed with its index, and
+        replays it, or the unsuffixed file when there's none.
+        """
+        if not path:
+            return None
+        mode = mode or "replay"
+        if worker is not None:
+            root, ext = os.path.splitext(path)
+            worker_path = f"{root}-{worker}{ext}"
+            if mode == "record" or os.path.exists(worker_path):
+                path = worker_path
+        return cls(path, mode, float(speed) if speed else 1.0)
+
+    def transport(self, secrets: Iterable[str] = ()) -> httpx.AsyncBaseTransport:
+        """A transport for one client, whose `secrets` are redacted."""
+        self._secrets.update(secret for secret in secrets if secret)
+        if self.mode == "record":
+            return _RecordingTransport(self)
+        return _ReplayingTransport(self)
+
+    def _load(self):
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    interaction = json.loads(line)
+                    if "method" not in interaction:
+                        continue
+                    method, url = interaction["method"], interaction["url"]
+                    self._interactions[
+                        _key(method, url, interaction.get("body_sha1"))
+                    ].append(interaction)
+                    self._by_url[_key(method, url, None)].append(interaction)
+                    count += 1
+            except EOFError:
+                # Recorded by a process that didn't exit cleanly
+                logger.warning(f"Cassette {self.path} is truncated")
+        logger.info(f"Loaded {count} interactions from cassette {self.path}")
+
+    def _redact(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    def _write(self, record: Dict[str, Any], content: Optional[bytes] = None):
+        def write():
+            if content is not None:
+                try:
+                    record["body"] = self._redact(content.decode("utf-8"))
+                except UnicodeDecodeError:
+                    record["body_b64"] = base64.b64encode(content).decode()
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+        self._writer.submit(write)
+
+    def record(
+        self,
+        request: httpx.Request,
+        response: httpx.Response,
+        started: float,
+        elapsed: float,
+    ):
+        record = {"method": request.method, "url": _redact_url(request.url)}
+        digest = _body_digest(request)
+        if digest is not None:
+            record["body_sha1"] = digest
+        self._write(
+            {
+                **record,
+                "at": round(started - self._started, 4),
+                "elapsed": round(elapsed, 4),
+                "status": response.status_code,
+                "headers": {
+                    key: self._redact(value)
+                    for key, value in response.headers.items()
+                    if key not in DROPPED_HEADERS
+                },
+            },
+            response.content,
+        )
+
+    def match(self, request: httpx.Request) -> Optional[Dict[str, Any]]:
+        """
+        The next recorded interaction for `request`. The last one is reused
+        when a request is repeated more times than it was recorded, and the
+        body is ignored when no recorded request had the same one.
+        """
+        url = _redact_url(request.url)
+        for candidates in (
+            self._interactions.get(_key(request.method, url, _body_digest(request))),
+            self._by_url.get(_key(request.method, url, None)),
+        ):
+            if candidates:
+                return candidates.popleft() if len(candidates) > 1 else candidates[0]
+        return None
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+            self._file.close()
+
+
+class _RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        started = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        # Decode the body once so it's stored, and handed on, uncompressed
+        decoded = httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=response.stream,
+            request=request,
+        )
+        try:
+            await decoded.aread()
+        finally:
+            await response.aclose()
+        elapsed = time.monotonic() - started
+        result = httpx.Response(
+            response.status_code,
+            headers=[
+                (key, value)
+                for key, value in response.headers.multi_items()
+                if key.lower() not in ("content-encoding", "content-length")
+            ],
+            content=decoded.content,
+            request=request,
+            extensions=response.extensions,
+        )
+        self.cassette.record(request, result, started, elapsed)
+        return result
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class _ReplayingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        interaction = self.cassette.match(request)
+        if interaction is None:
+            url = _redact_url(request.url)
+            message = f"No recorded response for {request.method} {url}"
+            logger.warning(message)
+            raise httpx.ConnectError(message, request=request)
+        if self.cassette.speed > 0:
+            await asyncio.sleep(interaction["elapsed"] / self.cassette.speed)
+        if "body_b64" in interaction:
+            content = base64.b64decode(interaction["body_b64"])
+        else:
+            content = interaction["body"].encode("utf-8")
+        return httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            content=content,
+            request=request,
+        )
+
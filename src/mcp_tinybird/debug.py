@@ -0,0 +1,48 @@
+import hmac
+from typing import Optional
+
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from .offload import loop_monitor
+
+
+def debug_routes(workspaces, token: Optional[str]):
+    """
+    Introspection routes for the network servers. They expose query text,
+    so they're only served when `token` (MCP_DEBUG_TOKEN) is set, to requests
+    sending it as a bearer token.
+    """
+    if not token:
+        return []
+
+    def authorized(request) -> bool:
+        return hmac.compare_digest(
+            request.headers.get("authorization", ""), f"Bearer {token}"
+        )
+
+    async def debug_queries(request):
+        if not authorized(request):
+            return Response("Unauthorized", status_code=401)
+        try:
+            stats = workspaces.query_stats(
+                limit=int(request.query_params.get("limit", 10)),
+                order_by=request.query_params.get("order_by", "total_time"),
+            )
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return JSONResponse(stats)
+
+    async def debug_loop(request):
+        if not authorized(request):
+            return Response("Unauthorized", status_code=401)
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return JSONResponse(loop_monitor.report(limit))
+
+    return [
+        Route("/debug/queries", endpoint=debug_queries),
+        Route("/debug/loop", endpoint=debug_loop),
+    ]
@@ -0,0 +1,118 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .profile import column_kind, quote_identifier
+
+
+_TABLES_RE = re.compile(r"\b(?:FROM|JOIN)\s+`?([A-Za-z_][\w.]*)`?", re.I)
+
+
+def source_tables(sql: str) -> List[str]:
+    """The names after FROM and JOIN, the Data Sources a query may read."""
+    tables: List[str] = []
+    for name in _TABLES_RE.findall(sql):
+        if name not in tables:
+            tables.append(name)
+    return tables
+
+
+def series_columns(
+    meta: List[Dict[str, str]], preferred: Optional[List[str]] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Pick a temporal column as x, the first of `preferred` in the result or
+    else the first one, and the first numeric column as y.
+    """
+    temporal = [c["name"] for c in meta if column_kind(c["type"]) == "temporal"]
+    time_column = next(
+        (name for name in preferred or [] if name in temporal),
+        temporal[0] if temporal else None,
+    )
+    value_column = next(
+        (c["name"] for c in meta if column_kind(c["type"]) == "numeric"), None
+    )
+    return time_column, value_column
+
+
+def _to_number(value: Any) -> float:
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def lttb(
+    rows: List[Dict[str, Any]], x_key: Optional[str], y_key: str, threshold: int
+) -> List[Dict[str, Any]]:
+    """
+    Largest-Triangle-Three-Buckets downsampling of `rows` to `threshold` rows.
+
+    Rows are kept whole, so every column of the selected points survives. When
+    `x_key` is None the row index is used as x.
+    """
+    n = len(rows)
+    if threshold >= n or threshold < 3:
+        return rows[:threshold] if threshold < 3 else rows
+
+    try:
+        xs = [_to_number(r[x_key]) if x_key else float(i) for i, r in enumerate(rows)]
+    except ValueError:
+        xs = [float(i) for i in range(n)]
+    ys = [_to_number(r.get(y_key)) for r in rows]
+
+    sampled = [rows[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_len = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / avg_len
+        avg_y = sum(ys[avg_start:avg_end]) / avg_len
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = xs[a], ys[a]
+        max_area = -1.0
+        next_a = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                next_a = j
+        sampled.append(rows[next_a])
+        a = next_a
+    sampled.append(rows[-1])
+    return sampled
+
+
+def build_minmax_query(
+    query: str, time_column: str, value_column: str, points: int
+) -> str:
+    """
+    Keep only the rows holding the min and max `value_column` of each of
+    `points / 2` time buckets, so at most `points` rows leave Tinybird, or
+    every row when there are no more than `points`. The bucket width comes
+    from window functions over the result, so `query` runs once.
+    """
+    t = quote_identifier(time_column)
+    v = quote_identifier(value_column)
+    buckets = max(1, points // 2)
+    width = (
+        f"greatest(1, toUInt64(ceil((max(__x) OVER () - min(__x) OVER () + 1) "
+        f"/ {buckets})))"
+    )
+    return (
+        f"SELECT * EXCEPT (__x, __bucket, __rows, __lo, __hi) FROM ("
+        f"SELECT *, "
+        f"row_number() OVER (PARTITION BY __bucket ORDER BY {v} ASC) AS __lo, "
+        f"row_number() OVER (PARTITION BY __bucket ORDER BY {v} DESC) AS __hi "
+        f"FROM ("
+        f"SELECT *, intDiv(__x - min(__x) OVER (), {width}) AS __bucket, "
+        f"count() OVER () AS __rows "
+        f"FROM (SELECT *, toUnixTimestamp(toDateTime({t})) AS __x FROM ({query}))"
+        f")) WHERE __rows <= {points} OR __lo = 1 OR __hi = 1 ORDER BY {t}"
+    )
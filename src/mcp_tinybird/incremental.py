@@ -0,0 +1,132 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .profile import quote_identifier
+
+
+@dataclass
+class IncrementalEntry:
+    response: Dict[str, Any]
+    time_column: str
+    buckets: int
+    ascending: bool
+    fetched_at: float
+
+
+_STRINGS_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_LIMIT_RE = re.compile(r"\bLIMIT\b", re.I)
+_ORDER_BY_RE = re.compile(
+    r"\bORDER\s+BY\s+(.*?)\s*(?:\b(?:ASC|DESC)\b\s*)?"
+    r"(?=\bSETTINGS\b|\bFORMAT\b|$)",
+    re.I | re.S,
+)
+
+
+def _top_level(query: str) -> str:
+    """`query` without its string literals and its parenthesized parts."""
+    query = _STRINGS_RE.sub("''", query)
+    depth = 0
+    chars = []
+    for char in query:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            chars.append(char)
+    return "".join(chars)
+
+
+def unsupported_clause(query: str, time_column: str) -> Optional[str]:
+    """
+    Why `query` can't be run incrementally, None when it can. A LIMIT would
+    apply before the time filter of the tail query, and merged results are
+    only sorted by the time column.
+    """
+    top = _top_level(query)
+    if _LIMIT_RE.search(top):
+        return "it has a LIMIT"
+    match = _ORDER_BY_RE.search(top)
+    if match and match.group(1).strip("`; ") != time_column:
+        return f"it's not ordered by {time_column} only"
+    return None
+
+
+def build_tail_query(
+    query: str, time_column: str, since: Any, type_name: Optional[str] = None
+) -> str:
+    """
+    Restrict `query` to the time buckets from `since` on. ClickHouse pushes
+    the predicate down into the query, so only those buckets are scanned.
+    `since` is cast to the `type_name` of the column so it's compared as a
+    date and not as a string.
+    """
+    column = quote_identifier(time_column)
+    if isinstance(since, (int, float)):
+        return f"SELECT * FROM ({query}) WHERE {column} >= {since!r}"
+    literal = str(since).replace("\\", "\\\\").replace("'", "\\'")
+    value = f"CAST('{literal}' AS {type_name})" if type_name else f"'{literal}'"
+    return f"SELECT * FROM ({query}) WHERE {column} >= {value}"
+
+
+def merge_rows(
+    entry: IncrementalEntry, since: str, new_rows: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Replace the buckets from `since` on with `new_rows`, keeping as many
+    buckets as the full result had, so a sliding time window doesn't grow.
+    """
+    column = entry.time_column
+    rows = [r for r in entry.response.get("data", []) if r[column] < since]
+    rows += new_rows
+    buckets = sorted({r[column] for r in rows})
+    if len(buckets) > entry.buckets:
+        cutoff = buckets[-entry.buckets]
+        rows = [r for r in rows if r[column] >= cutoff]
+    rows.sort(key=lambda r: r[column], reverse=not entry.ascending)
+    return rows
+
+
+class IncrementalCache:
+    """
+    The last result of the queries run incrementally, bounded to
+    `max_entries` queries. Entries older than `full_refresh_interval` seconds
+    are recomputed from scratch to pick up late arriving data.
+    """
+
+    def __init__(
+        self, max_entries: int = 64, full_refresh_interval: float = 3600.0
+    ):
+        self.max_entries = max_entries
+        self.full_refresh_interval = full_refresh_interval
+        self.entries: "OrderedDict[str, IncrementalEntry]" = OrderedDict()
+
+    def get(self, query: str) -> Optional[IncrementalEntry]:
+        entry = self.entries.get(query)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.fetched_at > self.full_refresh_interval:
+            del self.entries[query]
+            return None
+        self.entries.move_to_end(query)
+        return entry
+
+    def put(self, query: str, response: Dict[str, Any], time_column: str):
+        rows = response.get("data", [])
+        self.entries[query] = IncrementalEntry(
+            response=response,
+            time_column=time_column,
+            buckets=len({r[time_column] for r in rows}),
+            ascending=not rows or rows[0][time_column] <= rows[-1][time_column],
+            fetched_at=time.monotonic(),
+        )
+        self.entries.move_to_end(query)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def update(self, query: str, response: Dict[str, Any]):
+        """Replace the cached result of a query keeping its full refresh time."""
+        self.entries[query].response = response
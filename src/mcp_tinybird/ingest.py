@@ -0,0 +1,187 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+DEFAULT_PARALLEL_UPLOADS = 4
+DEFAULT_PROGRESS_DIR = os.path.join(tempfile.gettempdir(), "mcp-tinybird-append")
+FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".parquet": "parquet",
+}
+
+
+@dataclass
+class Chunk:
+    """
+    A slice of the file, ending at a record boundary. `start` and `end` are
+    byte offsets, or row group indexes for Parquet. `data` is None for chunks
+    already appended by a previous attempt.
+    """
+
+    start: int
+    end: int
+    data: Optional[bytes] = None
+
+
+def detect_format(path: str, format: Optional[str] = None) -> str:
+    if format:
+        if format not in FORMATS.values():
+            raise ValueError(f"Unsupported format: {format}")
+        return format
+    suffix = Path(path).suffix.lower()
+    if suffix not in FORMATS:
+        raise ValueError(
+            f"Can't tell the format of {path}, pass format as one of "
+            f"{', '.join(sorted(set(FORMATS.values())))}"
+        )
+    return FORMATS[suffix]
+
+
+def _read_record(file: BinaryIO, data: bytes, csv: bool) -> bytes:
+    """
+    Extend `data` to the end of its last record. CSV records end at a newline
+    outside quotes, and quotes are escaped by doubling them, so a newline
+    ends a record when the count of quotes before it is even.
+    """
+    quotes = data.count(b'"') if csv else 0
+    while data and not (data.endswith(b"\n") and quotes % 2 == 0):
+        line = file.readline()
+        if not line:
+            break
+        data += line
+        if csv:
+            quotes += line.count(b'"')
+    return data
+
+
+def iter_text_chunks(
+    path: str, format: str, chunk_size: int, completed: Dict[int, int]
+) -> Iterator[Chunk]:
+    """
+    Read a CSV or NDJSON file in chunks of about `chunk_size` bytes, without
+    loading it. CSV chunks start with the header, so Tinybird maps every
+    chunk's columns by name. Chunks in `completed`, by start offset, are
+    skipped without reading them.
+    """
+    csv = format == "csv"
+    with open(path, "rb") as file:
+        header = _read_record(file, file.readline(), csv) if csv else b""
+        start = file.tell()
+        while True:
+            if start in completed:
+                end = completed[start]
+                file.seek(end)
+                yield Chunk(start, end)
+                start = end
+                continue
+            data = _read_record(file, file.read(chunk_size), csv)
+            if not data:
+                return
+            end = start + len(data)
+            yield Chunk(start, end, header + data)
+            start = end
+
+
+def iter_parquet_chunks(
+    path: str, chunk_size: int, completed: Dict[int, int]
+) -> Iterator[Chunk]:
+    """
+    Group the row groups of a Parquet file in chunks of about `chunk_size`
+    uncompressed bytes, each written as a Parquet file of its own.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ValueError("Appending Parquet files needs pyarrow installed") from e
+
+    parquet = pq.ParquetFile(path)
+    groups = parquet.metadata.num_row_groups
+    start = 0
+    while start < groups:
+        if start in completed:
+            yield Chunk(start, completed[start])
+            start = completed[start]
+            continue
+        end, size = start, 0
+        while end < groups and (end == start or size < chunk_size):
+            size += parquet.metadata.row_group(end).total_byte_size
+            end += 1
+        buffer = io.BytesIO()
+        pq.write_table(parquet.read_row_groups(list(range(start, end))), buffer)
+        yield Chunk(start, end, buffer.getvalue())
+        start = end
+
+
+def iter_chunks(
+    path: str, format: str, chunk_size: int, completed: Dict[int, int]
+) -> Iterator[Chunk]:
+    if format == "parquet":
+        return iter_parquet_chunks(path, chunk_size, completed)
+    return iter_text_chunks(path, format, chunk_size, completed)
+
+
+@dataclass
+class AppendProgress:
+    """
+    The chunks of a file already appended to a Data Source, saved after each
+    one so a failed append resumes where it stopped. It's discarded when the
+    file, the format or the chunk size change.
+    """
+
+    path: str
+    key: Dict[str, Any]
+    completed: Dict[int, int] = field(default_factory=dict)
+
+    @classmethod
+    def load(
+        cls,
+        file_path: str,
+        datasource_name: str,
+        format: str,
+        chunk_size: int,
+        progress_dir: str = DEFAULT_PROGRESS_DIR,
+    ) -> "AppendProgress":
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = {
+            "file": file_path,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "datasource": datasource_name,
+            "format": format,
+            "chunk_size": chunk_size,
+        }
+        digest = hashlib.sha1(f"{file_path}\0{datasource_name}".encode()).hexdigest()
+        progress = cls(os.path.join(progress_dir, f"{digest}.json"), key)
+        try:
+            with open(progress.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return progress
+        if saved.get("key") == key:
+            progress.completed = {
+                int(start): end for start, end in saved["completed"].items()
+            }
+        return progress
+
+    def complete(self, chunk: Chunk):
+        self.completed[chunk.start] = chunk.end
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"key": self.key, "completed": self.completed}, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import weakref
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INSIGHTS_DIR = os.path.join(tempfile.gettempdir(), "mcp-tinybird-insights")
+# Insights kept in the memo of a session, the oldest ones are dropped
+MAX_INSIGHTS = 200
+DEFAULT_NOTIFY_DELAY = 1.0
+
+MEMO_HEADER = "📊 Analysis Memo 📊\n\nKey Insights Discovered:\n\n"
+EMPTY_MEMO = "No insights have been discovered yet."
+
+_WORDS_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an the of in on at by for from to with and or is are was were be been".split()
+)
+
+
+def normalize(text: str) -> str:
+    """
+    The words of `text`, lowercased and without punctuation or stopwords.
+    Insights that are equal once normalized are duplicates, e.g. "driven by
+    EU" and "driven by the EU", while any other change, like a different
+    number, makes a different insight.
+    """
+    return " ".join(
+        word for word in _WORDS_RE.findall(text.lower()) if word not in _STOPWORDS
+    )
+
+
+class InsightsStore:
+    """
+    The insights of a session, in an append-only NDJSON log at `path` that is
+    replayed when the store is opened, so a restarted server can pick up the
+    session memo.
+
+    The memo keeps the latest `max_insights`, and only the normalized text
+    of those is kept to detect duplicates. Once the log holds twice as many
+    lines it's rewritten with the ones in the memo, so it's bounded too. The
+    memo is extended on each change instead of rendered again, and the log
+    is written in a thread, one insight at a time.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_insights: int = MAX_INSIGHTS):
+        self.path = path
+        self.max_insights = max_insights
+        self.dropped = 0
+        self._insights: Deque[Tuple[str, str, float]] = deque()
+        self._keys: Set[str] = set()
+        # The "- insight" lines of the memo
+        self._listing = ""
+        self._memo: Optional[str] = None
+        self._lines = 0
+        self._writing = asyncio.Lock()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def from_config(
+        cls, directory: Optional[str], session: str
+    ) -> "InsightsStore":
+        """Build it from the TB_INSIGHTS_DIR and TB_INSIGHTS_SESSION variables."""
+        directory = directory or DEFAULT_INSIGHTS_DIR
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", session)
+        return cls(os.path.join(directory, f"{name}.ndjson"))
+
+    def __len__(self) -> int:
+        return len(self._insights)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                    if "dropped" in record:
+                        self.dropped += record["dropped"]
+                    else:
+                        self._add(record["insight"], record.get("at", 0))
+                except (ValueError, KeyError, TypeError):
+                    # A line cut short by a crash
+                    continue
+        if self._lines > 2 * self.max_insights:
+            self._compact()
+        logger.info(f"Loaded {len(self)} insights from {self.path}")
+
+    def _compact(self):
+        """Rewrite the log with the insights in the memo."""
+        lines = [json.dumps({"dropped": self.dropped})] if self.dropped else []
+        lines += [
+            json.dumps({"insight": insight, "at": at})
+            for _, insight, at in self._insights
+        ]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+        os.replace(tmp, self.path)
+        self._lines = len(lines)
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+        self._lines += 1
+        if self._lines > 2 * self.max_insights:
+            self._compact()
+
+    def is_duplicate(self, insight: str) -> bool:
+        return normalize(insight) in self._keys
+
+    def _add(self, insight: str, at: float) -> bool:
+        key = normalize(insight)
+        if key in self._keys:
+            return False
+        self._insights.append((key, insight, at))
+        self._keys.add(key)
+        entry = f"- {insight}"
+        self._listing = f"{self._listing}\n{entry}" if self._listing else entry
+        if len(self._insights) > self.max_insights:
+            dropped, dropped_insight, _ = self._insights.popleft()
+            self._keys.discard(dropped)
+            self._listing = self._listing[len(f"- {dropped_insight}\n") :]
+            self.dropped += 1
+        self._memo = None
+        return True
+
+    async def add(self, insight: str) -> bool:
+        """Add an insight, unless it's a duplicate of one in the memo."""
+        insight = insight.strip()
+        if not insight:
+            return False
+        # The log is written in order, and not changed while it's compacted
+        async with self._writing:
+            at = time.time()
+            if not self._add(insight, at):
+                return False
+            if self.path is not None:
+                line = json.dumps({"insight": insight, "at": at}) + "\n"
+                await asyncio.to_thread(self._append, line)
+        return True
+
+    @property
+    def memo(self) -> str:
+        if self._memo is None:
+            if not self._insights:
+                self._memo = EMPTY_MEMO
+            else:
+                self._memo = MEMO_HEADER + self._listing
+                total = len(self._insights) + self.dropped
+                if total > 1:
+                    self._memo += (
+                        "\nSummary:\n"
+                        f"Analysis has revealed {total} key insights."
+                    )
+                if self.dropped:
+                    self._memo += f" The oldest {self.dropped} are not listed."
+        return self._memo
+
+
+class SessionInsights:
+    """
+    An InsightsStore per MCP session, released with the session.
+
+    With a `name`, set with TB_INSIGHTS_SESSION, the first session of the
+    process keeps its memo in the file `name`, so a restarted stdio server
+    resumes it. Other sessions, like the ones served over the network, can't
+    be resumed and keep their memo in memory only.
+    """
+
+    def __init__(self, directory: Optional[str], name: Optional[str]):
+        self.directory = directory
+        self.name = name
+        self._stores: "weakref.WeakKeyDictionary[Any, InsightsStore]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._opened = 0
+
+    def get(self, session: Any) -> InsightsStore:
+        store = self._stores.get(session)
+        if store is None:
+            if self.name is not None and not self._opened:
+                store = InsightsStore.from_config(self.directory, self.name)
+            else:
+                store = InsightsStore()
+            self._stores[session] = store
+            self._opened += 1
+        return store
+
+
+class Debouncer:
+    """
+    Call `callback` once, `delay` seconds after the first of a burst of
+    triggers, so a burst of changes sends a single notification.
+    """
+
+    def __init__(self, callback: Callable[[], Awaitable[None]], delay: float):
+        self.callback = callback
+        self.delay = delay
+        self._pending = False
+        self._task: Optional[asyncio.Task] = None
+
+    def trigger(self):
+        self._pending = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._call_later())
+
+    async def _call_later(self):
+        # Triggers that arrive while the callback runs get a call of their own
+        while self._pending:
+            await asyncio.sleep(self.delay)
+            self._pending = False
+            try:
+                await self.callback()
+            except Exception as e:
+                logger.error(f"Error in debounced callback: {e}")
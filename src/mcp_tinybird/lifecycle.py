@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    Readiness and in-flight tool calls of the server process, so it can be
+    taken out of rotation and drained before it exits.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def track(self):
+        """Count a tool call as in flight while the block runs."""
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stop reporting ready and wait up to `timeout` seconds for the tool
+        calls in flight, e.g. pending ingestion, to finish.
+
+        Returns whether everything finished in time.
+        """
+        self.ready = False
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.in_flight:
+            logger.warning(f"Drain timed out with {self.in_flight} tool calls running")
+            return False
+        logger.info("Drained all tool calls")
+        return True
+
+
+# The state of the process, shared by the handlers and the runners
+lifecycle = Lifecycle()
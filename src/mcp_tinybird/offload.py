@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OFFLOAD_THRESHOLD = 1024 * 1024
+TOOL_TASK_PREFIX = "tool:"
+# Items sampled to estimate the rendered size of a list
+_SIZE_SAMPLE = 100
+
+
+def approx_size(obj: Any) -> int:
+    """A cheap estimate of the bytes `str(obj)` renders, sampling long lists."""
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(len(str(key)) + approx_size(value) for key, value in obj.items())
+    if isinstance(obj, list):
+        if len(obj) <= _SIZE_SAMPLE:
+            return sum(approx_size(item) for item in obj)
+        sample = obj[:: len(obj) // _SIZE_SAMPLE][:_SIZE_SAMPLE]
+        return sum(approx_size(item) for item in sample) * len(obj) // len(sample)
+    if hasattr(obj, "__dataclass_fields__"):
+        return sum(
+            approx_size(getattr(obj, name)) for name in obj.__dataclass_fields__
+        )
+    return 8
+
+
+class Offloader:
+    """
+    Run CPU heavy stages (decoding, rendering, compression) off the event
+    loop when their input is over `threshold` bytes, so one large result
+    doesn't stall every other session.
+
+    `kind` is "thread", "process" or None to always run inline. Functions and
+    arguments sent to a process pool must be picklable.
+    """
+
+    def __init__(
+        self,
+        kind: Optional[str] = "thread",
+        max_workers: Optional[int] = None,
+        threshold: int = DEFAULT_OFFLOAD_THRESHOLD,
+    ):
+        if kind not in ("thread", "process", None):
+            raise ValueError(f"Invalid offload executor: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.threshold = threshold
+        self._executor: Optional[Executor] = None
+
+    @classmethod
+    def from_config(
+        cls,
+        kind: Optional[str] = None,
+        max_workers: Optional[str] = None,
+        threshold: Optional[str] = None,
+    ) -> "Offloader":
+        """Build it from the TB_OFFLOAD_* environment variables."""
+        return cls(
+            kind=None if kind == "none" else kind or "thread",
+            max_workers=int(max_workers) if max_workers else None,
+            threshold=int(threshold) if threshold else DEFAULT_OFFLOAD_THRESHOLD,
+        )
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="offload"
+                )
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any, size: int) -> Any:
+        """Run `func(*args)`, in the pool when `size` is over the threshold."""
+        if self.kind is None or size < self.threshold:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args)
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class LoopLagMonitor:
+    """
+    Detect event loop stalls longer than `threshold` seconds.
+
+    A coroutine on the loop beats every `interval` seconds and a watchdog
+    thread checks the beats, so a stall is reported while it happens, with
+    the tool holding the loop and the line it's running. The watchdog only
+    reads the stack of the loop thread, tool calls are found in it by the
+    frame of the coroutine registered with `tool`.
+    """
+
+    def __init__(
+        self, interval: float = 0.05, threshold: float = 0.25, history: int = 100
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        # Tool names by the id of the frame of their coroutine
+        self._tools: Dict[int, str] = {}
+
+    def start(self):
+        """Start monitoring the running loop. A no-op when already running."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._heartbeat())
+        threading.Thread(
+            target=self._watch, name="loop-lag-monitor", daemon=True
+        ).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @contextmanager
+    def tool(self, coro: Coroutine[Any, Any, Any], name: str):
+        """Attribute the stalls while `coro` runs, in this block, to `name`."""
+        key = id(coro.cr_frame)
+        self._tools[key] = name
+        try:
+            yield coro
+        finally:
+            self._tools.pop(key, None)
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _culprit(self) -> Dict[str, Optional[str]]:
+        """The tool and code holding the loop, seen from the watchdog thread."""
+        frame = sys._current_frames().get(self._loop_thread)
+        location = None
+        if frame is not None:
+            last = traceback.extract_stack(frame, limit=1)[-1]
+            location = f"{last.filename}:{last.lineno} in {last.name}"
+        tool = None
+        while frame is not None and tool is None:
+            tool = self._tools.get(id(frame))
+            frame = frame.f_back
+        return {"tool": tool, "location": location}
+
+    def _watch(self):
+        stalled_since: Optional[float] = None
+        culprit: Dict[str, Optional[str]] = {}
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            lag = time.monotonic() - beat - self.interval
+            if lag > self.threshold:
+                if stalled_since is None:
+                    stalled_since = beat
+                    culprit = self._culprit()
+            elif stalled_since is not None:
+                self._record(beat - stalled_since - self.interval, culprit)
+                stalled_since = None
+
+    def _record(self, duration: float, culprit: Dict[str, Optional[str]]):
+        tool = culprit.get("tool") or "-"
+        stall = {"duration": round(duration, 3), "at": time.time(), **culprit}
+        self.stalls.append(stall)
+        totals = self.totals.setdefault(tool, {"stalls": 0, "total_time": 0.0})
+        totals["stalls"] += 1
+        totals["total_time"] = round(totals["total_time"] + duration, 3)
+        logger.warning(
+            f"Event loop stalled for {duration:.3f}s, tool: {tool}, "
+            f"at {culprit.get('location')}"
+        )
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        stalls: List[Dict[str, Any]] = (
+            list(self.stalls)[-limit:] if limit > 0 else []
+        )
+        return {"threshold": self.threshold, "by_tool": self.totals, "stalls": stalls}
+
+
+# Shared by the server handlers and the debug routes of the process
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,224 @@
+import ast
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+_TEMPLATE_RE = re.compile(r"\{\{(.*?)\}\}|\{%(.*?)%\}", re.DOTALL)
+
+_INT_TYPES = {
+    f"{prefix}Int{bits}"
+    for prefix in ("", "U")
+    for bits in (8, 16, 32, 64, 128, 256)
+} | {"Int", "Integer"}
+_FLOAT_TYPES = {"Float32", "Float64"}
+_TYPES = (
+    _INT_TYPES
+    | _FLOAT_TYPES
+    | {"String", "Boolean", "Date", "DateTime", "DateTime64", "Array"}
+    | {"column", "columns", "symbol"}
+)
+_CALL_RE = re.compile(
+    r"\b(" + "|".join(sorted(_TYPES, key=len, reverse=True)) + r")\("
+)
+_DEFINED_RE = re.compile(r"\bdefined\(\s*([A-Za-z_]\w*)\s*\)")
+_DATETIME_RE = re.compile(
+    r"(?P<base>\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?)"
+    r"(?:\.(?P<fraction>\d+))?"
+    r"\s*(?P<tz>Z|[+-]\d{2}(?::?\d{2})?)?",
+    re.I,
+)
+
+
+@dataclass
+class PipeParam:
+    name: str
+    type: str
+    default: Any = None
+    required: bool = False
+    description: Optional[str] = None
+    item_type: Optional[str] = None
+
+
+def _call_source(text: str, start: int) -> str:
+    """The source of the call whose `(` is at `start`, up to its `)`."""
+    depth, quote = 0, None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote and text[i - 1] != "\\":
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return text[: i + 1]
+    return text
+
+
+def _literal(node: ast.AST) -> Any:
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return ast.unparse(node)
+
+
+def _parse_call(type_name: str, source: str) -> Optional[PipeParam]:
+    try:
+        call = ast.parse(source, mode="eval").body
+    except SyntaxError:
+        return None
+    if not isinstance(call, ast.Call) or not call.args:
+        return None
+    if not isinstance(call.args[0], ast.Name):
+        return None
+
+    param = PipeParam(name=call.args[0].id, type=type_name)
+    positional = [_literal(arg) for arg in call.args[1:]]
+    if type_name == "Array" and positional:
+        param.item_type = positional.pop(0)
+    if positional:
+        param.default = positional[0]
+    for keyword in call.keywords:
+        if keyword.arg == "default":
+            param.default = _literal(keyword.value)
+        elif keyword.arg == "required":
+            param.required = bool(_literal(keyword.value))
+        elif keyword.arg == "description":
+            param.description = _literal(keyword.value)
+    return param
+
+
+def parse_pipe_params(nodes: List[Dict[str, Any]]) -> Dict[str, PipeParam]:
+    """
+    Extract the typed parameters of a Pipe from the `{{ Type(name, default) }}`
+    templating of its nodes SQL.
+
+    Parameters only checked with `defined(name)` are reported with type "Any".
+    When a parameter appears several times, the most detailed usage wins.
+    """
+    params: Dict[str, PipeParam] = {}
+    for node in nodes:
+        for match in _TEMPLATE_RE.finditer(node.get("sql") or ""):
+            block = match.group(1) or match.group(2) or ""
+            for call in _CALL_RE.finditer(block):
+                text = block[call.start() :]
+                source = _call_source(text, call.end() - call.start() - 1)
+                param = _parse_call(call.group(1), source)
+                if param is None:
+                    continue
+                previous = params.get(param.name)
+                if previous is None or previous.type == "Any":
+                    params[param.name] = param
+                else:
+                    if previous.default is None:
+                        previous.default = param.default
+                    previous.required = previous.required or param.required
+                    previous.description = previous.description or param.description
+            for name in _DEFINED_RE.findall(block):
+                params.setdefault(name, PipeParam(name=name, type="Any"))
+    return params
+
+
+def _parse_datetime(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp with any number of fractional digits and a
+    `Z` or `+HHMM` offset. datetime.fromisoformat only takes those from
+    Python 3.11, so the timestamp is rewritten to the form 3.10 accepts.
+    """
+    match = _DATETIME_RE.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f"expected an ISO 8601 timestamp, got {value!r}")
+    text = match.group("base")
+    if match.group("fraction"):
+        # Microseconds are the most datetime holds
+        text += "." + match.group("fraction")[:6].ljust(6, "0")
+    tz = match.group("tz")
+    if tz and tz.upper() == "Z":
+        text += "+00:00"
+    elif tz:
+        digits = tz[1:].replace(":", "")
+        text += f"{tz[0]}{digits[:2]}:{digits[2:] or '00'}"
+    return datetime.fromisoformat(text)
+
+
+def _coerce(type_name: str, value: Any, item_type: Optional[str] = None) -> Any:
+    if type_name in _INT_TYPES:
+        if isinstance(value, bool) or (
+            isinstance(value, float) and not value.is_integer()
+        ):
+            raise ValueError(f"expected an integer, got {value!r}")
+        number = int(value)
+        if type_name.startswith("U") and number < 0:
+            raise ValueError(f"expected a non negative integer, got {value!r}")
+        return number
+    if type_name in _FLOAT_TYPES:
+        return float(value)
+    if type_name == "Boolean":
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ("true", "1"):
+            return True
+        if str(value).lower() in ("false", "0"):
+            return False
+        raise ValueError(f"expected a boolean, got {value!r}")
+    if type_name == "Date":
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    if type_name in ("DateTime", "DateTime64"):
+        parsed = _parse_datetime(str(value))
+        if parsed.tzinfo is not None:
+            # Endpoints take naive UTC timestamps
+            parsed = parsed.astimezone(timezone.utc)
+        if type_name == "DateTime":
+            return parsed.strftime("%Y-%m-%d %H:%M:%S")
+        return parsed.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if type_name == "Array":
+        items = value if isinstance(value, list) else str(value).split(",")
+        if item_type:
+            items = [_coerce(item_type, item) for item in items]
+        return ",".join(str(item) for item in items)
+    return value
+
+
+def coerce_pipe_params(
+    schema: Dict[str, PipeParam], params: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Validate `params` against the Pipe parameters and coerce them to the
+    values the endpoint expects. Unknown parameters are passed through, the
+    schema can't prove they are unused.
+
+    Raises a ValueError listing every invalid or missing parameter.
+    """
+    errors = []
+    coerced = {}
+    for name, value in params.items():
+        param = schema.get(name)
+        if param is None or value is None:
+            coerced[name] = value
+            continue
+        try:
+            coerced[name] = _coerce(param.type, value, param.item_type)
+        except (TypeError, ValueError) as e:
+            errors.append(f"{name} ({param.type}): {e}")
+    for param in schema.values():
+        if param.required and param.name not in params:
+            errors.append(f"{param.name} ({param.type}): required")
+    if errors:
+        raise ValueError("Invalid Pipe parameters: " + "; ".join(errors))
+    return coerced
+
+
+def describe_pipe_params(schema: Dict[str, PipeParam]) -> List[Dict[str, Any]]:
+    """A compact description of the Pipe parameters, omitting empty fields."""
+    return [
+        {
+            key: value
+            for key, value in vars(param).items()
+            if value is not None and value is not False
+        }
+        for param in schema.values()
+    ]
@@ -0,0 +1,88 @@
+import re
+from typing import Any, Dict, List
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+_WRAPPER_RE = re.compile(r"^(?:Nullable|LowCardinality)\((.*)\)$")
+_NUMERIC_PREFIXES = ("Int", "UInt", "Float", "Decimal")
+_TEMPORAL_PREFIXES = ("Date", "DateTime")
+_COMPLEX_PREFIXES = ("Array", "Map", "Tuple", "JSON", "Object", "AggregateFunction")
+
+
+def base_type(column_type: str) -> str:
+    """Strip Nullable/LowCardinality wrappers from a ClickHouse type."""
+    match = _WRAPPER_RE.match(column_type)
+    while match:
+        column_type = match.group(1)
+        match = _WRAPPER_RE.match(column_type)
+    return column_type
+
+
+def column_kind(column_type: str) -> str:
+    t = base_type(column_type)
+    if t.startswith(_NUMERIC_PREFIXES):
+        return "numeric"
+    if t.startswith(_TEMPORAL_PREFIXES):
+        return "temporal"
+    if t.startswith(_COMPLEX_PREFIXES):
+        return "complex"
+    return "categorical"
+
+
+def quote_identifier(name: str) -> str:
+    return "`" + name.replace("\\", "\\\\").replace("`", "\\`") + "`"
+
+
+def build_profile_query(
+    query: str, columns: List[Dict[str, str]], top_k: int = 5
+) -> str:
+    """
+    Build a single aggregate SELECT that profiles every column of `query`.
+
+    `columns` is the `meta` block of a Tinybird JSON response, a list of
+    `{"name": ..., "type": ...}` dicts. Aggregates are aliased by column
+    position so arbitrary column names don't need to survive as aliases.
+    """
+    exprs = ["count() AS __rows"]
+    quantiles = ", ".join(str(q) for q in QUANTILES)
+    for i, column in enumerate(columns):
+        col = quote_identifier(column["name"])
+        kind = column_kind(column["type"])
+        exprs.append(f"countIf(isNull({col})) AS c{i}_nulls")
+        exprs.append(f"uniq({col}) AS c{i}_uniq")
+        if kind in ("numeric", "temporal"):
+            exprs.append(f"min({col}) AS c{i}_min")
+            exprs.append(f"max({col}) AS c{i}_max")
+        if kind == "numeric":
+            exprs.append(f"avg({col}) AS c{i}_avg")
+            exprs.append(f"quantiles({quantiles})({col}) AS c{i}_quantiles")
+        elif kind == "categorical":
+            exprs.append(f"topK({top_k})({col}) AS c{i}_top")
+    return f"SELECT {', '.join(exprs)} FROM ({query})"
+
+
+def summarize_profile(
+    columns: List[Dict[str, str]], row: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Turn the single row returned by `build_profile_query` into a summary."""
+    rows = int(row.get("__rows") or 0)
+    summary: Dict[str, Any] = {"rows": rows, "columns": {}}
+    for i, column in enumerate(columns):
+        nulls = int(row.get(f"c{i}_nulls") or 0)
+        stats: Dict[str, Any] = {
+            "type": column["type"],
+            "null_ratio": round(nulls / rows, 4) if rows else 0.0,
+            "distinct_estimate": row.get(f"c{i}_uniq"),
+        }
+        for key in ("min", "max", "avg"):
+            if f"c{i}_{key}" in row:
+                stats[key] = row[f"c{i}_{key}"]
+        if f"c{i}_quantiles" in row:
+            stats["quantiles"] = {
+                f"p{int(q * 100)}": value
+                for q, value in zip(QUANTILES, row[f"c{i}_quantiles"] or [])
+            }
+        if f"c{i}_top" in row:
+            stats["top_k"] = row[f"c{i}_top"]
+        summary["columns"][column["name"]] = stats
+    return summary
@@ -0,0 +1,107 @@
+import re
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+_COMMENTS_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRINGS_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBERS_RE = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+_LISTS_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+ORDER_BY = ("total_time", "bytes_read", "rows_read", "calls", "max_time")
+
+
+def fingerprint(query: str) -> str:
+    """
+    Normalize a query so executions that only differ in their literals share
+    the same fingerprint: comments are dropped, string and number literals
+    become `?`, lists of literals become `(?+)` and whitespace is collapsed.
+    """
+    query = _COMMENTS_RE.sub(" ", query)
+    query = _STRINGS_RE.sub("?", query)
+    query = _NUMBERS_RE.sub("?", query)
+    query = _LISTS_RE.sub("(?+)", query)
+    return _WHITESPACE_RE.sub(" ", query).strip()
+
+
+@dataclass
+class QueryStats:
+    fingerprint: str
+    example: str
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    rows_read: int = 0
+    bytes_read: int = 0
+    result_rows: int = 0
+    result_bytes: int = 0
+
+
+class QueryLog:
+    """
+    Per query fingerprint aggregated statistics of the SQL queries run.
+
+    Bounded to `max_fingerprints`, the least recently run fingerprint is
+    evicted first.
+    """
+
+    def __init__(
+        self, max_fingerprints: int = 500, max_example_length: int = 1000
+    ):
+        self.max_fingerprints = max_fingerprints
+        self.max_example_length = max_example_length
+        self.stats: "OrderedDict[str, QueryStats]" = OrderedDict()
+
+    def record(
+        self,
+        query: str,
+        elapsed: float,
+        response: Dict[str, Any],
+        result_bytes: int,
+        key: Optional[str] = None,
+    ):
+        """
+        Record one execution of `query` that took `elapsed` seconds, using the
+        `statistics` block of the Tinybird JSON response for the data read.
+        It's aggregated by `key`, the query fingerprint by default.
+        """
+        key = key or fingerprint(query)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = QueryStats(
+                fingerprint=key, example=query[: self.max_example_length]
+            )
+            self.stats[key] = stats
+            if len(self.stats) > self.max_fingerprints:
+                self.stats.popitem(last=False)
+        else:
+            self.stats.move_to_end(key)
+
+        statistics = response.get("statistics") or {}
+        stats.calls += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        stats.rows_read += int(statistics.get("rows_read") or 0)
+        stats.bytes_read += int(statistics.get("bytes_read") or 0)
+        stats.result_rows += int(response.get("rows") or 0)
+        stats.result_bytes += result_bytes
+
+    def top(
+        self, limit: int = 10, order_by: str = "total_time"
+    ) -> List[Dict[str, Any]]:
+        """The `limit` fingerprints with the highest `order_by` statistic."""
+        if order_by not in ORDER_BY:
+            raise ValueError(f"Invalid order_by: {order_by}, use one of {ORDER_BY}")
+        ranked = sorted(
+            self.stats.values(), key=lambda s: getattr(s, order_by), reverse=True
+        )
+        return [
+            {
+                **asdict(stats),
+                "avg_time": round(stats.total_time / stats.calls, 4),
+                "total_time": round(stats.total_time, 4),
+                "max_time": round(stats.max_time, 4),
+            }
+            for stats in ranked[:limit]
+        ]
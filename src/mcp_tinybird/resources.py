@@ -0,0 +1,42 @@
+from typing import Any, Dict, List
+
+
+def _description(description: str) -> List[str]:
+    if not description:
+        return []
+    return ["DESCRIPTION >", *(f"    {line}" for line in description.splitlines()), ""]
+
+
+def render_datasource(data: Dict[str, Any]) -> str:
+    """Render a `v0/datasources/{name}` response as a .datasource datafile."""
+    lines = _description(data.get("description") or "")
+
+    columns = []
+    for column in data.get("columns", []):
+        definition = f"    `{column['name']}` {column['type']}"
+        if column.get("jsonpath"):
+            definition += f" `json:{column['jsonpath']}`"
+        if column.get("default_value"):
+            definition += f" {column['default_value']}"
+        columns.append(definition)
+    lines += ["SCHEMA >", ",\n".join(columns), ""]
+
+    engine = data.get("engine") or {}
+    for key, value in engine.items():
+        if value:
+            lines.append(f'{key.upper()} "{value}"')
+    return "\n".join(lines).strip() + "\n"
+
+
+def render_pipe(data: Dict[str, Any]) -> str:
+    """Render a `v0/pipes/{name}` response as a .pipe datafile."""
+    lines = _description(data.get("description") or "")
+    for node in data.get("nodes", []):
+        lines.append(f"NODE {node['name']}")
+        lines += _description(node.get("description") or "")
+        lines.append("SQL >")
+        lines += [f"    {line}" for line in (node.get("sql") or "").splitlines()]
+        lines.append("")
+    if data.get("type"):
+        lines.append(f"TYPE {data['type']}")
+    return "\n".join(lines).strip() + "\n"
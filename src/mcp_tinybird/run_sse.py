@@ -1,33 +1,263 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import httpx
 import uvicorn
+from contextlib import asynccontextmanager
 from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
 from .sse import SSEHandler
-from .server import create_server
+from .server import create_server, flush_logs
+from .debug import debug_routes
+from .lifecycle import lifecycle
+from .offload import loop_monitor
 import logging
 
 logger = logging.getLogger(__name__)
 
-def create_app():
-    server, init_options, _, _ = create_server()
-    sse_handler = SSEHandler(server, init_options)
-    app = Starlette(routes=sse_handler.get_routes())
-    return app
 
-def main():
-    app = create_app()
+def worker_socket_path(socket_dir, index):
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+def health_routes():
+    """Liveness and readiness probes, not ready until startup and while draining."""
+
+    async def health(request):
+        return JSONResponse({"status": "ok"})
+
+    async def ready(request):
+        if not lifecycle.ready:
+            status = "draining" if lifecycle.draining else "starting"
+            return JSONResponse({"status": status}, status_code=503)
+        return JSONResponse({"status": "ready", "in_flight": lifecycle.in_flight})
+
+    return [Route("/health", endpoint=health), Route("/ready", endpoint=ready)]
+
+
+def forward_routes(index, socket_dir):
+    """
+    With several workers, SSE sessions live in the worker that opened them and
+    their messages path carries its index. Messages that the kernel balanced
+    to another worker are forwarded to the owner over its Unix socket.
+    """
+    clients = {}
+
+    async def forward(request):
+        owner = request.path_params["worker"]
+        client = clients.get(owner)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(
+                    uds=worker_socket_path(socket_dir, owner)
+                ),
+                base_url="http://worker",
+            )
+            clients[owner] = client
+        try:
+            response = await client.post(
+                request.url.path,
+                params=request.query_params,
+                content=await request.body(),
+                headers={"Content-Type": request.headers.get("content-type", "")},
+            )
+        except httpx.TransportError as e:
+            logger.error(f"Could not forward message to worker {owner}: {e}")
+            return Response("Session not found", status_code=404)
+        return Response(
+            response.content,
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type"),
+        )
+
+    return [Route("/messages/{worker:int}", endpoint=forward, methods=["POST"])]
+
+
+def create_app(index=None, socket_dir=None):
+    """
+    Build the app of one worker. `create_server` only runs here, in the
+    worker process, never when this module is imported.
+    """
+    server, init_options, workspaces, _ = create_server(worker=index)
+    messages_path = "/messages" if index is None else f"/messages/{index}"
+    sse_handler = SSEHandler(server, init_options, messages_path)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        workspaces.start_metadata_polling()
+        loop_monitor.start()
+        lifecycle.ready = True
+        yield
+        lifecycle.ready = False
+        loop_monitor.stop()
+        await workspaces.close()
+        await asyncio.to_thread(flush_logs)
+
+    routes = (
+        sse_handler.get_routes()
+        + health_routes()
+        + debug_routes(workspaces, os.getenv("MCP_DEBUG_TOKEN"))
+    )
+    if index is not None:
+        routes += forward_routes(index, socket_dir)
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    A uvicorn server that, on the first SIGTERM/SIGINT, reports not ready and
+    waits for the tool calls in flight before shutting down. A second signal
+    exits right away.
+    """
+
+    def __init__(self, config, drain_timeout):
+        super().__init__(config)
+        self.drain_timeout = drain_timeout
+        self._loop = None
+
+    async def serve(self, sockets=None):
+        self._loop = asyncio.get_running_loop()
+        await super().serve(sockets=sockets)
+
+    def handle_exit(self, sig, frame):
+        if lifecycle.draining or self._loop is None:
+            return super().handle_exit(sig, frame)
+        lifecycle.draining = True
+        logger.info(f"Received signal {sig}, draining for {self.drain_timeout}s")
+
+        async def drain():
+            await lifecycle.drain(self.drain_timeout)
+            super(DrainingServer, self).handle_exit(sig, frame)
+
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(drain()))
+
+
+def bind_socket(host, port, reuse_port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(options, index=None, socket_dir=None):
+    # Let the kernel balance connections between the workers' own sockets
+    sockets = [bind_socket(options.host, options.port, index is not None)]
+    if index is not None:
+        path = worker_socket_path(socket_dir, index)
+        if os.path.exists(path):
+            os.unlink(path)
+        unix_socket = socket.socket(socket.AF_UNIX)
+        unix_socket.bind(path)
+        sockets.append(unix_socket)
+
     config = uvicorn.Config(
-        app,
-        host="0.0.0.0",
-        port=3001,
-        log_level="debug",
-        log_config=None
+        create_app(index, socket_dir),
+        log_level=options.log_level,
+        log_config=None,
+        # uvloop and httptools when installed
+        loop="auto",
+        http="auto",
+        timeout_graceful_shutdown=options.shutdown_timeout,
     )
-    
-    server = uvicorn.Server(config)
+    server = DrainingServer(config, drain_timeout=options.drain_timeout)
     try:
-        server.run()
+        server.run(sockets=sockets)
     except Exception as e:
         logger.error(f"Failed to start server: {e}", exc_info=True)
         raise
 
+
+def run_workers(options):
+    """Run `options.workers` worker processes, restarting the ones that die."""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("Several workers need SO_REUSEPORT support")
+    socket_dir = tempfile.mkdtemp(prefix="mcp-tinybird-")
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+    stopping = False
+
+    def spawn(index):
+        process = context.Process(
+            target=run_worker,
+            args=(options, index, socket_dir),
+            name=f"mcp-tinybird-worker-{index}",
+        )
+        process.start()
+        workers[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def stop(sig, frame):
+        nonlocal stopping
+        if stopping:
+            # Second signal: skip the drain
+            for process in workers.values():
+                process.kill()
+            return
+        stopping = True
+        logger.info(f"Received signal {sig}, stopping {len(workers)} workers")
+        if sig == signal.SIGINT:
+            # Ctrl+C already reaches the whole process group
+            return
+        for process in workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(options.workers):
+        spawn(index)
+    while not stopping:
+        time.sleep(0.5)
+        for index, process in list(workers.items()):
+            if not stopping and not process.is_alive():
+                logger.error(f"Worker {index} exited with {process.exitcode}")
+                spawn(index)
+    for process in workers.values():
+        process.join()
+
+
+def parse_options(argv, prog="mcp-tinybird sse", workers=True):
+    """The options of the network servers, `workers` only where supported."""
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", 3001)))
+    if workers:
+        parser.add_argument(
+            "--workers", type=int, default=int(os.getenv("MCP_WORKERS", 1))
+        )
+    parser.add_argument("--log-level", default=os.getenv("MCP_LOG_LEVEL", "debug"))
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=float(os.getenv("MCP_DRAIN_TIMEOUT", 30)),
+        help="Seconds to wait for tool calls in flight on SIGTERM",
+    )
+    parser.add_argument(
+        "--shutdown-timeout",
+        type=float,
+        default=float(os.getenv("MCP_SHUTDOWN_TIMEOUT", 5)),
+        help="Seconds to wait for open connections after draining",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_options(sys.argv[2:] if argv is None else argv)
+    if options.workers > 1:
+        run_workers(options)
+    else:
+        run_worker(options)
+
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(sys.argv[1:])
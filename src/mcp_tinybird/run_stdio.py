@@ -2,6 +2,7 @@ import asyncio
 import logging
 from .stdio import STDIOHandler
 from .server import create_server
+from .offload import loop_monitor
 
 logger = logging.getLogger(__name__)
 
@@ -11,9 +12,15 @@ def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     logger.info("Starting MCP Tinybird STDIO server")
-    server, init_options, _, _ = create_server()
+    server, init_options, workspaces, _ = create_server()
     stdio_handler = STDIOHandler(server, init_options)
-    asyncio.run(stdio_handler.handle_stdio())
+
+    async def serve():
+        workspaces.start_metadata_polling()
+        loop_monitor.start()
+        await stdio_handler.handle_stdio()
+
+    asyncio.run(serve())
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+import uvicorn
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from .streamable_http import StreamableHTTPHandler
+from .server import create_server, flush_logs
+from .debug import debug_routes
+from .lifecycle import lifecycle
+from .offload import loop_monitor
+from .run_sse import DrainingServer, health_routes, parse_options
+import logging
+
+logger = logging.getLogger(__name__)
+
+def create_app():
+    server, init_options, workspaces, _ = create_server()
+    http_handler = StreamableHTTPHandler(server, init_options)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        workspaces.start_metadata_polling()
+        loop_monitor.start()
+        lifecycle.ready = True
+        yield
+        lifecycle.ready = False
+        loop_monitor.stop()
+        await http_handler.close()
+        await workspaces.close()
+        await asyncio.to_thread(flush_logs)
+
+    app = Starlette(
+        routes=http_handler.get_routes()
+        + health_routes()
+        + debug_routes(workspaces, os.getenv("MCP_DEBUG_TOKEN")),
+        lifespan=lifespan,
+    )
+    return app
+
+def main(argv=None):
+    # Sessions live in the memory of the process, so there's a single worker
+    options = parse_options(
+        sys.argv[2:] if argv is None else argv,
+        prog="mcp-tinybird streamable-http",
+        workers=False,
+    )
+    config = uvicorn.Config(
+        create_app(),
+        host=options.host,
+        port=options.port,
+        log_level=options.log_level,
+        log_config=None,
+        # uvloop and httptools when installed
+        loop="auto",
+        http="auto",
+        timeout_graceful_shutdown=options.shutdown_timeout,
+    )
+
+    server = DrainingServer(config, drain_timeout=options.drain_timeout)
+    try:
+        server.run()
+    except Exception as e:
+        logger.error(f"Failed to start server: {e}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -8,10 +8,21 @@ from mcp.server import NotificationOptions, Server
 from pydantic import AnyUrl
 import mcp.server.stdio
 from dotenv import load_dotenv
-from .tb import APIClient
+from .budget import DEFAULT_MAX_OUTPUT_TOKENS, OutputBudget
+from .cancellation import in_flight_requests
+from .cassette import Cassette
+from .insights import DEFAULT_NOTIFY_DELAY, Debouncer, SessionInsights
+from .ingest import DEFAULT_CHUNK_SIZE, DEFAULT_PARALLEL_UPLOADS, DEFAULT_PROGRESS_DIR
+from .lifecycle import lifecycle
+from .offload import TOOL_TASK_PREFIX, Offloader, approx_size, loop_monitor
+from .pipe_params import describe_pipe_params
+from .query_log import ORDER_BY as QUERY_STATS_ORDER_BY
+from .tb import DATA_SOURCES_PAGE_SIZE, APIClient
+from .workspaces import ALL_WORKSPACES, WorkspaceRegistry
 from tb.logger import TinybirdLoggingQueueHandler
 from multiprocessing import Queue
 import uuid
+import weakref
 from importlib.metadata import version
 from starlette.applications import Starlette
 from starlette.routing import Route
@@ -113,7 +124,31 @@ The provided XML tags are for the assistants understanding. Implore to make all
 Start your first message fully in character with something like "Oh, Hey there! I see you've chosen the topic {topic}. Let's get started! 🚀"
 """
 
-def create_server():
+# Tools that don't read from or write to a Workspace
+WORKSPACE_AGNOSTIC_TOOLS = {"append-insight", "llms-tinybird-docs"}
+
+# Read-only tools that can run in every Workspace at once and merge the results
+FAN_OUT_TOOLS = {
+    "list-data-sources",
+    "list-pipes",
+    "run-select-query",
+    "profile-query",
+    "query-stats",
+}
+
+
+def flush_logs():
+    """Send the logs still queued for Tinybird, stopping their listener."""
+    for handler in logging.getLogger("mcp-tinybird").handlers:
+        if isinstance(handler, TinybirdLoggingQueueHandler):
+            handler.listener.stop()
+
+
+def create_server(worker: int | None = None):
+    """
+    Build the MCP server from the environment. `worker` is the index of the
+    worker process, when there are several.
+    """
     logging.basicConfig(level=logging.DEBUG)
     logger = logging.getLogger("mcp-tinybird")
     logger.setLevel(logging.DEBUG)
@@ -129,39 +164,165 @@ def create_server():
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     logging_session = str(uuid.uuid4())
     extra = {"session": logging_session, "mcp_server_version": get_version()}
-    
-    # Add Tinybird logging handler
-    handler = TinybirdLoggingQueueHandler(
-        Queue(-1),
-        LOGGING_TB_TOKEN,
-        LOGGING_TB_API_URL,
-        "mcp-tinybird",
-        ds_name="mcp_logs_python",
+
+    # Record upstream requests to, or replay them from, a cassette file
+    cassette = Cassette.from_config(
+        os.getenv("TB_CASSETTE"),
+        os.getenv("TB_CASSETTE_MODE"),
+        os.getenv("TB_REPLAY_SPEED"),
+        worker=worker,
     )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+
+    # Add Tinybird logging handler. It doesn't go through httpx, so it can't
+    # be recorded and is left out of sessions with a cassette
+    if cassette is None:
+        handler = TinybirdLoggingQueueHandler(
+            Queue(-1),
+            LOGGING_TB_TOKEN,
+            LOGGING_TB_API_URL,
+            "mcp-tinybird",
+            ds_name="mcp_logs_python",
+        )
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
 
     # Initialize base MCP server
     server = Server("mcp-tinybird")
 
     # Initialize Tinybird clients
-    tb_client = APIClient(api_url=TB_API_URL, token=TB_ADMIN_TOKEN)
-    tb_logging_client = APIClient(api_url=LOGGING_TB_API_URL, token=LOGGING_TB_TOKEN)
-    logger.info("Started MCP Tinybird")
-
-    init_options = InitializationOptions(
-        server_name="mcp-tinybird",
-        server_version=get_version(),
-        capabilities=server.get_capabilities(
-            notification_options=NotificationOptions(),
-            experimental_capabilities={},
+    TB_METADATA_POLL_INTERVAL = os.getenv("TB_METADATA_POLL_INTERVAL")
+    TB_QUERY_TIMEOUT = os.getenv("TB_QUERY_TIMEOUT")
+    offloader = Offloader.from_config(
+        os.getenv("TB_OFFLOAD_EXECUTOR"),
+        os.getenv("TB_OFFLOAD_WORKERS"),
+        os.getenv("TB_OFFLOAD_THRESHOLD"),
+    )
+    TB_LOOP_LAG_THRESHOLD = os.getenv("TB_LOOP_LAG_THRESHOLD")
+    if TB_LOOP_LAG_THRESHOLD:
+        loop_monitor.threshold = float(TB_LOOP_LAG_THRESHOLD)
+    workspaces = WorkspaceRegistry.from_config(
+        TB_API_URL,
+        TB_ADMIN_TOKEN,
+        os.getenv("TB_WORKSPACES"),
+        metadata_poll_interval=(
+            float(TB_METADATA_POLL_INTERVAL) if TB_METADATA_POLL_INTERVAL else None
         ),
+        query_timeout=float(TB_QUERY_TIMEOUT) if TB_QUERY_TIMEOUT else None,
+        offloader=offloader,
+        cassette=cassette,
     )
+    TB_MAX_OUTPUT_BYTES = os.getenv("TB_MAX_OUTPUT_BYTES")
+    TB_MAX_OUTPUT_TOKENS = os.getenv("TB_MAX_OUTPUT_TOKENS")
+    output_budget = OutputBudget(
+        max_bytes=int(TB_MAX_OUTPUT_BYTES) if TB_MAX_OUTPUT_BYTES else None,
+        max_tokens=(
+            int(TB_MAX_OUTPUT_TOKENS)
+            if TB_MAX_OUTPUT_TOKENS
+            else DEFAULT_MAX_OUTPUT_TOKENS
+        ),
+    )
+    # Where append-file records the chunks appended, to resume failed appends
+    append_progress_dir = os.getenv("TB_APPEND_PROGRESS_DIR", DEFAULT_PROGRESS_DIR)
+    # The insights memo of each MCP session, persisted when TB_INSIGHTS_SESSION
+    # names it so a restarted server can resume it. Workers write files of
+    # their own
+    insights_name = os.getenv("TB_INSIGHTS_SESSION")
+    if insights_name and worker is not None:
+        insights_name = f"{insights_name}-{worker}"
+    insights = SessionInsights(os.getenv("TB_INSIGHTS_DIR"), insights_name)
+    TB_INSIGHTS_NOTIFY_DELAY = os.getenv("TB_INSIGHTS_NOTIFY_DELAY")
+    # The default Workspace backs resources, prompts and the insights memo
+    tb_client = workspaces.get()
+    tb_logging_client = APIClient(
+        api_url=LOGGING_TB_API_URL, token=LOGGING_TB_TOKEN, cassette=cassette
+    )
+    logger.info("Started MCP Tinybird")
+    if tb_client.query_killer is None:
+        # Tinybird has no public API to kill a query
+        logger.info(
+            "Server-side query kill is disabled, queries abandoned by clients "
+            "run until their max_execution_time",
+            extra=extra,
+        )
+
+    # Sessions that have talked to us, to broadcast list_changed notifications,
+    # and the resource URIs each one subscribed to, to send updated ones
+    sessions = weakref.WeakSet()
+    subscriptions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def track_session():
+        try:
+            sessions.add(server.request_context.session)
+        except LookupError:
+            pass
+
+    def subscribers(uri: str) -> list:
+        return [
+            session for session, uris in list(subscriptions.items()) if uri in uris
+        ]
 
+    async def notify_metadata_changed(changed: dict[str, list[str]]):
+        logger.info(f"Workspace metadata changed: {changed}", extra=extra)
+        for session in list(sessions):
+            try:
+                await session.send_resource_list_changed()
+            except Exception as e:
+                logger.debug(f"Could not notify session: {e}", extra=extra)
+        for kind, names in changed.items():
+            for name in names:
+                uri = f"tinybird://{kind}/{name}"
+                for session in subscribers(uri):
+                    try:
+                        await session.send_resource_updated(AnyUrl(uri))
+                    except Exception as e:
+                        logger.debug(f"Could not notify session: {e}", extra=extra)
+
+    tb_client.on_metadata_changed = notify_metadata_changed
+
+    # Insights often come in bursts, notify each session once per burst
+    insights_changed: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def notify_insights_changed(session_ref: weakref.ref):
+        async def notify():
+            session = session_ref()
+            if session is None or session not in subscribers("tinybird://insights"):
+                return
+            try:
+                await session.send_resource_updated(AnyUrl("tinybird://insights"))
+            except Exception as e:
+                logger.debug(f"Could not notify session: {e}", extra=extra)
+
+        return notify
+
+    def trigger_insights_changed(session):
+        debouncer = insights_changed.get(session)
+        if debouncer is None:
+            debouncer = insights_changed[session] = Debouncer(
+                notify_insights_changed(weakref.ref(session)),
+                (
+                    float(TB_INSIGHTS_NOTIFY_DELAY)
+                    if TB_INSIGHTS_NOTIFY_DELAY
+                    else DEFAULT_NOTIFY_DELAY
+                ),
+            )
+        debouncer.trigger()
+
+
+    @server.subscribe_resource()
+    async def handle_subscribe_resource(uri: AnyUrl):
+        logger.info(f"Subscribing to {uri}", extra=extra)
+        session = server.request_context.session
+        subscriptions.setdefault(session, set()).add(str(uri))
+
+    @server.unsubscribe_resource()
+    async def handle_unsubscribe_resource(uri: AnyUrl):
+        logger.info(f"Unsubscribing from {uri}", extra=extra)
+        subscriptions.get(server.request_context.session, set()).discard(str(uri))
 
     @server.list_resources()
     async def handle_list_resources() -> list[types.Resource]:
         logger.info("Handling list_resources request", extra=extra)
+        track_session()
         return [
             types.Resource(
                 uri=AnyUrl("tinybird://insights"),
@@ -175,8 +336,52 @@ def create_server():
                 description="Syntax and context to build .datasource datafiles",
                 mimeType="text/plain",
             ),
+            *(
+                types.Resource(
+                    uri=AnyUrl(f"tinybird://datasources/{ds.name}"),
+                    name=f"Data Source {ds.name}",
+                    description="The .datasource datafile of the Data Source",
+                    mimeType="text/plain",
+                )
+                for ds in (tb_client._datasources or {}).values()
+            ),
+            *(
+                types.Resource(
+                    uri=AnyUrl(f"tinybird://pipes/{pipe.name}"),
+                    name=f"Pipe {pipe.name}",
+                    description="The .pipe datafile of the Pipe",
+                    mimeType="text/plain",
+                )
+                for pipe in (tb_client._pipes or {}).values()
+            ),
         ]
 
+    # mcp 1.0 has no decorator for resource templates, register the handler
+    async def handle_list_resource_templates(_) -> types.ServerResult:
+        logger.info("Handling list_resource_templates request", extra=extra)
+        return types.ServerResult(
+            types.ListResourceTemplatesResult(
+                resourceTemplates=[
+                    types.ResourceTemplate(
+                        uriTemplate="tinybird://datasources/{name}",
+                        name="Data Source",
+                        description="The .datasource datafile of a Data Source: schema and engine settings",
+                        mimeType="text/plain",
+                    ),
+                    types.ResourceTemplate(
+                        uriTemplate="tinybird://pipes/{name}",
+                        name="Pipe",
+                        description="The .pipe datafile of a Pipe: the SQL of every node",
+                        mimeType="text/plain",
+                    ),
+                ]
+            )
+        )
+
+    server.request_handlers[types.ListResourceTemplatesRequest] = (
+        handle_list_resource_templates
+    )
+
 
     @server.read_resource()
     async def handle_read_resource(uri: AnyUrl) -> str:
@@ -191,7 +396,11 @@ def create_server():
         path = str(uri).replace("tinybird://", "")
 
         if path == "insights":
-            return tb_client._synthesize_memo()
+            return insights.get(server.request_context.session).memo
+        if path.startswith("datasources/"):
+            return await tb_client.get_data_source_resource(path.split("/", 1)[1])
+        if path.startswith("pipes/"):
+            return await tb_client.get_pipe_resource(path.split("/", 1)[1])
         if path == "datasource-definition-context":
             return """
     <context>
@@ -342,7 +551,8 @@ def create_server():
             try:
                 logger.info("Listing prompts", extra=extra)
                 response = await client.run_select_query(
-                    "SELECT * FROM prompts ORDER BY name, timestamp DESC LIMIT 1 by name"
+                    "SELECT * FROM prompts ORDER BY name, timestamp DESC LIMIT 1 by name",
+                    record=False,
                 )
                 if response.get("data"):
                     for prompt in response.get("data"):
@@ -387,6 +597,7 @@ def create_server():
     @server.list_prompts()
     async def handle_list_prompts() -> list[types.Prompt]:
         logger.info("Handling list_prompts request", extra=extra)
+        track_session()
         prompts = await get_prompts()
         transformed_prompts = []
         for prompt in prompts:
@@ -441,13 +652,38 @@ def create_server():
         List available tools.
         Each tool specifies its arguments using JSON Schema validation.
         """
-        return [
+        track_session()
+        tools = [
             types.Tool(
                 name="list-data-sources",
-                description="List all Data Sources in the Tinybird Workspace",
+                description="List all Data Sources in the Tinybird Workspace. In large Workspaces use summary mode, which lists only ids, names and row counts, paged and filtered by name, and expand the columns of the Data Sources you need",
                 inputSchema={
                     "type": "object",
-                    "properties": {},
+                    "properties": {
+                        "summary": {
+                            "type": "boolean",
+                            "description": "List only ids, names and row counts, sorted by name and paged. The other arguments only apply in summary mode",
+                        },
+                        "name": {
+                            "type": "string",
+                            "description": "Only Data Sources whose name contains this text, case insensitive",
+                        },
+                        "offset": {
+                            "type": "integer",
+                            "description": "Data Sources to skip, use next_offset of the previous page",
+                            "minimum": 0,
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": f"Data Sources per page, {DATA_SOURCES_PAGE_SIZE} by default",
+                            "minimum": 1,
+                        },
+                        "expand": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "Names of Data Sources in the page to include the columns of",
+                        },
+                    },
                 },
             ),
             types.Tool(
@@ -476,14 +712,27 @@ def create_server():
                     "required": ["pipe_id"],
                 },
             ),
+            types.Tool(
+                name="get-pipe-params",
+                description="Get the parameters a Pipe Endpoint accepts: name, type, default value, whether it's required and its description. Much smaller than get-pipe, use it before request-pipe-data",
+                inputSchema={
+                    "type": "object",
+                    "properties": {"pipe_id": {"type": "string"}},
+                    "required": ["pipe_id"],
+                },
+            ),
             types.Tool(
                 name="request-pipe-data",
-                description="Requests data from a Pipe Endpoint in the Tinybird Workspace, includes parameters",
+                description="Requests data from a Pipe Endpoint in the Tinybird Workspace, includes parameters. Parameters are validated against the ones listed by get-pipe-params before the request is sent",
                 inputSchema={
                     "type": "object",
                     "properties": {
                         "pipe_id": {"type": "string"},
                         "params": {"type": "object", "properties": {}},
+                        "downsample": {
+                            "type": "integer",
+                            "description": "Optional maximum number of rows to return. Time series results are reduced preserving their shape, use it when the data is going to be plotted",
+                        },
                     },
                     "required": ["pipe_id"],
                 },
@@ -495,10 +744,115 @@ def create_server():
                     "type": "object",
                     "properties": {
                         "select_query": {"type": "string"},
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional deadline in seconds, the query is stopped when it's exceeded",
+                        },
+                        "incremental": {
+                            "type": "boolean",
+                            "description": "For queries grouped by a time bucket that are refreshed, e.g. for a dashboard. Repeated runs only query the buckets after the last one fetched and merge them into the previous result. Queries with a LIMIT, or ordered by other than the time column, are run in full",
+                        },
+                        "time_column": {
+                            "type": "string",
+                            "description": "The time bucket column of an incremental query. Defaults to the first Date or DateTime column",
+                        },
+                        "downsample": {
+                            "type": "integer",
+                            "description": "Optional maximum number of rows to return. Time series results are reduced preserving their shape, use it when the data is going to be plotted",
+                        },
+                    },
+                    "required": ["select_query"],
+                },
+            ),
+            types.Tool(
+                name="profile-query",
+                description="Profiles the result of a select query without returning its rows: row count, null ratio, distinct estimate, min/max, quantiles and top-k values per column. Prefer it over run-select-query when you only need to understand the shape of the data",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "select_query": {"type": "string"},
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional deadline in seconds, the query is stopped when it's exceeded",
+                        },
+                        "top_k": {
+                            "type": "integer",
+                            "description": "Number of most frequent values to return for categorical columns",
+                            "default": 5,
+                        },
                     },
                     "required": ["select_query"],
                 },
             ),
+            types.Tool(
+                name="query-stats",
+                description="Shows the most expensive SQL queries run through this server, grouped by fingerprint (the query with its literals stripped): calls, total and max latency, rows and bytes read and result size. Use it to find the queries worth optimizing",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "limit": {
+                            "type": "integer",
+                            "description": "Number of fingerprints to return",
+                            "default": 10,
+                        },
+                        "order_by": {
+                            "type": "string",
+                            "enum": list(QUERY_STATS_ORDER_BY),
+                            "default": "total_time",
+                        },
+                    },
+                },
+            ),
+            types.Tool(
+                name="advise-datasource",
+                description="Suggests sorting key changes, skip indexes or materialized Pipes for a Data Source, based on the filters and group bys of the SQL queries and Pipe Endpoint requests recorded by this server, with an estimate of the bytes read they would save. Runs one aggregation over the Data Source to measure the cardinality of the filtered columns",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "datasource_name": {"type": "string"},
+                        "timeout": {
+                            "type": "number",
+                            "description": "Optional deadline in seconds for the cardinality query",
+                        },
+                    },
+                    "required": ["datasource_name"],
+                },
+            ),
+            types.Tool(
+                name="append-file",
+                description="Appends a local CSV, NDJSON or Parquet file to a Data Source in Tinybird. The file is streamed in compressed chunks, with several chunks uploaded in parallel, so it works for files of several GB. The data needs to conform to the Data Source schema, CSV files need a header with the column names. If it fails partway, calling it again with the same arguments resumes from the first chunk not appended",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "datasource_name": {
+                            "type": "string",
+                            "description": "The name of the Data Source in Tinybird",
+                        },
+                        "file_path": {
+                            "type": "string",
+                            "description": "The local path of the file",
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": ["csv", "ndjson", "parquet"],
+                            "description": "The format of the file, by default guessed from its extension: .csv, .ndjson, .jsonl or .parquet",
+                        },
+                        "chunk_size_mb": {
+                            "type": "number",
+                            "description": f"Approximate size of each chunk read from the file, {DEFAULT_CHUNK_SIZE // (1024 * 1024)} MB by default",
+                        },
+                        "parallel": {
+                            "type": "integer",
+                            "description": f"Maximum chunks uploaded at once, {DEFAULT_PARALLEL_UPLOADS} by default",
+                        },
+                        "resume": {
+                            "type": "boolean",
+                            "description": "Skip the chunks appended by a previous call that failed. True by default, false appends the whole file again",
+                        },
+                    },
+                    "required": ["datasource_name", "file_path"],
+                },
+            ),
             types.Tool(
                 name="append-insight",
                 description="Add a business insight to the memo",
@@ -568,6 +922,126 @@ def create_server():
             ),
         ]
 
+        for tool in tools:
+            tool.inputSchema["properties"].update(
+                {
+                    "max_output_tokens": {
+                        "type": "integer",
+                        "description": "Optional output budget in approximate tokens, capped by the server budget. Larger results are summarized, with metadata on what was left out and how to fetch it",
+                    },
+                    "max_output_bytes": {
+                        "type": "integer",
+                        "description": "Optional output budget in bytes",
+                    },
+                    "output_offset": {
+                        "type": "integer",
+                        "description": "Character offset to continue reading a result that was cut, as returned in its metadata. Keep the same output budget across pages",
+                    },
+                }
+            )
+
+        if len(workspaces.names) > 1:
+            for tool in tools:
+                if tool.name in WORKSPACE_AGNOSTIC_TOOLS:
+                    continue
+                description = (
+                    f"The Tinybird Workspace, one of {workspaces.names}. "
+                    f"Defaults to {workspaces.default}."
+                )
+                if tool.name in FAN_OUT_TOOLS:
+                    description += (
+                        f" Use '{ALL_WORKSPACES}' to run it in every Workspace"
+                    )
+                tool.inputSchema["properties"]["workspace"] = {
+                    "type": "string",
+                    "description": description,
+                }
+        return tools
+
+
+    async def text_content(response, arguments: dict) -> list[types.TextContent]:
+        """
+        Render a tool response within the output budget of the call, off the
+        event loop when it's large.
+        """
+        budget = output_budget.for_call(
+            max_bytes=arguments.get("max_output_bytes"),
+            max_tokens=arguments.get("max_output_tokens"),
+        )
+        text, metadata = await offloader.run(
+            budget.shape,
+            response,
+            arguments.get("output_offset") or 0,
+            size=approx_size(response),
+        )
+        content = [types.TextContent(type="text", text=text)]
+        if metadata is not None:
+            content.append(types.TextContent(type="text", text=json.dumps(metadata)))
+        return content
+
+    async def read_only_response(name: str, arguments: dict, tb_client):
+        """The response of one of FAN_OUT_TOOLS, before it's rendered."""
+        if name == "list-data-sources":
+            if arguments.get("summary"):
+                return await tb_client.list_data_sources_page(
+                    name=arguments.get("name"),
+                    offset=arguments.get("offset") or 0,
+                    limit=arguments.get("limit") or DATA_SOURCES_PAGE_SIZE,
+                    expand=arguments.get("expand"),
+                )
+            return await tb_client.list_data_sources()
+        elif name == "list-pipes":
+            response = await tb_client.list_pipes()
+            return [r for r in response if r.type == "endpoint"]
+        elif name == "run-select-query":
+            if arguments.get("incremental"):
+                return await tb_client.run_incremental_query(
+                    arguments.get("select_query"),
+                    time_column=arguments.get("time_column"),
+                    timeout=arguments.get("timeout"),
+                    downsample=arguments.get("downsample"),
+                )
+            elif arguments.get("downsample"):
+                return await tb_client.downsample_select_query(
+                    arguments.get("select_query"),
+                    arguments["downsample"],
+                    timeout=arguments.get("timeout"),
+                )
+            return await tb_client.run_select_query(
+                arguments.get("select_query"), timeout=arguments.get("timeout")
+            )
+        elif name == "profile-query":
+            return await tb_client.profile_query(
+                arguments.get("select_query"),
+                top_k=arguments.get("top_k", 5),
+                timeout=arguments.get("timeout"),
+            )
+        elif name == "query-stats":
+            return tb_client.query_log.top(
+                arguments.get("limit", 10), arguments.get("order_by", "total_time")
+            )
+        raise ValueError(f"Unknown tool: {name}")
+
+    async def fan_out_tool(
+        name: str, arguments: dict
+    ) -> list[types.TextContent]:
+        """
+        Run a read-only tool in every Workspace and render the responses as
+        one, keyed by Workspace, so the output budget and paging apply to
+        the whole result.
+        """
+
+        async def call(workspace: str):
+            return await read_only_response(name, arguments, workspaces.get(workspace))
+
+        results = await workspaces.fan_out(call)
+        response = {
+            workspace: (
+                {"error": str(result)} if isinstance(result, Exception) else result
+            )
+            for workspace, result in results.items()
+        }
+        return await text_content(response, arguments)
 
     @server.call_tool()
     async def handle_call_tool(
@@ -575,113 +1049,132 @@ def create_server():
     ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         """
         Handle tool execution requests.
+        They run as in-flight requests the client can cancel when the
+        transport supports it.
+        """
+        requests = in_flight_requests.get()
+        async with lifecycle.track():
+            with loop_monitor.tool(call_tool(name, arguments), name) as coro:
+                if requests is None:
+                    return await coro
+                return await requests.run(
+                    server.request_context.request_id,
+                    coro,
+                    name=f"{TOOL_TASK_PREFIX}{name}",
+                )
+
+    async def call_tool(
+        name: str, arguments: dict | None
+    ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+        """
+        Execute a tool.
         Tools can modify server state and notify clients of changes.
         """
         try:
             logger.info(f"handle_call_tool {name}", extra={**extra, "tool": name})
-            if name == "list-data-sources":
-                response = await tb_client.list_data_sources()
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
-            elif name == "get-data-source":
+            track_session()
+            workspace = arguments.get("workspace")
+            if name in FAN_OUT_TOOLS:
+                if workspace == ALL_WORKSPACES:
+                    return await fan_out_tool(name, arguments)
+                response = await read_only_response(
+                    name, arguments, workspaces.get(workspace)
+                )
+                return await text_content(response, arguments)
+            tb_client = workspaces.get(
+                None if name in WORKSPACE_AGNOSTIC_TOOLS else workspace
+            )
+            if name == "get-data-source":
                 response = await tb_client.get_data_source(arguments.get("datasource_id"))
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
-            elif name == "list-pipes":
-                response = await tb_client.list_pipes()
-                result = [r for r in response if r.type == "endpoint"]
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(result),
-                    )
-                ]
+                return await text_content(response, arguments)
             elif name == "get-pipe":
                 response = await tb_client.get_pipe(arguments.get("pipe_id"))
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
+                return await text_content(response, arguments)
+            elif name == "get-pipe-params":
+                response = await tb_client.get_pipe_params(arguments.get("pipe_id"))
+                return await text_content(describe_pipe_params(response), arguments)
             elif name == "request-pipe-data":
+                params = await tb_client.validate_pipe_params(
+                    arguments.get("pipe_id"), arguments.get("params") or {}
+                )
                 response = await tb_client.get_pipe_data(
-                    arguments.get("pipe_id"), **arguments.get("params")
+                    arguments.get("pipe_id"), **params
                 )
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
-            elif name == "run-select-query":
-                response = await tb_client.run_select_query(arguments.get("select_query"))
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
+                if arguments.get("downsample"):
+                    response = response.downsample(arguments["downsample"])
+                return await text_content(response, arguments)
+            elif name == "advise-datasource":
+                response = await tb_client.advise_datasource(
+                    arguments.get("datasource_name"), timeout=arguments.get("timeout")
+                )
+                return await text_content(response, arguments)
+            elif name == "append-file":
+                chunk_size_mb = arguments.get("chunk_size_mb")
+                response = await tb_client.append_file(
+                    arguments.get("datasource_name"),
+                    arguments.get("file_path"),
+                    format=arguments.get("format"),
+                    chunk_size=(
+                        int(chunk_size_mb * 1024 * 1024)
+                        if chunk_size_mb
+                        else DEFAULT_CHUNK_SIZE
+                    ),
+                    parallel=arguments.get("parallel") or DEFAULT_PARALLEL_UPLOADS,
+                    resume=arguments.get("resume", True),
+                    progress_dir=append_progress_dir,
+                )
+                return await text_content(response, arguments)
             elif name == "append-insight":
                 if not arguments or "insight" not in arguments:
                     raise ValueError("Missing insight argument")
 
-                tb_client.insights.append(arguments["insight"])
-                _ = tb_client._synthesize_memo()
+                session = server.request_context.session
+                if not await insights.get(session).add(arguments["insight"]):
+                    return [
+                        types.TextContent(
+                            type="text",
+                            text="A similar insight is already in the memo",
+                        )
+                    ]
 
                 # Notify clients that the memo resource has changed
-                await server.request_context.session.send_resource_updated(
-                    AnyUrl("tinybird://insights")
-                )
+                trigger_insights_changed(session)
 
                 return [types.TextContent(type="text", text="Insight added to memo")]
             elif name == "llms-tinybird-docs":
                 response = await tb_client.llms()
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
+                return await text_content(response, arguments)
             elif name == "analyze-pipe":
                 response = await tb_client.explain(arguments.get("pipe_name"))
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
+                return await text_content(response, arguments)
             elif name == "push-datafile":
                 files = arguments.get("files")
                 response = await tb_client.push_datafile(files)
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
+                return await text_content(response, arguments)
             elif name == "save-event":
                 datasource_name = arguments.get("datasource_name")
                 data = arguments.get("data")
                 response = await tb_client.save_event(datasource_name, data)
-                return [
-                    types.TextContent(
-                        type="text",
-                        text=str(response),
-                    )
-                ]
+                return await text_content(response, arguments)
             else:
                 raise ValueError(f"Unknown tool: {name}")
         except Exception as e:
             logger.error(f"Error on handle call tool {name} - {e}", extra=extra)
             raise e
         
-    return server, init_options, tb_client, tb_logging_client
+    # Capabilities are derived from the registered handlers, so build the
+    # initialization options once all of them are in place
+    init_options = InitializationOptions(
+        server_name="mcp-tinybird",
+        server_version=get_version(),
+        capabilities=server.get_capabilities(
+            notification_options=NotificationOptions(
+                resources_changed=tb_client.metadata_poll_interval is not None,
+            ),
+            experimental_capabilities={},
+        ),
+    )
+    # The capabilities derived by the SDK never advertise subscriptions
+    init_options.capabilities.resources.subscribe = True
+
+    return server, init_options, workspaces, tb_logging_client
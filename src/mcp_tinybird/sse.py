@@ -1,24 +1,27 @@
 from starlette.routing import Route
 from starlette.responses import Response
 from mcp.server.sse import SseServerTransport
+from .cancellation import cancellable
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SSEHandler:
-    def __init__(self, server, init_options):
+    def __init__(self, server, init_options, messages_path="/messages"):
         self.server = server
         self.init_options = init_options
-        self.sse = SseServerTransport("/messages")
+        self.messages_path = messages_path
+        self.sse = SseServerTransport(messages_path)
 
     async def handle_sse(self, request):
         async with self.sse.connect_sse(
             request.scope, request.receive, request._send
         ) as streams:
-            await self.server.run(
-                streams[0], streams[1], 
-                self.init_options
-            )
+            async with cancellable(streams[0]) as read_stream:
+                await self.server.run(
+                    read_stream, streams[1],
+                    self.init_options
+                )
 
     async def handle_messages(self, request):
         default_response = Response(status_code=202)
@@ -57,5 +60,7 @@ class SSEHandler:
     def get_routes(self):
         return [
             Route("/sse", endpoint=self.handle_sse),
-            Route("/messages", endpoint=self.handle_messages, methods=["POST"])
+            Route(
+                self.messages_path, endpoint=self.handle_messages, methods=["POST"]
+            ),
         ]
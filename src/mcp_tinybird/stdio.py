@@ -1,5 +1,6 @@
 import logging
 import mcp.server.stdio
+from .cancellation import cancellable
 
 logger = logging.getLogger(__name__)
 
@@ -11,8 +12,9 @@ class STDIOHandler:
     async def handle_stdio(self):
         """Handle STDIO communication"""
         async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-            await self.server.run(
-                read_stream,
-                write_stream,
-                self.init_options
-            )
+            async with cancellable(read_stream) as read_stream:
+                await self.server.run(
+                    read_stream,
+                    write_stream,
+                    self.init_options
+                )
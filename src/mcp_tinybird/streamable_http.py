@@ -0,0 +1,311 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import anyio
+import mcp.types as types
+from pydantic import ValidationError
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from .cancellation import cancellable
+
+logger = logging.getLogger(__name__)
+
+SESSION_HEADER = "mcp-session-id"
+
+
+class HTTPSession:
+    """
+    One MCP session over streamable HTTP.
+
+    Every buffer is bounded so memory per session is predictable: the
+    client->server queue, the server->client event queue drained by the GET
+    stream and the replay buffer used to resume it.
+    """
+
+    def __init__(self, session_id: str, max_queue_size: int, replay_size: int):
+        self.session_id = session_id
+        self.last_seen = time.monotonic()
+        self.read_writer, self.read_stream = anyio.create_memory_object_stream(
+            max_queue_size
+        )
+        self.write_stream, self.write_reader = anyio.create_memory_object_stream(
+            max_queue_size
+        )
+        self.pending: Dict[types.RequestId, asyncio.Future] = {}
+        self.outbox: asyncio.Queue = asyncio.Queue(max_queue_size)
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=replay_size)
+        self.next_event_id = 0
+        self.streaming = False
+        self.closed = asyncio.Event()
+        self.tasks: List[asyncio.Task] = []
+
+    def publish(self, message: types.JSONRPCMessage) -> bool:
+        """
+        Queue a server->client message for the GET stream. Without an open
+        stream it's only kept in the replay buffer, for clients that resume
+        their stream later or never open one.
+
+        Returns False when the client is not draining its stream fast enough.
+        """
+        self.next_event_id += 1
+        event = (
+            self.next_event_id,
+            message.model_dump_json(by_alias=True, exclude_none=True),
+        )
+        self.events.append(event)
+        if not self.streaming:
+            return True
+        try:
+            self.outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def route(self):
+        """Hand responses to the POST waiting for them, publish everything else."""
+        async with self.write_reader:
+            async for message in self.write_reader:
+                root = message.root
+                future = (
+                    self.pending.pop(root.id, None)
+                    if isinstance(root, (types.JSONRPCResponse, types.JSONRPCError))
+                    else None
+                )
+                if future is not None:
+                    if not future.done():
+                        future.set_result(message)
+                elif not self.publish(message):
+                    logger.warning(
+                        f"Shedding slow client of session {self.session_id}"
+                    )
+                    self.close()
+                    return
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.read_writer.close()
+        for task in self.tasks:
+            task.cancel()
+
+
+class StreamableHTTPHandler:
+    """
+    Streamable HTTP transport: a single endpoint where clients POST JSON-RPC
+    messages and get the responses back as JSON, GET an event stream for
+    server initiated messages, and DELETE their session.
+    """
+
+    def __init__(
+        self,
+        server,
+        init_options,
+        endpoint: str = "/mcp",
+        max_sessions: int = 10000,
+        max_queue_size: int = 32,
+        replay_size: int = 64,
+        response_timeout: float = 300.0,
+        session_idle_timeout: float = 1800.0,
+    ):
+        self.server = server
+        self.init_options = init_options
+        self.endpoint = endpoint
+        self.max_sessions = max_sessions
+        self.max_queue_size = max_queue_size
+        self.replay_size = replay_size
+        self.response_timeout = response_timeout
+        self.session_idle_timeout = session_idle_timeout
+        self.sessions: Dict[str, HTTPSession] = {}
+
+    def _reap_idle_sessions(self):
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if session.closed.is_set() or (
+                not session.streaming
+                and now - session.last_seen > self.session_idle_timeout
+            ):
+                self._close_session(session)
+
+    def _close_session(self, session: HTTPSession):
+        session.close()
+        self.sessions.pop(session.session_id, None)
+
+    async def _run_session(self, session: HTTPSession):
+        try:
+            async with cancellable(session.read_stream) as read_stream:
+                await self.server.run(
+                    read_stream, session.write_stream, self.init_options
+                )
+        except Exception as e:
+            logger.error(f"Error in session {session.session_id}: {e}", exc_info=True)
+        finally:
+            self._close_session(session)
+
+    def _create_session(self) -> Optional[HTTPSession]:
+        self._reap_idle_sessions()
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        session = HTTPSession(uuid4().hex, self.max_queue_size, self.replay_size)
+        session.tasks = [
+            asyncio.create_task(self._run_session(session)),
+            asyncio.create_task(session.route()),
+        ]
+        self.sessions[session.session_id] = session
+        logger.debug(f"Created new session with ID: {session.session_id}")
+        return session
+
+    def _get_session(self, request) -> Optional[HTTPSession]:
+        session = self.sessions.get(request.headers.get(SESSION_HEADER, ""))
+        if session is None or session.closed.is_set():
+            return None
+        session.last_seen = time.monotonic()
+        return session
+
+    async def handle_post(self, request):
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return Response("Could not parse message", status_code=400)
+        batch = isinstance(body, list)
+        try:
+            messages = [
+                types.JSONRPCMessage.model_validate(m)
+                for m in (body if batch else [body])
+            ]
+        except ValidationError as e:
+            logger.error(f"Failed to parse message: {e}")
+            return Response("Could not parse message", status_code=400)
+
+        if SESSION_HEADER in request.headers:
+            session = self._get_session(request)
+            if session is None:
+                return Response("Could not find session", status_code=404)
+        elif any(
+            isinstance(m.root, types.JSONRPCRequest) and m.root.method == "initialize"
+            for m in messages
+        ):
+            session = self._create_session()
+            if session is None:
+                return Response("Too many sessions", status_code=503)
+        else:
+            return Response(f"{SESSION_HEADER} header is required", status_code=400)
+
+        ids = [
+            m.root.id for m in messages if isinstance(m.root, types.JSONRPCRequest)
+        ]
+        if len(set(ids)) < len(ids) or any(id in session.pending for id in ids):
+            return Response("Request id is already in flight", status_code=409)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for message in messages:
+            if isinstance(message.root, types.JSONRPCRequest):
+                future = loop.create_future()
+                session.pending[message.root.id] = future
+                futures.append(future)
+            try:
+                session.read_writer.send_nowait(message)
+            except anyio.WouldBlock:
+                # Don't buffer without bound for clients flooding the session.
+                # Responses to the messages already sent go to the GET stream
+                for id in ids:
+                    session.pending.pop(id, None)
+                return Response("Too many in-flight messages", status_code=429)
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                return Response("Session closed", status_code=404)
+
+        headers = {SESSION_HEADER: session.session_id}
+        if not futures:
+            return Response(status_code=202, headers=headers)
+
+        try:
+            responses = await asyncio.wait_for(
+                asyncio.gather(*futures), timeout=self.response_timeout
+            )
+        except asyncio.TimeoutError:
+            for message in messages:
+                if isinstance(message.root, types.JSONRPCRequest):
+                    session.pending.pop(message.root.id, None)
+            return Response("Timed out waiting for a response", status_code=504)
+        except asyncio.CancelledError:
+            if session.closed.is_set():
+                return Response("Session closed", status_code=404)
+            raise
+
+        content = [r.model_dump(by_alias=True, exclude_none=True) for r in responses]
+        return JSONResponse(content if batch else content[0], headers=headers)
+
+    async def handle_get(self, request):
+        session = self._get_session(request)
+        if session is None:
+            return Response("Could not find session", status_code=404)
+        if session.streaming:
+            return Response("Session already has an open stream", status_code=409)
+
+        last_event_id = request.headers.get("last-event-id")
+        try:
+            after = (
+                int(last_event_id)
+                if last_event_id is not None
+                else session.next_event_id
+            )
+        except ValueError:
+            return Response("Invalid Last-Event-ID", status_code=400)
+
+        async def stream():
+            # Events published until the stream opens are only in the replay
+            # buffer, and the queued ones are in the replay already
+            replay = [e for e in session.events if e[0] > after]
+            while not session.outbox.empty():
+                session.outbox.get_nowait()
+            session.streaming = True
+            try:
+                for event_id, data in replay:
+                    yield f"id: {event_id}\nevent: message\ndata: {data}\n\n"
+                while not session.closed.is_set():
+                    try:
+                        event_id, data = await asyncio.wait_for(
+                            session.outbox.get(), timeout=15
+                        )
+                    except asyncio.TimeoutError:
+                        # Keep-alive, also surfaces dead connections
+                        yield ": ping\n\n"
+                        continue
+                    yield f"id: {event_id}\nevent: message\ndata: {data}\n\n"
+            finally:
+                session.streaming = False
+                session.last_seen = time.monotonic()
+
+        return StreamingResponse(
+            stream(),
+            media_type="text/event-stream",
+            headers={SESSION_HEADER: session.session_id, "Cache-Control": "no-cache"},
+        )
+
+    async def handle_delete(self, request):
+        session = self._get_session(request)
+        if session is None:
+            return Response("Could not find session", status_code=404)
+        self._close_session(session)
+        return Response(status_code=204)
+
+    async def close(self):
+        for session in list(self.sessions.values()):
+            self._close_session(session)
+
+    def get_routes(self):
+        return [
+            Route(self.endpoint, endpoint=self.handle_post, methods=["POST"]),
+            Route(self.endpoint, endpoint=self.handle_get, methods=["GET"]),
+            Route(self.endpoint, endpoint=self.handle_delete, methods=["DELETE"]),
+        ]
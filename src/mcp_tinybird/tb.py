@@ -1,18 +1,87 @@
+import asyncio
+import gzip
 import httpx
+import json
 import logging
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+import math
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Any
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from functools import wraps
 import traceback
 from pathlib import Path
 
+import msgspec
+
+from .advisor import (
+    access_pattern,
+    advise,
+    candidate_columns,
+    cardinality_query,
+    reads_from,
+    sorting_key_columns,
+    strip_templates,
+)
+from .downsample import (
+    build_minmax_query,
+    lttb,
+    series_columns,
+    source_tables,
+)
+from .cassette import Cassette
+from .offload import Offloader
+from .ingest import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_PARALLEL_UPLOADS,
+    DEFAULT_PROGRESS_DIR,
+    AppendProgress,
+    Chunk,
+    detect_format,
+    iter_chunks,
+)
+from .incremental import (
+    IncrementalCache,
+    build_tail_query,
+    merge_rows,
+    unsupported_clause,
+)
+from .pipe_params import PipeParam, coerce_pipe_params, parse_pipe_params
+from .profile import build_profile_query, column_kind, summarize_profile
+from .query_log import QueryLog
+from .resources import render_datasource, render_pipe
+
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger("TinybirdClient")
 
+# Extra time given to the HTTP request over the query max_execution_time
+QUERY_TIMEOUT_MARGIN = 5.0
+
+# How long a Pipe parameters schema is trusted when metadata polling is not
+# running to tell whether the Pipe changed
+PIPE_PARAMS_TTL = 300.0
+
+# Rows fetched to downsample a result locally, when it has no time column to
+# bucket it by in Tinybird
+MAX_LOCAL_DOWNSAMPLE_ROWS = 100_000
+
+# Data Sources per page of the lightweight listing
+DATA_SOURCES_PAGE_SIZE = 100
+
+# Appending chunks of a file: retries of rate limited or failed uploads, the
+# timeout of each upload and a gzip level that favours speed
+APPEND_RETRIES = 5
+APPEND_TIMEOUT = 300.0
+APPEND_COMPRESSION_LEVEL = 1
+
+# Rendered resources and ETag'd responses kept in memory
+MAX_CACHED_RESOURCES = 256
+
 
 def log_function_call(func):
     @wraps(func)
@@ -39,99 +108,277 @@ def log_function_call(func):
     return wrapper
 
 
-@dataclass
+# Models are slotted and decoded straight from the response bytes with
+# msgspec. Unknown fields are ignored, so new API fields don't break decoding,
+# and payloads that don't match the types fall back to untyped decoding.
+
+
+@dataclass(slots=True)
 class Column:
     name: str
     type: str
-    codec: Optional[str]
-    default_value: Optional[str]
-    jsonpath: Optional[str]
-    nullable: bool
-    normalized_name: str
+    codec: Optional[str] = None
+    default_value: Optional[str] = None
+    jsonpath: Optional[str] = None
+    nullable: Optional[bool] = False
+    normalized_name: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Engine:
-    engine: str
-    engine_sorting_key: str
-    engine_partition_key: str
-    engine_primary_key: Optional[str]
+    engine: Optional[str] = None
+    engine_sorting_key: Optional[str] = None
+    engine_partition_key: Optional[str] = None
+    engine_primary_key: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class DataSource:
     id: str
     name: str
-    engine: Engine
-    columns: List[Column]
-    indexes: List[Any]
-    new_columns_detected: Dict[str, Any]
-    quarantine_rows: int
+    engine: Optional[Engine] = field(default_factory=Engine)
+    columns: List[Column] = field(default_factory=list)
+    indexes: List[Any] = field(default_factory=list)
+    new_columns_detected: Dict[str, Any] = field(default_factory=dict)
+    quarantine_rows: Optional[int] = 0
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "DataSource":
-        engine = Engine(**data["engine"])
-        columns = [Column(**col) for col in data["columns"]]
-        return cls(
-            id=data["id"],
-            name=data["name"],
-            engine=engine,
-            columns=columns,
-            indexes=data["indexes"],
-            new_columns_detected=data["new_columns_detected"],
-            quarantine_rows=data["quarantine_rows"],
-        )
+        return _convert(cls, data)
+
+
+@dataclass(slots=True)
+class DataSourceStats:
+    row_count: Optional[int] = None
+    bytes: Optional[int] = None
+
+
+@dataclass(slots=True)
+class DataSourceSummary:
+    """
+    A Data Source in the lightweight listing. `columns`, the type of each
+    column by name, is only set when expanded.
+    """
+
+    id: str
+    name: str
+    row_count: Optional[int] = None
+    columns: Optional[Dict[str, str]] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Pipe:
     type: str
     id: str
     name: str
-    description: Optional[str]
-    endpoint: Optional[str]
-    url: str
+    description: Optional[str] = None
+    endpoint: Optional[str] = None
+    url: Optional[str] = None
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "Pipe":
-        return cls(**data)
+        return _convert(cls, data)
 
 
-@dataclass
+@dataclass(slots=True)
 class PipeData:
     meta: List[Dict[str, str]]
     data: List[Dict[str, Any]]
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "PipeData":
-        return cls(**data)
+        return _convert(cls, data)
+
+    def downsample(self, points: int) -> "PipeData":
+        """Reduce a time series result to at most `points` rows with LTTB."""
+        time_column, value_column = series_columns(self.meta)
+        if value_column is None:
+            return PipeData(meta=self.meta, data=self.data[:points])
+        return PipeData(
+            meta=self.meta, data=lttb(self.data, time_column, value_column, points)
+        )
+
+
+@dataclass(slots=True)
+class _DataSources:
+    datasources: List[DataSource]
+
+
+@dataclass(slots=True)
+class _DataSourceListing:
+    id: str
+    name: str
+    stats: Optional[DataSourceStats] = None
+
+
+@dataclass(slots=True)
+class _DataSourceListings:
+    datasources: List[_DataSourceListing]
+
+
+@dataclass(slots=True)
+class _Pipes:
+    pipes: List[Pipe]
+
+
+@dataclass(slots=True)
+class _PipeDataResponse:
+    meta: List[Dict[str, str]] = field(default_factory=list)
+    data: List[Dict[str, Any]] = field(default_factory=list)
+    rows: Optional[int] = 0
+    statistics: Dict[str, Any] = field(default_factory=dict)
+
+
+_DATA_SOURCES = msgspec.json.Decoder(_DataSources)
+_DATA_SOURCE_LISTINGS = msgspec.json.Decoder(_DataSourceListings)
+_PIPES = msgspec.json.Decoder(_Pipes)
+_PIPE_DATA_RESPONSE = msgspec.json.Decoder(_PipeDataResponse)
+
+
+def _untyped(cls, data: Dict[str, Any]) -> Any:
+    """Build a model without checking types, like the dict based models did."""
+    values = {f.name: data[f.name] for f in fields(cls) if f.name in data}
+    if cls is DataSource and isinstance(values.get("engine"), dict):
+        values["engine"] = _untyped(Engine, values["engine"])
+    if cls is DataSource and isinstance(values.get("columns"), list):
+        values["columns"] = [
+            _untyped(Column, column) if isinstance(column, dict) else column
+            for column in values["columns"]
+        ]
+    if cls is _DataSourceListing and isinstance(values.get("stats"), dict):
+        values["stats"] = _untyped(DataSourceStats, values["stats"])
+    return cls(**values)
+
+
+def _convert(cls, data: Dict[str, Any]) -> Any:
+    try:
+        return msgspec.convert(data, cls)
+    except msgspec.ValidationError as e:
+        logger.warning(f"Decoding {cls.__name__} without types: {e}")
+        return _untyped(cls, data)
+
+
+def _downsample_response(
+    response: Dict[str, Any], points: Optional[int]
+) -> Dict[str, Any]:
+    if not points:
+        return response
+    series = PipeData(
+        meta=response.get("meta", []), data=response.get("data", [])
+    ).downsample(points)
+    return {**response, "data": series.data, "rows": len(series.data)}
+
+
+def _lru_get(cache: OrderedDict, key: str) -> Any:
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _lru_put(cache: OrderedDict, key: str, value: Any):
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > MAX_CACHED_RESOURCES:
+        cache.popitem(last=False)
+
+
+def _decode_list(
+    decoder: msgspec.json.Decoder, cls, content: bytes, key: str
+) -> List[Any]:
+    """Decode the `key` list of models, untyped when it doesn't match."""
+    try:
+        return getattr(decoder.decode(content), key)
+    except msgspec.ValidationError as e:
+        logger.warning(f"Decoding {key} without types: {e}")
+        return [_untyped(cls, item) for item in json.loads(content)[key]]
+
+
+# Module level so they can be sent to a process pool
+def _decode_datasources(content: bytes) -> List[DataSource]:
+    return _decode_list(_DATA_SOURCES, DataSource, content, "datasources")
+
+
+def _decode_datasource_summaries(content: bytes) -> List[DataSourceSummary]:
+    return [
+        DataSourceSummary(ds.id, ds.name, ds.stats.row_count if ds.stats else None)
+        for ds in _decode_list(
+            _DATA_SOURCE_LISTINGS, _DataSourceListing, content, "datasources"
+        )
+    ]
+
+
+def _decode_pipes(content: bytes) -> List[Pipe]:
+    return _decode_list(_PIPES, Pipe, content, "pipes")
+
+
+def _decode_pipe_data(content: bytes) -> _PipeDataResponse:
+    try:
+        return _PIPE_DATA_RESPONSE.decode(content)
+    except msgspec.ValidationError as e:
+        logger.warning(f"Decoding Pipe data without types: {e}")
+        return _untyped(_PipeDataResponse, json.loads(content))
 
 
 class APIClient:
-    def __init__(self, api_url: str, token: str):
+    def __init__(
+        self,
+        api_url: str,
+        token: str,
+        metadata_poll_interval: Optional[float] = None,
+        max_concurrent_requests: Optional[int] = None,
+        query_timeout: Optional[float] = None,
+        offloader: Optional[Offloader] = None,
+        cassette: Optional[Cassette] = None,
+    ):
         self.api_url = api_url.rstrip("/")
         self.token = token
+        # Records upstream requests, or replays them offline
+        self.cassette = cassette
         self.client = httpx.AsyncClient(
+            transport=self._transport(),
             timeout=30.0,
             headers={"Accept": "application/json", "User-Agent": "Python/APIClient"},
         )
-        self.insights: list[str] = []
-
-    def _synthesize_memo(self) -> str:
-        if not self.insights:
-            return "No insights have been discovered yet."
+        self._semaphore = (
+            asyncio.Semaphore(max_concurrent_requests)
+            if max_concurrent_requests
+            else None
+        )
+        # Runs the decoding of large responses off the event loop
+        self.offloader = offloader or Offloader()
 
-        insights = "\n".join(f"- {insight}" for insight in self.insights)
+        # Default deadline for SQL queries, and the hook used to stop queries
+        # abandoned by the client, called with the query id
+        self.query_timeout = query_timeout
+        self.query_killer: Optional[Callable[[str], Awaitable[None]]] = None
+        self._background_tasks: set[asyncio.Task] = set()
+        self.query_log = QueryLog()
+        # Pipe Endpoint requests, aggregated by Pipe name
+        self.pipe_log = QueryLog()
+        self.incremental_cache = IncrementalCache()
 
-        memo = "📊 Analysis Memo 📊\n\n"
-        memo += "Key Insights Discovered:\n\n"
-        memo += insights
+        # Workspace metadata cache, only populated while metadata polling runs
+        self.metadata_poll_interval = metadata_poll_interval
+        self.on_metadata_changed: Optional[
+            Callable[[Dict[str, List[str]]], Awaitable[None]]
+        ] = None
+        self._datasources: Optional[Dict[str, DataSource]] = None
+        self._pipes: Optional[Dict[str, Pipe]] = None
+        self._fingerprints: Dict[str, Dict[str, str]] = {}
+        self._poll_task: Optional[asyncio.Task] = None
 
-        if len(self.insights) > 1:
-            memo += "\nSummary:\n"
-            memo += f"Analysis has revealed {len(self.insights)} key insights."
+        # Rendered resources by URI, as (version, text), and ETag'd responses,
+        # the least recently used ones evicted past MAX_CACHED_RESOURCES
+        self._resources: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._etags: "OrderedDict[str, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        # Pipe parameters by Pipe name, as (version, fetched at, parameters)
+        self._pipe_params: Dict[str, Tuple[str, float, Dict[str, PipeParam]]] = {}
 
-        return memo
+    def _transport(self) -> Optional[httpx.AsyncBaseTransport]:
+        if self.cassette is None:
+            return None
+        return self.cassette.transport(secrets=[self.token])
 
     async def __aenter__(self):
         return self
@@ -141,25 +388,225 @@ class APIClient:
 
     async def close(self):
         """Close the underlying HTTP client."""
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
         await self.client.aclose()
 
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, waiting for a free slot when concurrency is limited."""
+        if self._semaphore is None:
+            return await self.client.request(method, url, **kwargs)
+        async with self._semaphore:
+            return await self.client.request(method, url, **kwargs)
+
+    def start_metadata_polling(self):
+        """
+        Prefetch Data Sources and Pipes in the background and keep them fresh.
+
+        Must be called from a running event loop. It's a no-op when no poll
+        interval was configured or polling is already running.
+        """
+        if not self.metadata_poll_interval or self._poll_task is not None:
+            return
+        self._poll_task = asyncio.create_task(self._poll_metadata())
+
+    async def _poll_metadata(self):
+        while True:
+            try:
+                changed = await self.refresh_metadata()
+                if changed and self.on_metadata_changed is not None:
+                    await self.on_metadata_changed(changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling workspace metadata: {e}")
+            await asyncio.sleep(self.metadata_poll_interval)
+
+    async def refresh_metadata(self) -> Dict[str, List[str]]:
+        """
+        Compare a fingerprint of the Data Sources and Pipes listings with the
+        previous one and refresh only what changed.
+
+        Returns the names of the Data Sources and Pipes that were added or
+        modified since the previous refresh, keyed by "datasources" and
+        "pipes". A kind is only present when its listing changed. The first
+        refresh only warms the cache.
+        """
+        changed: Dict[str, List[str]] = {}
+
+        response = await self._get("v0/datasources", {"attrs": "id,updated_at"})
+        fingerprint = {
+            ds["id"]: ds.get("updated_at", "") for ds in response["datasources"]
+        }
+        previous = self._fingerprints.get("datasources")
+        if fingerprint != previous:
+            if self._datasources is None:
+                datasources = await self._list_data_sources()
+                self._datasources = {ds.id: ds for ds in datasources}
+                stale = []
+            else:
+                stale = [id for id, v in fingerprint.items() if previous.get(id) != v]
+                details = await asyncio.gather(
+                    *(self._get(f"v0/datasources/{id}") for id in stale)
+                )
+                for data in details:
+                    datasource = DataSource.from_dict(data)
+                    self._datasources[datasource.id] = datasource
+                for id in set(self._datasources) - set(fingerprint):
+                    del self._datasources[id]
+            self._fingerprints["datasources"] = fingerprint
+            if previous is not None:
+                changed["datasources"] = [
+                    self._datasources[id].name
+                    for id in stale
+                    if id in self._datasources
+                ]
+
+        response = await self._get("v0/pipes", {"attrs": "id,updated_at"})
+        fingerprint = {
+            pipe["id"]: pipe.get("updated_at", "") for pipe in response["pipes"]
+        }
+        previous = self._fingerprints.get("pipes")
+        if fingerprint != previous:
+            if self._pipes is None:
+                self._pipes = {pipe.id: pipe for pipe in await self._list_pipes()}
+                stale = []
+            else:
+                stale = [id for id, v in fingerprint.items() if previous.get(id) != v]
+                details = await asyncio.gather(
+                    *(self._get(f"v0/pipes/{id}") for id in stale)
+                )
+                for data in details:
+                    pipe = Pipe.from_dict(data)
+                    self._pipes[pipe.id] = pipe
+                for id in set(self._pipes) - set(fingerprint):
+                    del self._pipes[id]
+            self._fingerprints["pipes"] = fingerprint
+            if previous is not None:
+                changed["pipes"] = [
+                    self._pipes[id].name for id in stale if id in self._pipes
+                ]
+
+        return changed
+
+    def _metadata_version(self, kind: str, name: str) -> Optional[str]:
+        """The updated_at of a polled Data Source or Pipe, if it's cached."""
+        items = (
+            self._datasources.values()
+            if kind == "datasources" and self._datasources is not None
+            else self._pipes.values()
+            if kind == "pipes" and self._pipes is not None
+            else []
+        )
+        fingerprint = self._fingerprints.get(kind, {})
+        return next(
+            (fingerprint.get(item.id) for item in items if item.name == name), None
+        )
+
+    async def _get_resource(
+        self, uri: str, endpoint: str, render: Callable[[Dict[str, Any]], str]
+    ) -> str:
+        """
+        Render a Tinybird object as a resource, caching it by version.
+
+        The version is the updated_at tracked by metadata polling when it
+        runs, so unchanged resources are served without calling the API.
+        Otherwise the response is revalidated upstream with its ETag.
+        """
+        kind, name = uri.replace("tinybird://", "").split("/", 1)
+        version = self._metadata_version(kind, name)
+        cached = _lru_get(self._resources, uri)
+        if version is not None and cached is not None and cached[0] == version:
+            return cached[1]
+
+        data = await self._get_cached(endpoint)
+        text = render(data)
+        _lru_put(self._resources, uri, (version or data.get("updated_at", ""), text))
+        return text
+
+    async def get_data_source_resource(self, datasource_name: str) -> str:
+        """Get a Data Source as a .datasource datafile."""
+        return await self._get_resource(
+            f"tinybird://datasources/{datasource_name}",
+            f"v0/datasources/{datasource_name}",
+            render_datasource,
+        )
+
+    async def get_pipe_resource(self, pipe_name: str) -> str:
+        """Get a Pipe as a .pipe datafile."""
+        return await self._get_resource(
+            f"tinybird://pipes/{pipe_name}",
+            f"v0/pipes/{pipe_name}",
+            render_pipe,
+        )
+
     @log_function_call
-    async def _get(
+    async def _get_cached(
         self, endpoint: str, params: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
+        """Like _get, but revalidates a previous response with its ETag."""
+        if params is None:
+            params = {}
+        url = f"{self.api_url}/{endpoint}"
+        key = f"{url}?{sorted(params.items())}"
+        params["token"] = self.token
+        params["__tb__client"] = "mcp-tinybird"
+
+        cached = _lru_get(self._etags, key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = await self._request("GET", url, params=params, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        try:
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error in _get_cached: {e}")
+            raise Exception(response.json().get("error", str(e))) from e
+        data = await self._decode(json.loads, response.content)
+        etag = response.headers.get("ETag")
+        if etag:
+            _lru_put(self._etags, key, (etag, data))
+        return data
+
+    async def _get(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        response = await self._get_response(endpoint, params, timeout=timeout)
+        return await self._decode(json.loads, response.content)
+
+    async def _decode(self, decode: Callable[[bytes], Any], content: bytes) -> Any:
+        """Decode a response body, off the event loop when it's large."""
+        return await self.offloader.run(decode, content, size=len(content))
+
+    @log_function_call
+    async def _get_response(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> httpx.Response:
         if params is None:
             params = {}
         params["token"] = self.token
         params["__tb__client"] = "mcp-tinybird"
 
         url = f"{self.api_url}/{endpoint}"
-        response = await self.client.get(url, params=params)
+        response = await self._request(
+            "GET",
+            url,
+            params=params,
+            timeout=timeout if timeout else httpx.USE_CLIENT_DEFAULT,
+        )
         try:
             response.raise_for_status()
         except Exception as e:
             logger.error(f"Error in _get: {e}")
             raise Exception(response.json().get("error", str(e))) from e
-        return response.json()
+        return response
 
     @log_function_call
     async def _post(
@@ -171,15 +618,91 @@ class APIClient:
         params["__tb__client"] = "mcp-tinybird"
 
         url = f"{self.api_url}/{endpoint}"
-        response = await self.client.get(url, params=params)
+        response = await self._request("GET", url, params=params)
         response.raise_for_status()
         return response.json()
 
     async def list_data_sources(self) -> List[DataSource]:
         """List all available data sources."""
+        if self._datasources is not None:
+            return list(self._datasources.values())
+        return await self._list_data_sources()
+
+    async def _list_data_sources(self) -> List[DataSource]:
         params = {"attrs": "id,name,description,columns"}
-        response = await self._get("v0/datasources", params)
-        return [DataSource.from_dict(ds) for ds in response["datasources"]]
+        response = await self._get_response("v0/datasources", params)
+        return await self._decode(_decode_datasources, response.content)
+
+    async def list_data_source_summaries(
+        self, name: Optional[str] = None
+    ) -> List[DataSourceSummary]:
+        """
+        List the ids, names and row counts of the Data Sources, sorted by name,
+        optionally only those whose name contains `name`.
+
+        Only those attributes are requested, so the response stays small in
+        Workspaces with many wide Data Sources.
+        """
+        params = {"attrs": "id,name,stats"}
+        response = await self._get_response("v0/datasources", params)
+        summaries = await self._decode(_decode_datasource_summaries, response.content)
+        if name:
+            summaries = [ds for ds in summaries if name.lower() in ds.name.lower()]
+        return sorted(summaries, key=lambda ds: ds.name)
+
+    async def get_data_source_columns(self, datasource_name: str) -> List[Column]:
+        """
+        Get the columns of one Data Source, from the metadata cache when
+        polling runs and otherwise revalidating the previous response.
+        """
+        if self._datasources is not None:
+            for datasource in self._datasources.values():
+                if datasource.name == datasource_name:
+                    return datasource.columns
+        data = await self._get_cached(
+            f"v0/datasources/{datasource_name}", {"attrs": "columns"}
+        )
+        return msgspec.convert(data.get("columns", []), List[Column])
+
+    async def list_data_sources_page(
+        self,
+        name: Optional[str] = None,
+        offset: int = 0,
+        limit: int = DATA_SOURCES_PAGE_SIZE,
+        expand: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        A page of the lightweight Data Sources listing. Columns are only
+        fetched for the Data Sources of the page named in `expand`, the names
+        that aren't in the page are returned in `expand_not_found`.
+        """
+        if offset < 0:
+            raise ValueError(f"offset must be 0 or greater, got {offset}")
+        if limit < 1:
+            raise ValueError(f"limit must be 1 or greater, got {limit}")
+        summaries = await self.list_data_source_summaries(name)
+        page = summaries[offset : offset + limit]
+        expand = list(dict.fromkeys(expand or []))
+        expanded = [ds for ds in page if ds.name in expand]
+        columns = await asyncio.gather(
+            *(self.get_data_source_columns(ds.name) for ds in expanded)
+        )
+        for datasource, datasource_columns in zip(expanded, columns):
+            datasource.columns = {
+                column.name: column.type for column in datasource_columns
+            }
+        result: Dict[str, Any] = {
+            "datasources": page,
+            "total": len(summaries),
+            "offset": offset,
+        }
+        if offset + limit < len(summaries):
+            result["next_offset"] = offset + limit
+        names = {ds.name for ds in page}
+        not_found = [name for name in expand if name not in names]
+        if not_found:
+            result["expand_not_found"] = not_found
+        return result
 
     async def get_data_source(self, datasource_id: str) -> Dict[str, Any]:
         """Get detailed information about a specific data source."""
@@ -190,30 +713,349 @@ class APIClient:
 
     async def list_pipes(self) -> List[Pipe]:
         """List all available pipes."""
+        if self._pipes is not None:
+            return list(self._pipes.values())
+        return await self._list_pipes()
+
+    async def _list_pipes(self) -> List[Pipe]:
         params = {"attrs": "id,name,description,type,endpoint"}
-        response = await self._get("v0/pipes", params)
-        return [Pipe.from_dict(pipe) for pipe in response["pipes"]]
+        response = await self._get_response("v0/pipes", params)
+        return await self._decode(_decode_pipes, response.content)
 
     async def get_pipe(self, pipe_name: str) -> Dict[str, Any]:
         """Get detailed information about a specific pipe."""
         return await self._get(f"v0/pipes/{pipe_name}")
 
+    async def get_pipe_params(self, pipe_name: str) -> Dict[str, PipeParam]:
+        """
+        Get the typed parameters of a Pipe, parsed from its nodes templating
+        once per Pipe version.
+        """
+        version = self._metadata_version("pipes", pipe_name)
+        cached = self._pipe_params.get(pipe_name)
+        if cached is not None:
+            cached_version, fetched_at, params = cached
+            if version is not None and cached_version == version:
+                return params
+            if version is None and time.monotonic() - fetched_at < PIPE_PARAMS_TTL:
+                return params
+
+        data = await self._get_cached(f"v0/pipes/{pipe_name}")
+        version = version or data.get("updated_at", "")
+        if cached is not None and cached[0] == version:
+            params = cached[2]
+        else:
+            params = parse_pipe_params(data.get("nodes", []))
+        self._pipe_params[pipe_name] = (version, time.monotonic(), params)
+        return params
+
+    async def validate_pipe_params(
+        self, pipe_name: str, params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Validate and coerce Pipe Endpoint parameters locally, raising a
+        ValueError that describes every wrong or missing parameter.
+
+        When the parameters schema can't be fetched, `params` are passed
+        through as they are and the endpoint validates them.
+        """
+        try:
+            schema = await self.get_pipe_params(pipe_name)
+        except Exception as e:
+            logger.warning(f"Not validating parameters of {pipe_name}: {e}")
+            return params
+        return coerce_pipe_params(schema, params)
+
     async def get_pipe_data(self, pipe_name: str, **params) -> PipeData:
         """Get data from a pipe with optional parameters."""
-        response = await self._get(f"v0/pipes/{pipe_name}.json", params)
-        return PipeData.from_dict(
-            {key: response[key] for key in ["meta", "data"] if key in response}
+        start = time.monotonic()
+        raw = await self._get_response(f"v0/pipes/{pipe_name}.json", params)
+        response = await self._decode(_decode_pipe_data, raw.content)
+        self.pipe_log.record(
+            pipe_name,
+            time.monotonic() - start,
+            {"rows": response.rows, "statistics": response.statistics},
+            len(raw.content),
+            key=pipe_name,
         )
+        return PipeData(meta=response.meta, data=response.data)
 
-    async def run_select_query(self, query: str, **kwargs: Any) -> Dict[str, Any]:
-        """Run a SQL SELECT query."""
+    async def run_select_query(
+        self,
+        query: str,
+        timeout: Optional[float] = None,
+        record: bool = True,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        """
+        Run a SQL SELECT query.
+
+        `timeout` (or the client `query_timeout`) is sent upstream as
+        `max_execution_time`. If the call is cancelled the query is killed.
+        Queries the server runs on its own, like probes and profiles, pass
+        `record=False` so they're not mistaken for traffic in `query_log`.
+        """
         kwargs = kwargs or {}
-        params = {"q": f"{query} FORMAT JSON", **kwargs}
-        return await self._get("v0/sql", params)
+        timeout = timeout or self.query_timeout
+        query_id = uuid.uuid4().hex
+        params = {"q": f"{query} FORMAT JSON", "query_id": query_id, **kwargs}
+        if timeout:
+            params["max_execution_time"] = math.ceil(timeout)
+        start = time.monotonic()
+        try:
+            response = await self._get_response(
+                "v0/sql",
+                params,
+                timeout=timeout + QUERY_TIMEOUT_MARGIN if timeout else None,
+            )
+        except asyncio.CancelledError:
+            task = asyncio.ensure_future(self.kill_query(query_id))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+            raise
+        result = await self._decode(json.loads, response.content)
+        if record:
+            self.query_log.record(
+                query, time.monotonic() - start, result, len(response.content)
+            )
+        return result
+
+    async def kill_query(self, query_id: str):
+        """
+        Stop a query abandoned by the client.
+
+        Tinybird has no public API to kill a query, so unless a `query_killer`
+        is set the query is only bounded by its `max_execution_time`.
+        """
+        if self.query_killer is None:
+            logger.info(f"Abandoned query {query_id}, not killed")
+            return
+        try:
+            await self.query_killer(query_id)
+            logger.info(f"Killed query {query_id}")
+        except Exception as e:
+            logger.error(f"Error killing query {query_id}: {e}")
+
+    async def _sorting_key_time_columns(self, query: str) -> List[str]:
+        """
+        The Date/DateTime columns in the sorting keys of the Data Sources a
+        query reads from, the ones Tinybird can skip granules by.
+        """
+        tables = source_tables(query)
+        datasources = await asyncio.gather(
+            *(self._get_cached(f"v0/datasources/{name}") for name in tables),
+            return_exceptions=True,
+        )
+        time_columns: List[str] = []
+        for datasource in datasources:
+            if isinstance(datasource, Exception):
+                continue
+            types = {
+                column["name"]: column.get("type", "")
+                for column in datasource.get("columns") or []
+            }
+            sorting_key = (datasource.get("engine") or {}).get("engine_sorting_key")
+            time_columns += [
+                column
+                for column in sorting_key_columns(sorting_key, set(types))
+                if column_kind(types[column]) == "temporal"
+            ]
+        return time_columns
+
+    async def downsample_select_query(
+        self, query: str, points: int, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Run a SQL SELECT query returning at most `points` rows of a time series.
+
+        When the result has a Date/DateTime column and a numeric column, the
+        min/max rows of each time bucket are selected in Tinybird so the
+        transfer is bounded too. The time column is the one of the sorting
+        key of the Data Source read, when the result has it. Without a time
+        column, results of up to MAX_LOCAL_DOWNSAMPLE_ROWS rows are fetched
+        and downsampled locally with LTTB, and larger ones are an error.
+        Without a numeric column the first `points` rows are returned.
+        """
+        probe, preferred = await asyncio.gather(
+            self.run_select_query(
+                f"SELECT * FROM ({query}) LIMIT 0", timeout=timeout, record=False
+            ),
+            self._sorting_key_time_columns(query),
+        )
+        time_column, value_column = series_columns(probe.get("meta", []), preferred)
+        if value_column is None:
+            return await self.run_select_query(
+                f"SELECT * FROM ({query}) LIMIT {points}", timeout=timeout
+            )
+        if time_column is None:
+            response = await self.run_select_query(
+                f"SELECT * FROM ({query}) LIMIT {MAX_LOCAL_DOWNSAMPLE_ROWS + 1}",
+                timeout=timeout,
+            )
+            data = response.get("data", [])
+            if len(data) > MAX_LOCAL_DOWNSAMPLE_ROWS:
+                raise ValueError(
+                    f"The result has more than {MAX_LOCAL_DOWNSAMPLE_ROWS} rows "
+                    "and no Date or DateTime column to downsample it by in "
+                    "Tinybird. Select a time column, or aggregate the query"
+                )
+            response["data"] = lttb(data, None, value_column, points)
+            response["rows"] = len(response["data"])
+            return response
+
+        response = await self.run_select_query(
+            build_minmax_query(query, time_column, value_column, points),
+            timeout=timeout,
+            record=False,
+        )
+        response["data"] = lttb(
+            response.get("data", []), time_column, value_column, points
+        )
+        response["rows"] = len(response["data"])
+        return response
+
+    async def run_incremental_query(
+        self,
+        query: str,
+        time_column: Optional[str] = None,
+        timeout: Optional[float] = None,
+        downsample: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run a SQL SELECT query grouped by a time bucket, reusing the buckets
+        fetched by its previous run.
+
+        Only the buckets from the last one fetched (which might have been
+        incomplete) on are queried and merged into the cached result.
+        `time_column` defaults to the first Date/DateTime column. Queries with
+        a LIMIT, or ordered by other columns, are always run in full. The
+        result is downsampled to `downsample` rows after the merge.
+        """
+        key = f"{time_column or ''}\0{query}"
+        entry = self.incremental_cache.get(key)
+        if entry is None or not entry.response.get("data"):
+            response = await self.run_select_query(query, timeout=timeout)
+            if time_column is None:
+                time_column, _ = series_columns(response.get("meta", []))
+            if time_column is None:
+                raise ValueError(
+                    "Incremental queries need a Date or DateTime time bucket column"
+                )
+            columns = [column["name"] for column in response.get("meta", [])]
+            if time_column not in columns:
+                raise ValueError(
+                    f"The time column {time_column} is not in the result, "
+                    f"its columns are {columns}"
+                )
+            reason = unsupported_clause(query, time_column)
+            if reason is None:
+                self.incremental_cache.put(key, response, time_column)
+            else:
+                response = {
+                    **response,
+                    "incremental": {"skipped": f"Ran in full, {reason}"},
+                }
+            return _downsample_response(response, downsample)
+
+        since = max(row[entry.time_column] for row in entry.response["data"])
+        type_name = next(
+            (
+                column["type"]
+                for column in entry.response.get("meta", [])
+                if column["name"] == entry.time_column
+            ),
+            None,
+        )
+        tail = await self.run_select_query(
+            build_tail_query(query, entry.time_column, since, type_name),
+            timeout=timeout,
+        )
+        data = merge_rows(entry, since, tail.get("data", []))
+        response = {**tail, "data": data, "rows": len(data)}
+        self.incremental_cache.update(key, response)
+        return _downsample_response(
+            {
+                **response,
+                "incremental": {"since": since, "rows_fetched": tail.get("rows", 0)},
+            },
+            downsample,
+        )
+
+    async def profile_query(
+        self, query: str, top_k: int = 5, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Profile the columns of a SQL SELECT query without fetching its rows."""
+        probe = await self.run_select_query(
+            f"SELECT * FROM ({query}) LIMIT 0", timeout=timeout, record=False
+        )
+        columns = probe.get("meta", [])
+        if not columns:
+            return {"rows": 0, "columns": {}}
+        response = await self.run_select_query(
+            build_profile_query(query, columns, top_k=top_k),
+            timeout=timeout,
+            record=False,
+        )
+        data = response.get("data") or [{}]
+        return summarize_profile(columns, data[0])
+
+    async def advise_datasource(
+        self, datasource_name: str, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Suggest sorting key, skip index and materialized Pipe changes for a
+        Data Source from the filters and group bys of the recorded SQL
+        queries and Pipe Endpoint requests that read from it.
+        """
+        datasource = await self._get_cached(f"v0/datasources/{datasource_name}")
+        columns = {column["name"] for column in datasource.get("columns", [])}
+        patterns = [
+            access_pattern(stats.fingerprint, stats.fingerprint, stats, columns)
+            for stats in list(self.query_log.stats.values())
+            if reads_from(stats.fingerprint, datasource_name)
+        ]
+
+        pipe_stats = list(self.pipe_log.stats.values())
+        pipes = await asyncio.gather(
+            *(self._get_cached(f"v0/pipes/{s.fingerprint}") for s in pipe_stats),
+            return_exceptions=True,
+        )
+        for stats, pipe in zip(pipe_stats, pipes):
+            if isinstance(pipe, Exception):
+                logger.info(f"Skipping Pipe {stats.fingerprint}: {pipe}")
+                continue
+            sql = "\n".join(
+                strip_templates(node.get("sql") or "") for node in pipe.get("nodes", [])
+            )
+            if reads_from(sql, datasource_name):
+                patterns.append(
+                    access_pattern(f"pipe:{stats.fingerprint}", sql, stats, columns)
+                )
+
+        if not patterns:
+            return {
+                "datasource": datasource_name,
+                "suggestions": [],
+                "message": "No recorded queries or Pipe requests read from this "
+                "Data Source yet. Run the usual queries through run-select-query "
+                "or request-pipe-data first",
+            }
+
+        candidates = candidate_columns(patterns)
+        response = await self.run_select_query(
+            cardinality_query(datasource_name, candidates),
+            timeout=timeout,
+            record=False,
+        )
+        row = (response.get("data") or [{}])[0]
+        cardinality = {
+            column: int(row.get(f"c{i}") or 0) for i, column in enumerate(candidates)
+        }
+        return advise(datasource, patterns, cardinality, int(row.get("__rows") or 0))
 
     async def llms(self, query: str) -> Dict[str, Any]:
         url = "https://www.tinybird.co/docs/llms-full.txt"
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(transport=self._transport()) as client:
             response = await client.get(url)
             response.raise_for_status()
             return response.text
@@ -227,12 +1069,162 @@ class APIClient:
         params = {"name": datasource_name, "token": self.token}
 
         try:
-            response = await self.client.post(url, params=params, data=data)
+            response = await self._request("POST", url, params=params, data=data)
             response.raise_for_status()
             return response.text
         except Exception as e:
             raise ValueError(str(e))
 
+    async def append_chunk(
+        self, datasource_name: str, data: bytes, format: str, compressed: bool
+    ) -> Dict[str, Any]:
+        """
+        Append one chunk with the Data Sources API, retrying rate limits and
+        transient errors.
+        """
+        url = f"{self.api_url}/v0/datasources"
+        params = {
+            "name": datasource_name,
+            "mode": "append",
+            "format": format,
+            "token": self.token,
+            "__tb__client": "mcp-tinybird",
+        }
+        filename = f"chunk.{format}.gz" if compressed else f"chunk.{format}"
+        for attempt in range(APPEND_RETRIES + 1):
+            try:
+                response = await self._request(
+                    "POST",
+                    url,
+                    params=params,
+                    files={format: (filename, data, "application/octet-stream")},
+                    timeout=APPEND_TIMEOUT,
+                )
+            except httpx.TransportError as e:
+                if attempt == APPEND_RETRIES:
+                    raise ValueError(f"Error appending to {datasource_name}: {e}")
+                delay = 2**attempt
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                if attempt == APPEND_RETRIES or (
+                    response.status_code != 429 and response.status_code < 500
+                ):
+                    try:
+                        error = response.json().get("error", response.text)
+                    except ValueError:
+                        error = response.text
+                    raise ValueError(f"Error appending to {datasource_name}: {error}")
+                delay = float(response.headers.get("Retry-After") or 2**attempt)
+            logger.warning(
+                f"Retrying append to {datasource_name} in {delay}s "
+                f"(attempt {attempt + 1} of {APPEND_RETRIES})"
+            )
+            await asyncio.sleep(delay)
+
+    async def append_file(
+        self,
+        datasource_name: str,
+        file_path: str,
+        format: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        parallel: int = DEFAULT_PARALLEL_UPLOADS,
+        resume: bool = True,
+        progress_dir: str = DEFAULT_PROGRESS_DIR,
+    ) -> Dict[str, Any]:
+        """
+        Stream a local CSV, NDJSON or Parquet file to a Data Source.
+
+        The file is read in chunks of about `chunk_size` bytes cut at record
+        boundaries, CSV and NDJSON chunks are gzipped, and up to `parallel`
+        chunks are uploaded at once, so memory stays bounded by the chunks in
+        flight. Appended chunks are recorded, and when `resume` is set a
+        failed append picks up from the first chunk not appended.
+        """
+        format = detect_format(file_path, format)
+        progress = await asyncio.to_thread(
+            AppendProgress.load,
+            file_path,
+            datasource_name,
+            format,
+            chunk_size,
+            progress_dir,
+        )
+        if not resume:
+            progress.completed = {}
+        chunks = iter_chunks(file_path, format, chunk_size, dict(progress.completed))
+        compressed = format != "parquet"
+        summary = {
+            "datasource": datasource_name,
+            "file": progress.key["file"],
+            "format": format,
+            "chunks": 0,
+            "resumed_chunks": 0,
+            "bytes_read": 0,
+            "bytes_sent": 0,
+            "quarantined_rows": 0,
+            "invalid_lines": 0,
+        }
+        started = time.monotonic()
+
+        async def upload(chunk: Chunk):
+            data = chunk.data
+            if compressed:
+                data = await self.offloader.run(
+                    gzip.compress, data, APPEND_COMPRESSION_LEVEL, size=len(data)
+                )
+            result = await self.append_chunk(datasource_name, data, format, compressed)
+            # One save at a time, they rewrite the same file
+            async with saving:
+                await asyncio.to_thread(progress.complete, chunk)
+            summary["bytes_sent"] += len(data)
+            summary["quarantined_rows"] += result.get("quarantine_rows") or 0
+            summary["invalid_lines"] += result.get("invalid_lines") or 0
+
+        saving = asyncio.Lock()
+        uploads: set[asyncio.Task] = set()
+        reading: Optional[asyncio.Future] = None
+        try:
+            while True:
+                # Reading, and encoding Parquet, runs in a thread. It's shielded
+                # so a cancellation doesn't leave the generator running there
+                reading = asyncio.ensure_future(asyncio.to_thread(next, chunks, None))
+                chunk = await asyncio.shield(reading)
+                if chunk is None:
+                    break
+                summary["chunks"] += 1
+                if chunk.data is None:
+                    summary["resumed_chunks"] += 1
+                    continue
+                summary["bytes_read"] += len(chunk.data)
+                uploads.add(asyncio.create_task(upload(chunk)))
+                if len(uploads) >= parallel:
+                    done, uploads = await asyncio.wait(
+                        uploads, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+            for task in asyncio.as_completed(uploads):
+                await task
+        except BaseException as e:
+            for task in uploads:
+                task.cancel()
+            if isinstance(e, Exception):
+                raise ValueError(
+                    f"{e}. {len(progress.completed)} chunks of {file_path} were "
+                    "appended, call append-file again to resume"
+                ) from e
+            raise
+        finally:
+            # The generator can't be closed while it runs in the thread
+            if reading is not None and not reading.done():
+                await asyncio.wait({reading})
+            chunks.close()
+
+        await asyncio.to_thread(progress.remove)
+        summary["elapsed"] = round(time.monotonic() - started, 3)
+        return summary
+
     async def push_datafile(self, files: str):
         url = f"{self.api_url}/v0/datafiles"
 
@@ -253,6 +1245,8 @@ class APIClient:
             "token": self.token,
         }
 
-        response = await self.client.post(url, params=params, files=files_dict)
+        response = await self._request(
+            "POST", url, params=params, files=files_dict
+        )
         response.raise_for_status()
         return response.text
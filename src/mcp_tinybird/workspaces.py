@@ -0,0 +1,125 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .cassette import Cassette
+from .offload import Offloader
+from .tb import APIClient
+
+DEFAULT_WORKSPACE = "default"
+ALL_WORKSPACES = "*"
+
+
+class WorkspaceRegistry:
+    """
+    The Tinybird Workspaces served by this process, each one with its own
+    APIClient (connection pool, metadata cache and concurrency limit).
+    """
+
+    def __init__(self, clients: Dict[str, APIClient], default: str):
+        if default not in clients:
+            raise ValueError(f"Unknown default workspace: {default}")
+        self.clients = clients
+        self.default = default
+
+    @classmethod
+    def from_config(
+        cls,
+        api_url: Optional[str],
+        token: Optional[str],
+        workspaces: Optional[str] = None,
+        metadata_poll_interval: Optional[float] = None,
+        query_timeout: Optional[float] = None,
+        offloader: Optional[Offloader] = None,
+        cassette: Optional[Cassette] = None,
+    ) -> "WorkspaceRegistry":
+        """
+        Build the registry from `TB_API_URL`/`TB_ADMIN_TOKEN`, registered as
+        the "default" Workspace, plus the optional `TB_WORKSPACES` JSON object:
+
+            {"eu": {"api_url": "https://api.tinybird.co", "token": "p.ey...",
+                    "max_concurrent_requests": 8, "query_timeout": 30}}
+
+        When `TB_API_URL` is not set, the first Workspace in `TB_WORKSPACES`
+        is the default one. Every Workspace shares `offloader`, and
+        `cassette` when upstream requests are recorded or replayed.
+        """
+        offloader = offloader or Offloader()
+        clients: Dict[str, APIClient] = {}
+        if api_url:
+            clients[DEFAULT_WORKSPACE] = APIClient(
+                api_url=api_url,
+                token=token,
+                metadata_poll_interval=metadata_poll_interval,
+                query_timeout=query_timeout,
+                offloader=offloader,
+                cassette=cassette,
+            )
+        for name, config in json.loads(workspaces or "{}").items():
+            clients[name] = APIClient(
+                api_url=config["api_url"],
+                token=config["token"],
+                metadata_poll_interval=metadata_poll_interval,
+                max_concurrent_requests=config.get("max_concurrent_requests"),
+                query_timeout=config.get("query_timeout", query_timeout),
+                offloader=offloader,
+                cassette=cassette,
+            )
+        if not clients:
+            raise ValueError("Set TB_API_URL and TB_ADMIN_TOKEN or TB_WORKSPACES")
+        return cls(clients, default=next(iter(clients)))
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.clients)
+
+    def get(self, name: Optional[str] = None) -> APIClient:
+        client = self.clients.get(name or self.default)
+        if client is None:
+            raise ValueError(
+                f"Unknown workspace: {name}. Available workspaces: {self.names}"
+            )
+        return client
+
+    async def fan_out(
+        self, func: Callable[[str], Awaitable[Any]]
+    ) -> Dict[str, Any]:
+        """
+        Run `func(workspace_name)` for every Workspace concurrently.
+
+        Failures don't abort the rest, the exception is returned in place of
+        the result of that Workspace.
+        """
+        results = await asyncio.gather(
+            *(func(name) for name in self.names), return_exceptions=True
+        )
+        return dict(zip(self.names, results))
+
+    def query_stats(
+        self, limit: int = 10, order_by: str = "total_time"
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """The top `limit` query fingerprints of every Workspace."""
+        return {
+            name: client.query_log.top(limit, order_by)
+            for name, client in self.clients.items()
+        }
+
+    def start_metadata_polling(self):
+        """
+        Poll the metadata of the default Workspace only: it's the one served
+        as resources, so it's the one whose changes are notified to clients.
+        """
+        self.get().start_metadata_polling()
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.clients.values()))
+        # The offloader and the cassette are shared by the clients, close each
+        # one once
+        shared = {
+            id(resource): resource
+            for client in self.clients.values()
+            for resource in (client.offloader, client.cassette)
+            if resource is not None
+        }
+        for resource in shared.values():
+            resource.close()
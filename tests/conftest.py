@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from mcp_tinybird.server import create_server
+
+PIPES = [{"id": "p1", "name": "top", "type": "endpoint", "updated_at": "1"}]
+DATASOURCES = [{"id": "d1", "name": "events", "columns": [], "updated_at": "1"}]
+ROWS = {
+    "meta": [{"name": "t", "type": "DateTime"}, {"name": "c", "type": "UInt64"}],
+    "data": [{"t": "2024-01-01 00:00:00", "c": 1}],
+    "rows": 1,
+}
+
+
+def workspace_handler(request: httpx.Request) -> httpx.Response:
+    """
+    A Workspace with one Data Source and one Pipe, where every query returns
+    ROWS, and one that's down.
+    """
+    if request.url.host == "eu":
+        return httpx.Response(500, json={"error": "Workspace unavailable"})
+    if request.url.path == "/v0/datasources":
+        return httpx.Response(200, json={"datasources": DATASOURCES})
+    if request.url.path == "/v0/pipes":
+        return httpx.Response(200, json={"pipes": PIPES})
+    if request.url.path == "/v0/sql":
+        return httpx.Response(200, json=ROWS)
+    return httpx.Response(404, json={"error": "not found"})
+
+
+@pytest.fixture
+def mcp_server(monkeypatch, tmp_path):
+    """
+    Build the MCP server against mocked Workspaces, the default one plus
+    the ones passed as TB_WORKSPACES. Returns the server, its initialization
+    options and the Workspace registry.
+    """
+    registries = []
+
+    def create(workspaces=None, **env):
+        monkeypatch.setenv("TB_API_URL", "http://tinybird")
+        monkeypatch.setenv("TB_ADMIN_TOKEN", "token")
+        monkeypatch.setenv("TB_INSIGHTS_DIR", str(tmp_path / "insights"))
+        # With a cassette, logs aren't shipped to Tinybird
+        monkeypatch.setenv("TB_CASSETTE", str(tmp_path / "cassette.ndjson.gz"))
+        monkeypatch.setenv("TB_CASSETTE_MODE", "record")
+        if workspaces is not None:
+            monkeypatch.setenv("TB_WORKSPACES", json.dumps(workspaces))
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        server, init_options, registry, _ = create_server()
+        for client in registry.clients.values():
+            client.client = httpx.AsyncClient(
+                transport=httpx.MockTransport(workspace_handler)
+            )
+        registries.append(registry)
+        return server, init_options, registry
+
+    yield create
+    for registry in registries:
+        asyncio.run(registry.close())
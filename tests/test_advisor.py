@@ -0,0 +1,190 @@
+import asyncio
+
+import httpx
+
+from mcp_tinybird.advisor import (
+    access_pattern,
+    advise,
+    analyze_sql,
+    candidate_columns,
+    reads_from,
+    sorting_key_columns,
+    strip_templates,
+)
+from mcp_tinybird.query_log import QueryStats
+from mcp_tinybird.tb import APIClient
+
+DATASOURCE = {
+    "name": "events",
+    "engine": {
+        "engine": "MergeTree",
+        "engine_sorting_key": "toDate(timestamp), event",
+        "engine_partition_key": "toYYYYMM(timestamp)",
+    },
+    "columns": [
+        {"name": "timestamp", "type": "DateTime"},
+        {"name": "event", "type": "LowCardinality(String)"},
+        {"name": "customer_id", "type": "String"},
+        {"name": "session_id", "type": "String"},
+        {"name": "url", "type": "String"},
+        {"name": "amount", "type": "Float64"},
+    ],
+}
+COLUMNS = {column["name"] for column in DATASOURCE["columns"]}
+
+
+def _pattern(sql, calls=10, bytes_read=10**9, rows_read=10**7, result_rows=10):
+    stats = QueryStats(
+        fingerprint=sql,
+        example=sql,
+        calls=calls,
+        bytes_read=bytes_read,
+        rows_read=rows_read,
+        result_rows=result_rows,
+    )
+    return access_pattern(sql, sql, stats, COLUMNS)
+
+
+PATTERNS = [
+    _pattern(
+        "SELECT count() FROM events "
+        "WHERE customer_id = 'a' AND timestamp > now() - 3600"
+    ),
+    _pattern(
+        "SELECT event, count() FROM events WHERE session_id = 'x' GROUP BY event",
+        bytes_read=10**8,
+    ),
+    _pattern(
+        "SELECT * FROM events WHERE url LIKE '%/pricing%'",
+        calls=2,
+        bytes_read=10**7,
+        result_rows=1000,
+    ),
+    _pattern(
+        "SELECT * FROM events WHERE hasToken(url, 'docs') AND amount > 10",
+        calls=1,
+        bytes_read=10**6,
+        result_rows=10**6,
+    ),
+]
+CARDINALITY = {"customer_id": 5000, "session_id": 10**6}
+
+
+def test_analyze_sql():
+    filters, group_by = analyze_sql(
+        "SELECT event, count() FROM events "
+        "WHERE customer_id IN (?+) AND url NOT LIKE ? AND timestamp BETWEEN ? AND ? "
+        "AND (amount >= ? OR event = ?) "
+        "AND session_id IN (SELECT session_id FROM sessions) "
+        "GROUP BY event, toDate(timestamp) ORDER BY event",
+        COLUMNS,
+    )
+    assert filters == {
+        "customer_id": {"equality"},
+        "url": {"other"},
+        "timestamp": {"range"},
+        "amount": {"range"},
+        "event": {"equality"},
+        "session_id": {"equality"},
+    }
+    assert group_by == ["event", "timestamp"]
+
+
+def test_templates_and_sources():
+    sql = strip_templates(
+        "SELECT * FROM `events` WHERE event = {{ String(event, 'click') }}"
+        "{% if defined(day) %} AND toDate(timestamp) = {{ Date(day) }}{% end %}"
+    )
+    assert sql == "SELECT * FROM `events` WHERE event = ?  AND toDate(timestamp) = ? "
+    assert reads_from(sql, "events")
+    assert not reads_from(sql, "event")
+    assert not reads_from("SELECT * FROM events_mv", "events")
+
+
+def test_sorting_key_columns():
+    key = "toDate(timestamp), cityHash64(customer_id), event"
+    assert sorting_key_columns(key, COLUMNS) == ["timestamp", "customer_id", "event"]
+    assert sorting_key_columns("", COLUMNS) == []
+
+
+def test_candidate_columns_are_the_equality_filters():
+    assert candidate_columns(PATTERNS) == ["customer_id", "session_id"]
+
+
+def test_advise():
+    advice = advise(DATASOURCE, PATTERNS, CARDINALITY, rows=10**8)
+    assert advice["observed"]["calls"] == 23
+    assert advice["observed"]["group_by"] == {"event": 10}
+    sorting, *indexes, materialized = advice["suggestions"]
+
+    assert sorting["type"] == "sorting_key"
+    assert sorting["current"] == "toDate(timestamp), event"
+    assert sorting["suggested"] == "customer_id, timestamp, event"
+    assert sorting["estimated_reduction_ratio"] == 0.9
+
+    assert [index["index"] for index in indexes] == [
+        "idx_session_id `session_id` TYPE bloom_filter(0.01) GRANULARITY 4",
+        "idx_url `url` TYPE ngrambf_v1(3, 10240, 3, 0) GRANULARITY 4",
+        "idx_amount `amount` TYPE minmax GRANULARITY 4",
+    ]
+    assert indexes[0]["estimated_bytes_read_reduction"] > 0
+    assert indexes[1]["estimated_bytes_read_reduction"] is None
+
+    assert materialized["type"] == "materialized_pipe"
+    assert materialized["target_datasource"] == "events_by_event_session_id_mv"
+    assert "ENGINE" not in materialized["pipe"]
+    assert "DATASOURCE events_by_event_session_id_mv" in materialized["pipe"]
+    assert materialized["datasource"] == (
+        "SCHEMA >\n"
+        "    `event` LowCardinality(String),\n"
+        "    `session_id` String,\n"
+        "    `count` AggregateFunction(count)\n"
+        "\n"
+        'ENGINE "AggregatingMergeTree"\n'
+        'ENGINE_SORTING_KEY "event, session_id"'
+    )
+
+
+def test_no_sorting_key_change_when_the_key_already_prunes():
+    datasource = {
+        **DATASOURCE,
+        "engine": {"engine": "MergeTree", "engine_sorting_key": "customer_id"},
+    }
+    patterns = [_pattern("SELECT count() FROM events WHERE customer_id = 'a'")]
+    assert advise(datasource, patterns, CARDINALITY, rows=10**8)["suggestions"] == []
+
+
+def test_only_merge_trees_get_storage_suggestions():
+    datasource = {**DATASOURCE, "engine": {"engine": "Null"}}
+    advice = advise(datasource, PATTERNS, CARDINALITY, rows=10**8)
+    assert [s["type"] for s in advice["suggestions"]] == ["materialized_pipe"]
+
+
+def test_internal_queries_are_not_recorded():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/v0/datasources/events":
+            return httpx.Response(200, json=DATASOURCE)
+        meta = [
+            {"name": "timestamp", "type": "DateTime"},
+            {"name": "amount", "type": "Float64"},
+        ]
+        data = [{"timestamp": "2024-01-01 00:00:00", "amount": 1.0, "__rows": 10}]
+        return httpx.Response(200, json={"meta": meta, "data": data, "rows": 1})
+
+    client = APIClient(api_url="http://tinybird", token="token")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    query = "SELECT timestamp, amount FROM events WHERE customer_id = 'a'"
+
+    async def main():
+        await client.run_select_query(query)
+        await client.profile_query(query)
+        await client.downsample_select_query(query, 10)
+        return await client.advise_datasource("events")
+
+    advice = asyncio.run(main())
+    # Only the query run on behalf of the user, and not the probe, profile,
+    # min/max or cardinality queries
+    assert list(client.query_log.stats) == [
+        "SELECT timestamp, amount FROM events WHERE customer_id = ?"
+    ]
+    assert advice["observed"]["sources"] == 1
@@ -0,0 +1,60 @@
+import re
+
+from mcp_tinybird.budget import OutputBudget
+
+
+def _pages(budget, response):
+    pages, offset = [], 0
+    while True:
+        text, metadata = budget.shape(response, offset)
+        pages.append(text)
+        fetch = " ".join(e["fetch"] for e in (metadata or {}).get("elided", []))
+        match = re.search(r"output_offset=(\d+)", fetch)
+        if match is None:
+            return pages
+        offset = int(match.group(1))
+
+
+def test_within_budget_is_untouched():
+    response = {"data": [{"a": 1}]}
+    assert OutputBudget(max_bytes=1000).shape(response) == (str(response), None)
+    assert OutputBudget().shape(response) == (str(response), None)
+
+
+def test_limit_is_the_lowest_of_bytes_and_tokens():
+    assert OutputBudget(max_bytes=1000, max_tokens=100).limit == 400
+    assert OutputBudget(max_bytes=100, max_tokens=100).limit == 100
+    assert OutputBudget().limit is None
+
+
+def test_for_call_cant_exceed_the_server_budget():
+    server = OutputBudget(max_bytes=1000)
+    assert server.for_call(max_bytes=10**6).limit == 1000
+    assert server.for_call(max_bytes=10).limit == 10
+
+
+def test_node_sql_is_dropped_first():
+    response = {"name": "p", "nodes": [{"name": "n", "sql": "SELECT " * 1000}]}
+    text, metadata = OutputBudget(max_bytes=2000).shape(response)
+    assert "SELECT" not in text
+    assert "'nodes': ['n']" in text
+    assert metadata["truncated"]
+    assert "SQL of 1 nodes" in metadata["elided"][0]["elided"]
+
+
+def test_rows_are_truncated():
+    response = {"meta": [], "data": [{"id": i, "value": "x" * 20} for i in range(1000)]}
+    text, metadata = OutputBudget(max_bytes=4000).shape(response)
+    assert len(text.encode()) <= 4000
+    assert text.startswith("{'meta': [], 'data': [{'id': 0,")
+    assert any("rows" in e["elided"] for e in metadata["elided"])
+    assert metadata["original_bytes"] == len(str(response).encode())
+
+
+def test_pages_cover_the_summarized_text():
+    response = {"nodes": [{"name": "n", "sql": "x" * 5000}], "text": "y" * 9000}
+    budget = OutputBudget(max_bytes=2000)
+    pages = _pages(budget, response)
+    assert len(pages) > 1
+    assert all(len(page.encode()) <= 2000 for page in pages)
+    assert "".join(pages) == str({"nodes": [], "text": "y" * 9000})
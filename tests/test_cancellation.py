@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+
+from mcp_tinybird.tb import APIClient
+
+
+def test_cancelled_query_reaches_query_killer():
+    started = asyncio.Event()
+    query_ids = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        query_ids.append(request.url.params["query_id"])
+        started.set()
+        await asyncio.sleep(60)
+        return httpx.Response(200, json={"data": []})
+
+    async def main():
+        client = APIClient(api_url="http://tinybird", token="token")
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        killed = []
+
+        async def query_killer(query_id: str):
+            killed.append(query_id)
+
+        client.query_killer = query_killer
+        task = asyncio.create_task(client.run_select_query("SELECT 1"))
+        await started.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.gather(*client._background_tasks)
+        await client.close()
+        return killed
+
+    assert asyncio.run(main()) == query_ids
@@ -0,0 +1,81 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+
+from mcp_tinybird.cassette import REDACTED, Cassette
+
+TOKEN = "p.secret-token"
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/v0/events":
+        return httpx.Response(202, json={"ok": True, "echo": request.content.decode()})
+    return httpx.Response(
+        200, json={"path": request.url.path, "token": TOKEN}, headers={"ETag": "v1"}
+    )
+
+
+async def _requests(transport: httpx.AsyncBaseTransport):
+    async with httpx.AsyncClient(transport=transport) as client:
+        first = await client.get(
+            "https://api.tinybird.co/v0/pipes",
+            params={"token": TOKEN, "query_id": "random"},
+        )
+        second = await client.post(
+            "https://api.tinybird.co/v0/events",
+            params={"token": TOKEN},
+            content=b'{"a": 1}',
+        )
+    return first, second
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "session.ndjson.gz")
+    recorder = Cassette(path, mode="record")
+    transport = recorder.transport(secrets=[TOKEN])
+    transport.transport = httpx.MockTransport(_handler)
+    recorded = asyncio.run(_requests(transport))
+    recorder.close()
+
+    with gzip.open(path, "rt") as f:
+        content = f.read()
+    assert TOKEN not in content
+    assert REDACTED in content
+    assert "query_id" not in content
+
+    player = Cassette(path, mode="replay", speed=0)
+    replayed = asyncio.run(_requests(player.transport(secrets=[TOKEN])))
+    for before, after in zip(recorded, replayed):
+        assert after.status_code == before.status_code
+        assert after.headers.get("etag") == before.headers.get("etag")
+    assert replayed[0].json() == {"path": "/v0/pipes", "token": REDACTED}
+    assert replayed[1].json() == {"ok": True, "echo": '{"a": 1}'}
+
+
+def test_replay_without_a_recording_fails(tmp_path):
+    path = str(tmp_path / "empty.ndjson.gz")
+    with gzip.open(path, "wt") as f:
+        f.write(json.dumps({"version": 1}) + "\n")
+    transport = Cassette(path, mode="replay", speed=0).transport()
+
+    async def request():
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get("https://api.tinybird.co/v0/pipes")
+
+    try:
+        asyncio.run(request())
+    except httpx.ConnectError as e:
+        assert "No recorded response" in str(e)
+    else:
+        raise AssertionError("replayed a request that wasn't recorded")
+
+
+def test_workers_record_to_their_own_file(tmp_path):
+    path = str(tmp_path / "session.ndjson.gz")
+    cassette = Cassette.from_config(path, "record", worker=2)
+    cassette.close()
+    assert cassette.path == str(tmp_path / "session.ndjson-2.gz")
+    assert Cassette.from_config(path, "replay", worker=2).path == cassette.path
+    assert Cassette.from_config(None) is None
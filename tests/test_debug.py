@@ -0,0 +1,41 @@
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from mcp_tinybird.debug import debug_routes
+
+
+class Workspaces:
+    def query_stats(self, limit: int = 10, order_by: str = "total_time"):
+        if order_by != "total_time":
+            raise ValueError(f"Invalid order_by: {order_by}")
+        return {"default": [{"limit": limit}]}
+
+
+def _client(token=None) -> TestClient:
+    return TestClient(Starlette(routes=debug_routes(Workspaces(), token)))
+
+
+def test_not_served_without_a_token():
+    assert debug_routes(Workspaces(), None) == []
+    assert _client().get("/debug/queries").status_code == 404
+
+
+def test_requires_the_bearer_token():
+    client = _client("secret")
+    assert client.get("/debug/queries").status_code == 401
+    response = client.get("/debug/loop", headers={"Authorization": "Bearer other"})
+    assert response.status_code == 401
+
+
+def test_invalid_parameters_are_bad_requests():
+    client = _client("secret")
+    headers = {"Authorization": "Bearer secret"}
+    response = client.get("/debug/queries?limit=3", headers=headers)
+    assert response.json() == {"default": [{"limit": 3}]}
+    assert client.get("/debug/loop", headers=headers).status_code == 200
+    for path in (
+        "/debug/queries?limit=abc",
+        "/debug/queries?order_by=name",
+        "/debug/loop?limit=abc",
+    ):
+        assert client.get(path, headers=headers).status_code == 400
@@ -0,0 +1,73 @@
+from mcp_tinybird.downsample import (
+    build_minmax_query,
+    lttb,
+    series_columns,
+    source_tables,
+)
+
+
+def _series(n):
+    return [
+        {"t": f"2024-01-01 00:{i // 60:02d}:{i % 60:02d}", "v": i % 7}
+        for i in range(n)
+    ]
+
+
+def test_lttb_keeps_first_and_last_rows():
+    rows = _series(1000)
+    sampled = lttb(rows, "t", "v", 50)
+    assert len(sampled) == 50
+    assert sampled[0] is rows[0]
+    assert sampled[-1] is rows[-1]
+
+
+def test_lttb_keeps_rows_in_order_and_whole():
+    rows = _series(500)
+    sampled = lttb(rows, "t", "v", 20)
+    positions = [rows.index(row) for row in sampled]
+    assert positions == sorted(positions)
+    assert all(set(row) == {"t", "v"} for row in sampled)
+
+
+def test_lttb_picks_the_spike():
+    rows = [{"t": i, "v": 0} for i in range(100)]
+    rows[42]["v"] = 1000
+    assert rows[42] in lttb(rows, "t", "v", 10)
+
+
+def test_lttb_without_enough_rows():
+    rows = _series(10)
+    assert lttb(rows, "t", "v", 100) == rows
+    assert lttb(rows, "t", "v", 2) == rows[:2]
+
+
+def test_lttb_uses_the_index_without_a_time_column():
+    rows = [{"v": i} for i in range(100)]
+    assert len(lttb(rows, None, "v", 10)) == 10
+
+
+def test_series_columns():
+    meta = [
+        {"name": "day", "type": "Date"},
+        {"name": "ts", "type": "DateTime"},
+        {"name": "country", "type": "String"},
+        {"name": "hits", "type": "UInt64"},
+    ]
+    assert series_columns(meta) == ("day", "hits")
+    assert series_columns(meta, ["missing", "ts"]) == ("ts", "hits")
+    assert series_columns([{"name": "c", "type": "String"}]) == (None, None)
+
+
+def test_source_tables():
+    sql = (
+        "SELECT * FROM events e JOIN `users` u ON e.id = u.id "
+        "WHERE x IN (SELECT x FROM events)"
+    )
+    assert source_tables(sql) == ["events", "users"]
+
+
+def test_build_minmax_query_runs_the_query_once():
+    sql = build_minmax_query("SELECT t, v FROM events", "t", "v", 100)
+    assert sql.count("FROM events") == 1
+    assert "__rows <= 100" in sql
+    assert sql.endswith("ORDER BY `t`")
@@ -0,0 +1,181 @@
+import asyncio
+import gzip
+import os
+import threading
+
+import httpx
+import pytest
+
+from mcp_tinybird import tb
+from mcp_tinybird.ingest import AppendProgress, Chunk, detect_format, iter_text_chunks
+from mcp_tinybird.tb import APIClient
+
+CSV = b'id,note\n1,"a\nb"\n2,plain\n3,"say ""hi""\n"\n4,last'
+
+
+def _chunks(path, format="csv", chunk_size=4, completed=None):
+    return list(iter_text_chunks(str(path), format, chunk_size, completed or {}))
+
+
+def test_detect_format():
+    assert detect_format("events.JSONL") == "ndjson"
+    assert detect_format("events.txt", "csv") == "csv"
+    with pytest.raises(ValueError, match="Can't tell the format"):
+        detect_format("events.txt")
+    with pytest.raises(ValueError, match="Unsupported format"):
+        detect_format("events.csv", "xlsx")
+
+
+def test_csv_chunks_end_at_records_and_repeat_the_header(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_bytes(CSV)
+    chunks = _chunks(path)
+    assert [chunk.data for chunk in chunks] == [
+        b'id,note\n1,"a\nb"\n',
+        b"id,note\n2,plain\n",
+        b'id,note\n3,"say ""hi""\n"\n',
+        b"id,note\n4,last",
+    ]
+    # Offsets cover the file after the header without gaps
+    assert chunks[0].start == len(b"id,note\n")
+    assert [c.start for c in chunks[1:]] == [c.end for c in chunks[:-1]]
+    assert chunks[-1].end == len(CSV)
+
+
+def test_large_chunks_hold_several_records(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_bytes(CSV)
+    chunks = _chunks(path, chunk_size=20)
+    assert b"".join(chunk.data[len(b"id,note\n") :] for chunk in chunks) == CSV[8:]
+    assert len(chunks) == 2
+
+
+def test_ndjson_chunks_have_no_header(tmp_path):
+    path = tmp_path / "events.ndjson"
+    path.write_bytes(b'{"id": 1}\n{"id": 2}\n{"id": 3}')
+    chunks = _chunks(path, "ndjson", chunk_size=12)
+    assert [chunk.data for chunk in chunks] == [
+        b'{"id": 1}\n{"id": 2}\n',
+        b'{"id": 3}',
+    ]
+
+
+def test_completed_chunks_are_skipped(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_bytes(CSV)
+    first, *rest = _chunks(path)
+    chunks = _chunks(path, completed={first.start: first.end})
+    assert chunks[0] == Chunk(first.start, first.end)
+    assert chunks[1:] == rest
+
+
+def test_progress_survives_until_the_file_changes(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_bytes(CSV)
+    progress_dir = str(tmp_path / "progress")
+
+    def load(datasource="events", chunk_size=4):
+        return AppendProgress.load(
+            str(path), datasource, "csv", chunk_size, progress_dir
+        )
+
+    progress = load()
+    assert progress.completed == {}
+    progress.complete(Chunk(8, 17))
+    progress.complete(Chunk(17, 25))
+    assert load().completed == {8: 17, 17: 25}
+    assert load(chunk_size=8).completed == {}
+    assert load(datasource="other").completed == {}
+
+    path.write_bytes(CSV + b"\n5,more")
+    assert load().completed == {}
+
+    progress.remove()
+    assert not os.path.exists(progress.path)
+    progress.remove()
+
+
+def _appended(request: httpx.Request) -> bytes:
+    boundary = request.headers["content-type"].split("boundary=")[1].encode()
+    part = request.content.split(b"--" + boundary)[1]
+    return gzip.decompress(part.split(b"\r\n\r\n", 1)[1][: -len(b"\r\n")])
+
+
+def _client(handler) -> APIClient:
+    client = APIClient(api_url="http://tinybird", token="token")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_failed_append_resumes_from_the_next_chunk(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_bytes(CSV)
+    progress_dir = str(tmp_path / "progress")
+    appended = []
+    failing = True
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        data = _appended(request)
+        if failing and data.startswith(b"id,note\n2"):
+            return httpx.Response(400, json={"error": "Invalid row"})
+        appended.append(data)
+        return httpx.Response(200, json={"quarantine_rows": 0})
+
+    def append():
+        client = _client(handler)
+        return asyncio.run(
+            client.append_file(
+                "events", str(path), chunk_size=4, parallel=1, progress_dir=progress_dir
+            )
+        )
+
+    with pytest.raises(ValueError, match="1 chunks .* were appended"):
+        append()
+    assert appended == [b'id,note\n1,"a\nb"\n']
+
+    failing = False
+    summary = append()
+    assert appended[1:] == [
+        b"id,note\n2,plain\n",
+        b'id,note\n3,"say ""hi""\n"\n',
+        b"id,note\n4,last",
+    ]
+    assert (summary["chunks"], summary["resumed_chunks"]) == (4, 1)
+    assert os.listdir(progress_dir) == []
+
+
+def test_cancelled_while_reading_a_chunk(tmp_path, monkeypatch):
+    path = tmp_path / "events.csv"
+    path.write_bytes(CSV)
+    reading, release = threading.Event(), threading.Event()
+    closed = []
+
+    def chunks(*args):
+        try:
+            yield Chunk(0, 1, b"id\n1\n")
+            reading.set()
+            release.wait(5)
+            yield Chunk(1, 2, b"id\n2\n")
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(tb, "iter_chunks", lambda *args: chunks())
+    client = _client(lambda request: httpx.Response(200, json={}))
+
+    async def run():
+        task = asyncio.create_task(
+            client.append_file(
+                "events", str(path), progress_dir=str(tmp_path / "progress")
+            )
+        )
+        await asyncio.to_thread(reading.wait, 5)
+        task.cancel()
+        await asyncio.sleep(0.1)
+        # Waiting for the read in the thread, which can't be interrupted
+        assert not task.done() and not closed
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert closed == [True]
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+from mcp_tinybird.insights import EMPTY_MEMO, InsightsStore, SessionInsights, normalize
+
+
+def add(store: InsightsStore, *insights: str) -> list:
+    async def run():
+        return [await store.add(insight) for insight in insights]
+
+    return asyncio.run(run())
+
+
+def test_normalize():
+    assert normalize("Revenue is driven by the EU!") == "revenue driven eu"
+
+
+def test_duplicates_are_rejected():
+    store = InsightsStore()
+    assert add(
+        store,
+        "Revenue is driven by EU",
+        "Revenue is driven by the EU.",
+        "  ",
+        "Revenue grew 10%",
+        "Revenue grew 12%",
+    ) == [True, False, False, True, True]
+    assert len(store) == 3
+
+
+def test_memo():
+    store = InsightsStore()
+    assert store.memo == EMPTY_MEMO
+    add(store, "First")
+    assert store.memo.endswith("- First")
+    add(store, "Second")
+    assert "- First\n- Second" in store.memo
+    assert "2 key insights" in store.memo
+
+
+def test_memo_is_bounded():
+    store = InsightsStore(max_insights=3)
+    add(store, *(f"Insight {i}\nwith details" for i in range(5)))
+    assert len(store) == 3
+    assert "Insight 0" not in store.memo
+    assert store.memo.startswith("📊")
+    assert "\n\n- Insight 2\nwith details\n- Insight 3" in store.memo
+    assert "5 key insights. The oldest 2 are not listed" in store.memo
+    # Dropped insights are no longer duplicates
+    assert add(store, "Insight 0\nwith details") == [True]
+
+
+def test_store_is_replayed_from_its_log(tmp_path):
+    store = InsightsStore.from_config(str(tmp_path), "session/1")
+    add(store, "Revenue is driven by EU", "Revenue grew 10%")
+    with open(store.path, "a") as f:
+        f.write('{"insight": "cut sh')
+
+    reopened = InsightsStore(store.path)
+    assert len(reopened) == 2
+    assert reopened.memo == store.memo
+    assert add(reopened, "revenue driven by the EU") == [False]
+    with open(store.path) as f:
+        assert json.loads(f.readline())["insight"] == "Revenue is driven by EU"
+
+
+def test_log_is_compacted_to_the_memo(tmp_path):
+    path = str(tmp_path / "session.ndjson")
+    store = InsightsStore(path, max_insights=3)
+    add(store, *(f"Insight {i}" for i in range(7)))
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    # Compacted at the 7th line, to the dropped count and the memo
+    assert lines[0] == {"dropped": 4}
+    assert [line["insight"] for line in lines[1:]] == [
+        "Insight 4",
+        "Insight 5",
+        "Insight 6",
+    ]
+
+    reopened = InsightsStore(path, max_insights=3)
+    assert reopened.memo == store.memo
+    assert "7 key insights. The oldest 4" in reopened.memo
+
+
+def test_long_log_is_compacted_when_opened(tmp_path):
+    path = tmp_path / "session.ndjson"
+    path.write_text(
+        "".join(json.dumps({"insight": f"Insight {i}"}) + "\n" for i in range(10))
+    )
+    store = InsightsStore(str(path), max_insights=3)
+    assert "10 key insights. The oldest 7" in store.memo
+    assert len(path.read_text().splitlines()) == 4
+
+
+def test_concurrent_adds_are_written_in_order(tmp_path):
+    store = InsightsStore(str(tmp_path / "session.ndjson"))
+
+    async def run():
+        return await asyncio.gather(
+            *(store.add(f"Insight {i}") for i in range(20)),
+            store.add("Insight 3"),
+        )
+
+    assert asyncio.run(run()) == [True] * 20 + [False]
+    with open(store.path) as f:
+        written = [json.loads(line)["insight"] for line in f]
+    assert written == [f"Insight {i}" for i in range(20)]
+
+
+def test_stores_per_session(tmp_path):
+    class Session:
+        pass
+
+    insights = SessionInsights(str(tmp_path), "resumed")
+    first, second = Session(), Session()
+    add(insights.get(first), "Only in the first session")
+    assert insights.get(first) is insights.get(first)
+    assert len(insights.get(second)) == 0
+    assert insights.get(first).path == str(tmp_path / "resumed.ndjson")
+    # Only the first session can be resumed, the others aren't written
+    assert insights.get(second).path is None
+    add(insights.get(second), "Only in the second session")
+    assert [p.name for p in tmp_path.iterdir()] == ["resumed.ndjson"]
+
+
+def test_unnamed_sessions_are_not_written(tmp_path):
+    class Session:
+        pass
+
+    insights = SessionInsights(str(tmp_path), None)
+    add(insights.get(Session()), "Kept in memory")
+    assert insights.get(Session()).path is None
+    assert list(tmp_path.iterdir()) == []
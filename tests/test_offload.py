@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mcp_tinybird.offload import LoopLagMonitor, Offloader, approx_size
+
+
+def _thread_name() -> str:
+    return threading.current_thread().name
+
+
+def test_approx_size():
+    assert approx_size("abcd") == 4
+    assert approx_size({"key": "abcd"}) == 7
+    assert approx_size(["ab"] * 1000) == 2000
+    assert approx_size([1, 2]) == 16
+
+
+@pytest.mark.parametrize(
+    "kind, size, offloaded",
+    [
+        ("thread", 99, False),
+        ("thread", 100, True),
+        (None, 10**9, False),
+    ],
+)
+def test_runs_in_the_pool_over_the_threshold(kind, size, offloaded):
+    offloader = Offloader(kind=kind, threshold=100)
+
+    async def main():
+        return await offloader.run(_thread_name, size=size)
+
+    try:
+        name = asyncio.run(main())
+    finally:
+        offloader.close()
+    assert name.startswith("offload") == offloaded
+
+
+def test_process_pool():
+    offloader = Offloader(kind="process", max_workers=1, threshold=0)
+
+    async def main():
+        return await offloader.run(sorted, [3, 1, 2], size=1)
+
+    try:
+        assert asyncio.run(main()) == [1, 2, 3]
+    finally:
+        offloader.close()
+
+
+def test_from_config():
+    assert Offloader.from_config().kind == "thread"
+    assert Offloader.from_config("none").kind is None
+    offloader = Offloader.from_config("process", "2", "10")
+    assert (offloader.kind, offloader.max_workers, offloader.threshold) == (
+        "process",
+        2,
+        10,
+    )
+    with pytest.raises(ValueError):
+        Offloader("fiber")
+
+
+def test_monitor_reports_the_blocking_tool():
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+
+    async def blocking_tool():
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        return "done"
+
+    async def main():
+        monitor.start()
+        try:
+            with monitor.tool(blocking_tool(), "run-select-query") as coro:
+                assert await coro == "done"
+            # Let the watchdog see the loop beat again
+            await asyncio.sleep(0.1)
+        finally:
+            monitor.stop()
+
+    asyncio.run(main())
+    assert len(monitor.stalls) == 1
+    stall = monitor.stalls[0]
+    assert stall["tool"] == "run-select-query"
+    assert "in blocking_tool" in stall["location"]
+    assert stall["duration"] > 0.2
+    report = monitor.report()
+    assert report["by_tool"]["run-select-query"]["stalls"] == 1
+    assert monitor.report(0)["stalls"] == []
+
+
+def test_monitor_ignores_short_pauses():
+    monitor = LoopLagMonitor(interval=0.01, threshold=0.2)
+
+    async def main():
+        monitor.start()
+        try:
+            time.sleep(0.05)
+            await asyncio.sleep(0.1)
+        finally:
+            monitor.stop()
+
+    asyncio.run(main())
+    assert list(monitor.stalls) == []
@@ -0,0 +1,55 @@
+import pytest
+
+from mcp_tinybird.pipe_params import _coerce
+
+
+@pytest.mark.parametrize(
+    "type_name, value, expected",
+    [
+        ("Int32", "42", 42),
+        ("UInt8", 7, 7),
+        ("Int64", 3.0, 3),
+        ("Float64", "1.5", 1.5),
+        ("Boolean", "true", True),
+        ("Boolean", 0, False),
+        ("Date", "2024-03-01T10:00:00", "2024-03-01"),
+        ("DateTime", "2024-03-01T10:00:00", "2024-03-01 10:00:00"),
+        ("DateTime", "2024-03-01T10:00:00Z", "2024-03-01 10:00:00"),
+        ("DateTime", "2024-03-01T10:00:00+02:00", "2024-03-01 08:00:00"),
+        ("DateTime64", "2024-03-01T10:00:00.5-01:00", "2024-03-01 11:00:00.500000"),
+        ("DateTime64", "2024-03-01 10:00:00.12Z", "2024-03-01 10:00:00.120000"),
+        ("DateTime64", "2024-03-01T10:00:00.123456789", "2024-03-01 10:00:00.123456"),
+        ("DateTime", "2024-03-01T10:00:00+0130", "2024-03-01 08:30:00"),
+        ("DateTime", "2024-03-01T10:00+01", "2024-03-01 09:00:00"),
+        ("DateTime", "2024-03-01", "2024-03-01 00:00:00"),
+        ("String", "anything", "anything"),
+    ],
+)
+def test_coerce(type_name, value, expected):
+    assert _coerce(type_name, value) == expected
+
+
+def test_coerce_arrays():
+    assert _coerce("Array", ["1", "2"], "Int32") == "1,2"
+    assert _coerce("Array", "a,b") == "a,b"
+
+
+@pytest.mark.parametrize(
+    "type_name, value",
+    [
+        ("Int32", "abc"),
+        ("Int32", 1.5),
+        ("Int32", True),
+        ("UInt32", -1),
+        ("Boolean", "maybe"),
+        ("Date", "yesterday"),
+        ("DateTime", "not a date"),
+        ("DateTime", "2024-03-01T10:00:00 UTC"),
+        ("DateTime64", "2024-13-01T10:00:00.5"),
+        ("Array", ["x"]),
+    ],
+)
+def test_coerce_rejects(type_name, value):
+    item_type = "Int32" if type_name == "Array" else None
+    with pytest.raises(ValueError):
+        _coerce(type_name, value, item_type)
@@ -0,0 +1,105 @@
+import re
+
+import pytest
+
+from mcp_tinybird.profile import (
+    base_type,
+    build_profile_query,
+    column_kind,
+    quote_identifier,
+    summarize_profile,
+)
+
+COLUMNS = [
+    {"name": "amount", "type": "Nullable(Float64)"},
+    {"name": "at", "type": "DateTime"},
+    {"name": "country", "type": "LowCardinality(Nullable(String))"},
+    {"name": "tags", "type": "Array(String)"},
+]
+
+
+@pytest.mark.parametrize(
+    "column_type, kind",
+    [
+        ("UInt64", "numeric"),
+        ("Nullable(Decimal(10, 2))", "numeric"),
+        ("DateTime64(3)", "temporal"),
+        ("Date", "temporal"),
+        ("LowCardinality(Nullable(String))", "categorical"),
+        ("Map(String, UInt8)", "complex"),
+        ("Nullable(Array(String))", "complex"),
+    ],
+)
+def test_column_kind(column_type, kind):
+    assert column_kind(column_type) == kind
+
+
+def test_base_type():
+    assert base_type("LowCardinality(Nullable(String))") == "String"
+    assert base_type("Array(Nullable(String))") == "Array(Nullable(String))"
+
+
+def test_quote_identifier():
+    assert quote_identifier("a`b\\c") == "`a\\`b\\\\c`"
+
+
+def test_build_profile_query():
+    sql = build_profile_query("SELECT * FROM sales", COLUMNS, top_k=3)
+    assert sql.startswith("SELECT count() AS __rows, ")
+    assert sql.endswith(" FROM (SELECT * FROM sales)")
+    assert re.findall(r" AS (\w+)", sql) == [
+        "__rows",
+        *("c0_nulls", "c0_uniq", "c0_min", "c0_max", "c0_avg", "c0_quantiles"),
+        *("c1_nulls", "c1_uniq", "c1_min", "c1_max"),
+        *("c2_nulls", "c2_uniq", "c2_top"),
+        *("c3_nulls", "c3_uniq"),
+    ]
+    assert "quantiles(0.5, 0.9, 0.99)(`amount`) AS c0_quantiles" in sql
+    assert "topK(3)(`country`) AS c2_top" in sql
+    assert "countIf(isNull(`tags`)) AS c3_nulls" in sql
+
+
+def test_summarize_profile():
+    row = {
+        "__rows": "200",
+        "c0_nulls": 50,
+        "c0_uniq": 120,
+        "c0_min": 0.5,
+        "c0_max": 99.5,
+        "c0_avg": 40.25,
+        "c0_quantiles": [30, 80, 98],
+        "c1_nulls": 0,
+        "c1_uniq": 200,
+        "c1_min": "2024-01-01 00:00:00",
+        "c1_max": "2024-01-02 00:00:00",
+        "c2_nulls": "0",
+        "c2_uniq": 3,
+        "c2_top": ["ES", "US", "FR"],
+        "c3_nulls": 0,
+        "c3_uniq": 7,
+    }
+    summary = summarize_profile(COLUMNS, row)
+    assert summary["rows"] == 200
+    assert summary["columns"]["amount"] == {
+        "type": "Nullable(Float64)",
+        "null_ratio": 0.25,
+        "distinct_estimate": 120,
+        "min": 0.5,
+        "max": 99.5,
+        "avg": 40.25,
+        "quantiles": {"p50": 30, "p90": 80, "p99": 98},
+    }
+    assert summary["columns"]["at"]["min"] == "2024-01-01 00:00:00"
+    assert summary["columns"]["country"]["top_k"] == ["ES", "US", "FR"]
+    assert summary["columns"]["tags"] == {
+        "type": "Array(String)",
+        "null_ratio": 0.0,
+        "distinct_estimate": 7,
+    }
+
+
+def test_summarize_empty_profile():
+    summary = summarize_profile(COLUMNS[:1], {"__rows": 0, "c0_quantiles": None})
+    assert summary["rows"] == 0
+    assert summary["columns"]["amount"]["null_ratio"] == 0.0
+    assert summary["columns"]["amount"]["quantiles"] == {}
@@ -0,0 +1,55 @@
+import pytest
+
+from mcp_tinybird.query_log import QueryLog, fingerprint
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("SELECT * FROM t WHERE id = 42", "SELECT * FROM t WHERE id = ?"),
+        ("SELECT * FROM t WHERE x > 1.5e3", "SELECT * FROM t WHERE x > ?"),
+        ("SELECT * FROM t WHERE s = 'it''s'", "SELECT * FROM t WHERE s = ?"),
+        ("SELECT * FROM t WHERE s = 'a\\'b'", "SELECT * FROM t WHERE s = ?"),
+        ("SELECT * FROM t WHERE id IN (1, 2,3)", "SELECT * FROM t WHERE id IN (?+)"),
+        ("SELECT * FROM t WHERE c IN ('a','b')", "SELECT * FROM t WHERE c IN (?+)"),
+        ("SELECT a\n  FROM   t\t-- comment\n", "SELECT a FROM t"),
+        ("SELECT /* hint */ a FROM t", "SELECT a FROM t"),
+        ("SELECT count(c1) FROM t2", "SELECT count(c1) FROM t2"),
+    ],
+)
+def test_fingerprint(query, expected):
+    assert fingerprint(query) == expected
+
+
+def test_executions_differing_in_literals_are_aggregated():
+    log = QueryLog()
+    response = {"rows": 2, "statistics": {"rows_read": 100, "bytes_read": 800}}
+    log.record("SELECT * FROM t WHERE id IN (1, 2)", 0.5, response, 10)
+    log.record("SELECT * FROM t WHERE id IN (3,4,5)", 1.5, response, 30)
+    log.record("SELECT 1", 0.1, {}, 5)
+
+    top = log.top(order_by="total_time")
+    assert [stats["calls"] for stats in top] == [2, 1]
+    assert top[0] == {
+        "fingerprint": "SELECT * FROM t WHERE id IN (?+)",
+        "example": "SELECT * FROM t WHERE id IN (1, 2)",
+        "calls": 2,
+        "total_time": 2.0,
+        "max_time": 1.5,
+        "avg_time": 1.0,
+        "rows_read": 200,
+        "bytes_read": 1600,
+        "result_rows": 4,
+        "result_bytes": 40,
+    }
+    assert len(log.top(limit=1)) == 1
+    with pytest.raises(ValueError):
+        log.top(order_by="name")
+
+
+def test_least_recently_run_fingerprint_is_evicted():
+    log = QueryLog(max_fingerprints=2)
+    for query in ("SELECT a FROM t", "SELECT b FROM t", "SELECT a FROM t"):
+        log.record(query, 0.1, {}, 0)
+    log.record("SELECT c FROM t", 0.1, {}, 0)
+    assert list(log.stats) == ["SELECT a FROM t", "SELECT c FROM t"]
@@ -0,0 +1,121 @@
+import asyncio
+import signal
+
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from mcp_tinybird.lifecycle import lifecycle
+from mcp_tinybird.run_sse import DrainingServer, health_routes, parse_options
+
+
+@pytest.fixture(autouse=True)
+def fresh_lifecycle(monkeypatch):
+    monkeypatch.setattr(lifecycle, "ready", False)
+    monkeypatch.setattr(lifecycle, "draining", False)
+    monkeypatch.setattr(lifecycle, "in_flight", 0)
+
+
+def test_options_default_to_the_environment(monkeypatch):
+    for name in ("HOST", "PORT", "WORKERS", "LOG_LEVEL", "DRAIN_TIMEOUT"):
+        monkeypatch.delenv(f"MCP_{name}", raising=False)
+    options = parse_options([])
+    assert (options.host, options.port, options.workers) == ("0.0.0.0", 3001, 1)
+    assert (options.log_level, options.drain_timeout) == ("debug", 30)
+
+    monkeypatch.setenv("MCP_PORT", "8080")
+    monkeypatch.setenv("MCP_WORKERS", "4")
+    monkeypatch.setenv("MCP_DRAIN_TIMEOUT", "2.5")
+    options = parse_options([])
+    assert (options.port, options.workers, options.drain_timeout) == (8080, 4, 2.5)
+
+
+def test_flags_override_the_environment(monkeypatch):
+    monkeypatch.setenv("MCP_PORT", "8080")
+    options = parse_options(
+        ["--host", "127.0.0.1", "--port", "9000", "--workers", "2"]
+        + ["--log-level", "info", "--shutdown-timeout", "1"]
+    )
+    assert (options.host, options.port, options.workers) == ("127.0.0.1", 9000, 2)
+    assert (options.log_level, options.shutdown_timeout) == ("info", 1)
+
+
+def test_workers_only_where_supported(capsys):
+    options = parse_options([], prog="mcp-tinybird streamable-http", workers=False)
+    assert not hasattr(options, "workers")
+    with pytest.raises(SystemExit):
+        parse_options(["--workers", "2"], workers=False)
+    assert "unrecognized arguments: --workers" in capsys.readouterr().err
+
+
+def test_ready_only_between_startup_and_drain():
+    client = TestClient(Starlette(routes=health_routes()))
+    assert client.get("/health").json() == {"status": "ok"}
+    response = client.get("/ready")
+    assert (response.status_code, response.json()["status"]) == (503, "starting")
+
+    lifecycle.ready = True
+    lifecycle.in_flight = 2
+    response = client.get("/ready")
+    assert response.json() == {"status": "ready", "in_flight": 2}
+
+    lifecycle.ready = False
+    lifecycle.draining = True
+    response = client.get("/ready")
+    assert (response.status_code, response.json()["status"]) == (503, "draining")
+
+
+def _server(drain_timeout=5):
+    return DrainingServer(uvicorn.Config(Starlette()), drain_timeout=drain_timeout)
+
+
+def test_exits_right_away_when_not_serving():
+    server = _server()
+    server.handle_exit(signal.SIGTERM, None)
+    assert server.should_exit and not lifecycle.draining
+
+
+def test_drains_tool_calls_before_exiting():
+    async def run():
+        server = _server()
+        server._loop = asyncio.get_running_loop()
+        lifecycle.ready = True
+        lifecycle.in_flight = 1
+        server.handle_exit(signal.SIGTERM, None)
+        assert lifecycle.draining
+        await asyncio.sleep(0.3)
+        assert not lifecycle.ready and not server.should_exit
+        lifecycle.in_flight = 0
+        await asyncio.sleep(0.3)
+        assert server.should_exit
+
+    asyncio.run(run())
+
+
+def test_second_signal_skips_the_drain():
+    async def run():
+        server = _server()
+        server._loop = asyncio.get_running_loop()
+        lifecycle.in_flight = 1
+        server.handle_exit(signal.SIGTERM, None)
+        await asyncio.sleep(0)
+        assert not server.should_exit
+        server.handle_exit(signal.SIGTERM, None)
+        assert server.should_exit
+        lifecycle.in_flight = 0
+        await asyncio.sleep(0.3)
+
+    asyncio.run(run())
+
+
+def test_drain_timeout_bounds_the_wait():
+    async def run():
+        server = _server(drain_timeout=0.2)
+        server._loop = asyncio.get_running_loop()
+        lifecycle.in_flight = 1
+        server.handle_exit(signal.SIGTERM, None)
+        await asyncio.sleep(0.5)
+        assert server.should_exit and lifecycle.in_flight == 1
+
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+import asyncio
+
+import mcp.types as types
+import pytest
+from mcp.server import request_ctx
+from mcp.shared.context import RequestContext
+
+
+@pytest.fixture
+def server(mcp_server):
+    server, _, registry = mcp_server()
+    return server, registry.get()
+
+
+class Session:
+    """Records the notifications a session is sent."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_resource_updated(self, uri):
+        self.sent.append(("updated", str(uri)))
+
+    async def send_resource_list_changed(self):
+        self.sent.append(("list_changed", None))
+
+
+async def call(server, request, session=None):
+    session = session or Session()
+    token = request_ctx.set(RequestContext(request_id=1, meta=None, session=session))
+    try:
+        return (await server.request_handlers[type(request)](request)).root
+    finally:
+        request_ctx.reset(token)
+
+
+def test_list_resources_after_refresh_metadata(server):
+    server, client = server
+
+    async def main():
+        await client.refresh_metadata()
+        return await call(server, types.ListResourcesRequest(method="resources/list"))
+
+    uris = [str(resource.uri) for resource in asyncio.run(main()).resources]
+    assert "tinybird://datasources/events" in uris
+    assert "tinybird://pipes/top" in uris
+
+
+def test_updates_go_to_subscribers_only(server):
+    server, client = server
+    subscribed, other = Session(), Session()
+
+    async def main():
+        uri = "tinybird://pipes/top"
+        request = types.SubscribeRequest(
+            method="resources/subscribe",
+            params=types.SubscribeRequestParams(uri=uri),
+        )
+        await call(server, request, subscribed)
+        for session in (subscribed, other):
+            await call(
+                server, types.ListResourcesRequest(method="resources/list"), session
+            )
+        await client.on_metadata_changed({"pipes": ["top"]})
+
+    asyncio.run(main())
+    assert subscribed.sent == [
+        ("list_changed", None),
+        ("updated", "tinybird://pipes/top"),
+    ]
+    assert other.sent == [("list_changed", None)]
+
+
+def test_fan_out_merges_the_workspace_responses(mcp_server):
+    server, _, _ = mcp_server({"eu": {"api_url": "http://eu", "token": "eu"}})
+    request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(
+            name="list-pipes", arguments={"workspace": "*"}
+        ),
+    )
+    result = asyncio.run(call(server, request))
+    assert len(result.content) == 1
+    text = result.content[0].text
+    assert text.startswith("{'default': [Pipe(type='endpoint', id='p1', name='top'")
+    assert text.endswith("'eu': {'error': 'Workspace unavailable'}}")
+
+
+def test_tool_errors_are_returned_as_messages(server):
+    server, _ = server
+    request = types.CallToolRequest(
+        method="tools/call",
+        params=types.CallToolRequestParams(
+            name="run-select-query",
+            arguments={
+                "select_query": "SELECT t, c FROM events",
+                "incremental": True,
+                "time_column": "day",
+            },
+        ),
+    )
+    result = asyncio.run(call(server, request))
+    assert result.isError
+    assert result.content[0].text == (
+        "The time column day is not in the result, its columns are ['t', 'c']"
+    )
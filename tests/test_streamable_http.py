@@ -0,0 +1,146 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+
+from mcp_tinybird.streamable_http import SESSION_HEADER, StreamableHTTPHandler
+
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {},
+        "clientInfo": {"name": "test", "version": "1.0"},
+    },
+}
+
+
+def _request(id: int, method: str, params: dict | None = None) -> dict:
+    request = {"jsonrpc": "2.0", "id": id, "method": method}
+    if params is not None:
+        request["params"] = params
+    return request
+
+
+def _client(handler: StreamableHTTPHandler) -> httpx.AsyncClient:
+    app = Starlette(routes=handler.get_routes())
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://mcp"
+    )
+
+
+async def _initialize(client: httpx.AsyncClient) -> dict:
+    response = await client.post("/mcp", json=INITIALIZE)
+    assert response.status_code == 200
+    assert response.json()["result"]["serverInfo"]["name"] == "mcp-tinybird"
+    headers = {SESSION_HEADER: response.headers[SESSION_HEADER]}
+    response = await client.post(
+        "/mcp",
+        headers=headers,
+        json={"jsonrpc": "2.0", "method": "notifications/initialized"},
+    )
+    assert response.status_code == 202
+    return headers
+
+
+def test_post_and_delete(mcp_server):
+    server, init_options, _ = mcp_server()
+    handler = StreamableHTTPHandler(server, init_options)
+
+    async def main():
+        async with _client(handler) as client:
+            headers = await _initialize(client)
+            response = await client.post(
+                "/mcp",
+                headers=headers,
+                json=[
+                    _request(2, "tools/call", {"name": "list-pipes"}),
+                    _request(3, "ping"),
+                ],
+            )
+            assert response.status_code == 200
+            call, ping = response.json()
+            assert "name='top'" in call["result"]["content"][0]["text"]
+            assert ping == {"jsonrpc": "2.0", "id": 3, "result": {}}
+
+            response = await client.post("/mcp", json=_request(4, "ping"))
+            assert response.status_code == 400
+
+            assert (await client.delete("/mcp", headers=headers)).status_code == 204
+            response = await client.post(
+                "/mcp", headers=headers, json=_request(5, "ping")
+            )
+            assert response.status_code == 404
+            await handler.close()
+
+    asyncio.run(main())
+
+
+def test_get_stream_receives_notifications(mcp_server):
+    server, init_options, _ = mcp_server(TB_INSIGHTS_NOTIFY_DELAY="0")
+    handler = StreamableHTTPHandler(server, init_options)
+
+    async def main():
+        async with _client(handler) as client:
+            headers = await _initialize(client)
+            session = handler.sessions[headers[SESSION_HEADER]]
+            await client.post(
+                "/mcp",
+                headers=headers,
+                json=_request(2, "resources/subscribe", {"uri": "tinybird://insights"}),
+            )
+            # The transport returns the stream once it ends, when the session
+            # is deleted
+            stream = asyncio.create_task(client.get("/mcp", headers=headers))
+            while not session.streaming:
+                await asyncio.sleep(0.01)
+            await client.post(
+                "/mcp",
+                headers=headers,
+                json=_request(
+                    3,
+                    "tools/call",
+                    {"name": "append-insight", "arguments": {"insight": "EU grew"}},
+                ),
+            )
+            while not session.events:
+                await asyncio.sleep(0.01)
+            await client.delete("/mcp", headers=headers)
+            response = await asyncio.wait_for(stream, timeout=5)
+            await handler.close()
+            return response
+
+    response = asyncio.run(main())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("id: 1\nevent: message\ndata: ")
+    assert '"method":"notifications/resources/updated"' in response.text
+    assert '"uri":"tinybird://insights"' in response.text
+
+
+class IdleServer:
+    """A server that never reads its messages."""
+
+    async def run(self, read_stream, write_stream, init_options):
+        await asyncio.Event().wait()
+
+
+def test_rejected_batch_leaves_nothing_pending():
+    handler = StreamableHTTPHandler(IdleServer(), None, max_queue_size=1)
+
+    async def main():
+        async with _client(handler) as client:
+            session = handler._create_session()
+            response = await client.post(
+                "/mcp",
+                headers={SESSION_HEADER: session.session_id},
+                json=[_request(1, "ping"), _request(2, "ping"), _request(3, "ping")],
+            )
+            pending = dict(session.pending)
+            await handler.close()
+            return response, pending
+
+    response, pending = asyncio.run(main())
+    assert response.status_code == 429
+    assert pending == {}
@@ -0,0 +1,215 @@
+import asyncio
+
+import httpx
+import pytest
+
+from mcp_tinybird.tb import APIClient, DataSourceSummary
+
+META = [{"name": "t", "type": "DateTime"}, {"name": "c", "type": "UInt64"}]
+QUERY = "SELECT t, c FROM events GROUP BY t ORDER BY t"
+
+
+def _client(handler) -> APIClient:
+    client = APIClient(api_url="http://tinybird", token="token")
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def _datasources(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/v0/datasources":
+        datasources = [
+            {"id": "1", "name": "b", "stats": None},
+            {"id": "2", "name": "a", "stats": {"row_count": 5, "bytes": 10}},
+            {"id": "3", "name": "c"},
+        ]
+        return httpx.Response(200, json={"datasources": datasources})
+    columns = [{"name": "x", "type": "String", "nullable": False}]
+    return httpx.Response(200, json={"columns": columns})
+
+
+def test_list_data_sources_page():
+    client = _client(_datasources)
+    first = asyncio.run(client.list_data_sources_page(limit=2, expand=["a", "a"]))
+    assert first["datasources"] == [
+        DataSourceSummary(id="2", name="a", row_count=5, columns={"x": "String"}),
+        DataSourceSummary(id="1", name="b", row_count=None),
+    ]
+    assert (first["total"], first["next_offset"]) == (3, 2)
+    assert "expand_not_found" not in first
+
+    last = asyncio.run(client.list_data_sources_page(offset=2, expand=["a"]))
+    assert last["datasources"] == [DataSourceSummary(id="3", name="c")]
+    assert "next_offset" not in last
+    assert last["expand_not_found"] == ["a"]
+
+
+@pytest.mark.parametrize("offset, limit", [(-1, 10), (0, 0)])
+def test_list_data_sources_page_bounds(offset, limit):
+    client = _client(_datasources)
+    with pytest.raises(ValueError):
+        asyncio.run(client.list_data_sources_page(offset=offset, limit=limit))
+
+
+class Events:
+    """Hourly counts, where the count of the last hour grows between queries."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        query = request.url.params["q"]
+        self.queries.append(query)
+        rows = [{"t": f"2024-01-01 0{h}:00:00", "c": h} for h in range(10)]
+        if "CAST" in query:
+            rows = [{**rows[-1], "c": 90}]
+        return httpx.Response(
+            200, json={"meta": META, "data": rows, "rows": len(rows)}
+        )
+
+
+def test_incremental_query_fetches_the_tail():
+    events = Events()
+    client = _client(events)
+
+    async def main():
+        return [await client.run_incremental_query(QUERY) for _ in range(2)]
+
+    first, second = asyncio.run(main())
+    assert "incremental" not in first
+    assert second["incremental"] == {
+        "since": "2024-01-01 09:00:00",
+        "rows_fetched": 1,
+    }
+    assert "CAST('2024-01-01 09:00:00' AS DateTime)" in events.queries[1]
+    # The last cached row is replaced by the refetched one
+    assert [row["c"] for row in second["data"]] == list(range(9)) + [90]
+    assert second["rows"] == 10
+
+
+def test_incremental_query_is_cached_per_time_column():
+    events = Events()
+    client = _client(events)
+
+    async def main():
+        await client.run_incremental_query(QUERY)
+        return await client.run_incremental_query(QUERY, time_column="t")
+
+    assert "incremental" not in asyncio.run(main())
+    assert "CAST" not in events.queries[1]
+
+
+def test_incremental_query_needs_the_time_column_in_the_result():
+    client = _client(Events())
+    with pytest.raises(ValueError, match="The time column day is not in the result"):
+        asyncio.run(client.run_incremental_query(QUERY, time_column="day"))
+
+
+def test_incremental_query_with_limit_runs_in_full():
+    events = Events()
+    client = _client(events)
+
+    async def main():
+        return [
+            await client.run_incremental_query(f"{QUERY} LIMIT 5") for _ in range(2)
+        ]
+
+    _, second = asyncio.run(main())
+    assert "LIMIT" in second["incremental"]["skipped"]
+    assert not any("CAST" in query for query in events.queries)
+
+
+def test_incremental_query_downsamples_after_merging():
+    client = _client(Events())
+
+    async def main():
+        return [
+            await client.run_incremental_query(QUERY, downsample=4) for _ in range(2)
+        ]
+
+    first, second = asyncio.run(main())
+    assert first["rows"] == second["rows"] == 4
+    assert second["incremental"]["rows_fetched"] == 1
+    assert second["data"][-1] == {"t": "2024-01-01 09:00:00", "c": 90}
+
+
+def _untimed(rows: int):
+    meta = [{"name": "id", "type": "String"}, {"name": "c", "type": "UInt64"}]
+    queries = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/v0/sql":
+            return httpx.Response(404, json={"error": "not found"})
+        query = request.url.params["q"]
+        queries.append(query)
+        limit = int(query.rsplit("LIMIT ", 1)[1].split()[0])
+        data = [{"id": str(i), "c": i % 7} for i in range(min(rows, limit))]
+        return httpx.Response(200, json={"meta": meta, "data": data})
+
+    return handler, queries
+
+
+def test_downsample_without_a_time_column_is_capped(monkeypatch):
+    monkeypatch.setattr("mcp_tinybird.tb.MAX_LOCAL_DOWNSAMPLE_ROWS", 50)
+    handler, queries = _untimed(40)
+    client = _client(handler)
+    response = asyncio.run(client.downsample_select_query("SELECT * FROM t", 10))
+    assert response["rows"] == 10
+    assert queries[-1] == "SELECT * FROM (SELECT * FROM t) LIMIT 51 FORMAT JSON"
+
+    handler, _ = _untimed(60)
+    client = _client(handler)
+    with pytest.raises(ValueError, match="more than 50 rows"):
+        asyncio.run(client.downsample_select_query("SELECT * FROM t", 10))
+
+
+class Workspace:
+    """The Data Sources and Pipes listings of a Workspace, which can change."""
+
+    def __init__(self):
+        self.datasources = {"d1": {"name": "events", "updated_at": "1"}}
+        self.pipes = {
+            "p1": {"name": "top", "updated_at": "1"},
+            "p2": {"name": "daily", "updated_at": "1"},
+        }
+        self.paths = []
+
+    def _pipe(self, id: str):
+        return {"id": id, "type": "endpoint", **self.pipes[id]}
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.paths.append(path)
+        if path == "/v0/datasources":
+            datasources = [
+                {"id": id, "columns": [], **ds} for id, ds in self.datasources.items()
+            ]
+            return httpx.Response(200, json={"datasources": datasources})
+        if path == "/v0/pipes":
+            return httpx.Response(
+                200, json={"pipes": [self._pipe(id) for id in self.pipes]}
+            )
+        if path.startswith("/v0/pipes/"):
+            return httpx.Response(200, json=self._pipe(path.rsplit("/", 1)[1]))
+        return httpx.Response(404, json={"error": "not found"})
+
+
+def test_refresh_metadata_refetches_changed_pipes_only():
+    workspace = Workspace()
+    client = _client(workspace)
+    assert asyncio.run(client.refresh_metadata()) == {}
+    assert asyncio.run(client.refresh_metadata()) == {}
+
+    workspace.pipes["p2"] = {"name": "daily_v2", "updated_at": "2"}
+    del workspace.pipes["p1"]
+    workspace.pipes["p3"] = {"name": "new", "updated_at": "1"}
+    workspace.paths.clear()
+    changed = asyncio.run(client.refresh_metadata())
+    assert changed == {"pipes": ["daily_v2", "new"]}
+    assert sorted(workspace.paths) == [
+        "/v0/datasources",
+        "/v0/pipes",
+        "/v0/pipes/p2",
+        "/v0/pipes/p3",
+    ]
+    pipes = asyncio.run(client.list_pipes())
+    assert sorted(pipe.name for pipe in pipes) == ["daily_v2", "new"]
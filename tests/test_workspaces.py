@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from mcp_tinybird.offload import Offloader
+from mcp_tinybird.workspaces import WorkspaceRegistry
+
+
+def _registry(**kwargs) -> WorkspaceRegistry:
+    return WorkspaceRegistry.from_config(
+        "http://tinybird",
+        "token",
+        json.dumps({"eu": {"api_url": "http://eu", "token": "eu-token"}}),
+        **kwargs,
+    )
+
+
+def test_from_config():
+    registry = _registry()
+    assert registry.names == ["default", "eu"]
+    assert registry.get() is registry.get("default")
+    assert registry.get("eu").token == "eu-token"
+    with pytest.raises(ValueError, match="Unknown workspace: us"):
+        registry.get("us")
+
+
+def test_fan_out_returns_failures_in_place():
+    registry = _registry()
+    for name, client in registry.clients.items():
+
+        def handler(request, name=name):
+            if name == "eu":
+                return httpx.Response(500, json={"error": "boom"})
+            return httpx.Response(200, json={"data": [{"workspace": name}]})
+
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    results = asyncio.run(
+        registry.fan_out(lambda name: registry.get(name).run_select_query("SELECT 1"))
+    )
+    assert results["default"]["data"] == [{"workspace": "default"}]
+    assert isinstance(results["eu"], Exception)
+
+
+def test_close_closes_shared_resources_once():
+    closed = []
+
+    class CountingOffloader(Offloader):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    offloader = CountingOffloader()
+    registry = _registry(offloader=offloader)
+    assert registry.get().offloader is registry.get("eu").offloader
+    asyncio.run(registry.close())
+    assert closed == [offloader]